@@ -0,0 +1,424 @@
+"""
+Image analysis with Claude on AWS Bedrock.
+
+This module has no Streamlit dependency and no import-time side effects, so the
+worker process, CLI tools and tests can import it cheaply. The model client is
+created on first use; boto3 is only imported at that point.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import List, Optional
+from models import SpanishVocabulary, AnalysisResult
+from response_parser import salvage_vocabulary, salvage_lemmas, merge_vocabulary_items
+from word_knowledge import word_knowledge
+from db import SessionLocal
+from singleflight import SingleFlight, LeaseSingleFlight
+from upload_pipeline import Base64Image, build_request_body
+from profiling import profile
+from usage import check_budget, record_usage
+
+_model_client = None
+_model_client_lock = threading.Lock()
+_analysis_flight = None
+_analysis_flight_lock = threading.Lock()
+
+def create_model_client():
+    """
+    Create the Bedrock runtime client.
+
+    PHOTOWORD_MODEL_BACKEND=fake returns a canned-response client for load tests
+    and offline development (latency set with PHOTOWORD_FAKE_LATENCY seconds).
+    PHOTOWORD_CASSETTE records the calls to, or replays them from, a cassette
+    file (see cassette.py).
+    """
+    if os.environ.get("PHOTOWORD_CASSETTE"):
+        from cassette import wrap_client
+
+        return wrap_client(create_backend_client)
+    return create_backend_client()
+
+def create_backend_client():
+    """Create the Bedrock client, or the fake one selected by PHOTOWORD_MODEL_BACKEND."""
+    if os.environ.get("PHOTOWORD_MODEL_BACKEND") == "fake":
+        from fake_model import FakeModelClient
+
+        return FakeModelClient(latency=float(os.environ.get("PHOTOWORD_FAKE_LATENCY", "0")))
+    import boto3
+
+    return boto3.client(
+        service_name='bedrock-runtime',
+        region_name='us-east-1',
+        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
+        aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"]
+    )
+
+def get_model_client():
+    """Return the process-wide model client, creating it on first use."""
+    global _model_client
+    if _model_client is None:
+        with _model_client_lock:
+            if _model_client is None:
+                _model_client = create_model_client()
+    return _model_client
+
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+MAX_TOKENS = 1000
+MAX_CONTINUATIONS = 3
+
+ANALYSIS_PROMPT = """
+上記の写真をスペイン語で表現したいというスペイン語学習者がいます。
+
+あなたは上記の画像に写っている状況を説明するのに必要なスペイン語の単語や表現のリストを作ってあげてください。上記の写真に写っているものの名前などを、スペイン語・品詞・日本語・スペイン語例文の４つのデータのセットとして列挙してほしいです。
+
+以下のようなデータ構成でリストを作ってください。(配列の中に、さらに４つの属性を持つデータとして作ってください。)
+{
+    "vocabulary": [{
+        "word": "スペイン語の単語",
+        "part_of_speech": "品詞（必ず「名詞」「動詞」「形容詞」「副詞」のなどを指定）",
+        "translation": "日本語訳",
+        "example_sentence": "その単語を使用したスペイン語の例文（必ず完全な文を記載）"
+    }]
+}
+
+重要な注意点：
+1. 各単語について、必ず4つの情報（word, part_of_speech, translation, example_sentence）を含めてください
+2. 例文は必ず完全な文で記載してください
+3. JSONの形式を厳密に守ってください
+"""
+
+CONTINUATION_PROMPT = """
+出力が途中で切れてしまいました。上記のリストに含まれていない残りの単語だけを、同じJSON形式（"vocabulary"配列）で出力してください。
+既に出力した単語を繰り返さないでください。追加する単語がない場合は {{"vocabulary": []}} と出力してください。
+
+既に出力した単語: {words}
+"""
+
+LEMMA_MAX_TOKENS = 400
+
+LEMMA_PROMPT = """
+上記の写真をスペイン語で表現したいというスペイン語学習者がいます。
+
+上記の画像に写っている状況を説明するのに必要なスペイン語の単語を、辞書の見出し語の形（名詞は単数形、動詞は不定詞）で列挙してください。
+訳や例文は不要です。以下のJSON形式だけを出力してください。
+{
+    "scene": "画像の状況の短い説明（日本語で1文）",
+    "words": ["スペイン語の単語", "..."]
+}
+"""
+
+DETAIL_PROMPT = """
+スペイン語学習者のために、次の状況の写真から抽出したスペイン語の単語の単語帳を作ってください。
+
+写真の状況: {scene}
+単語: {words}
+
+各単語について、スペイン語・品詞・日本語・スペイン語例文の４つのデータのセットとして、以下のJSON形式で出力してください。
+{{
+    "vocabulary": [{{
+        "word": "スペイン語の単語",
+        "part_of_speech": "品詞（必ず「名詞」「動詞」「形容詞」「副詞」のなどを指定）",
+        "translation": "日本語訳",
+        "example_sentence": "その単語を使用したスペイン語の例文（必ず完全な文を記載）"
+    }}]
+}}
+
+重要な注意点：
+1. 上記の単語だけを、すべて含めてください
+2. 例文は写真の状況に合った完全な文で記載してください
+3. JSONの形式を厳密に守ってください
+"""
+
+logger = logging.getLogger(__name__)
+
+def invoke_model(messages: list, max_tokens: int = MAX_TOKENS) -> dict:
+    """
+    Send a Messages API request to Bedrock and return the decoded response body.
+
+    Args:
+        messages: Messages in the Anthropic Messages API format
+        max_tokens: Upper bound on the number of generated tokens
+
+    Returns:
+        dict: Decoded response body including ``content`` and ``stop_reason``
+    """
+    response = get_model_client().invoke_model(
+        modelId=MODEL_ID,
+        body=build_request_body({
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": max_tokens,
+            "temperature": 0,
+            "messages": messages
+        })
+    )
+    return json.loads(response.get('body').read())
+
+def count_model_call(result: AnalysisResult, response_body: dict):
+    """Add one model call and its ``usage`` token counts to the analysis statistics."""
+    usage = response_body.get("usage") or {}
+    result.model_calls += 1
+    result.input_tokens += usage.get("input_tokens", 0)
+    result.output_tokens += usage.get("output_tokens", 0)
+
+def build_image_message(image_data: bytes, text: str) -> dict:
+    """
+    Build a user message containing the image followed by a text prompt.
+
+    The image is base64-encoded once into a buffer that ``invoke_model`` splices
+    into the request body, also when the message is resent for a continuation.
+    """
+    return {
+        "role": "user",
+        "content": [
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/jpeg",
+                    "data": Base64Image(image_data)
+                }
+            },
+            {
+                "type": "text",
+                "text": text
+            }
+        ]
+    }
+
+def request_vocabulary(messages: list, result: AnalysisResult) -> List[dict]:
+    """
+    Request a vocabulary list and recover it even from truncated responses.
+
+    Truncated or slightly malformed responses are salvaged item by item. When the
+    model stops at ``max_tokens``, a continuation request asks only for the words
+    that are still missing instead of restarting the request from scratch.
+
+    Args:
+        messages: Initial request messages
+        result: Statistics of the analysis, updated in place
+
+    Returns:
+        list[dict]: Raw vocabulary items
+
+    Raises:
+        ValueError: If no vocabulary data could be parsed from the response
+    """
+    response_body = invoke_model(messages)
+    count_model_call(result, response_body)
+    response_text = response_body['content'][0]['text']
+    salvage = salvage_vocabulary(response_text)
+    if not salvage.found_json:
+        raise ValueError("No JSON found in response")
+    items = salvage.items
+    parsed = salvage.complete or bool(items)
+
+    while response_body.get("stop_reason") == "max_tokens" and result.continuation_calls < MAX_CONTINUATIONS:
+        if items:
+            # Keeping the salvaged items replaces a full re-analysis
+            result.calls_saved += 1
+        words = ", ".join(item["word"] for item in items)
+        messages = messages[:1] + [
+            {
+                "role": "assistant",
+                "content": json.dumps({"vocabulary": items}, ensure_ascii=False)
+            },
+            {
+                "role": "user",
+                "content": CONTINUATION_PROMPT.format(words=words or "なし")
+            }
+        ]
+        response_body = invoke_model(messages)
+        count_model_call(result, response_body)
+        result.continuation_calls += 1
+        salvage = salvage_vocabulary(response_body['content'][0]['text'])
+        parsed = parsed or salvage.complete
+        before = len(items)
+        items = merge_vocabulary_items(items, salvage.items)
+        if len(items) == before:
+            break
+
+    if not parsed and not items:
+        raise ValueError("Failed to parse vocabulary from response")
+
+    if result.continuation_calls:
+        logger.info(
+            "Recovered %d vocabulary items with %d continuation call(s); %d full re-analysis call(s) saved",
+            len(items), result.continuation_calls, result.calls_saved
+        )
+    return items
+
+def analyze_image_two_phase(image_data: bytes, result: AnalysisResult) -> List[SpanishVocabulary]:
+    """
+    Two-phase analysis: list lemmas first, generate details only for unseen words.
+
+    The first call returns only the Spanish lemmas in the image. Details for lemmas
+    already known from past vocabulary come from the shared word-knowledge cache;
+    only the remaining lemmas are sent to a text-only detail-generation call.
+
+    Args:
+        image_data: Binary image data
+        result: Statistics of the analysis, updated in place
+
+    Returns:
+        list[SpanishVocabulary]: Vocabulary in the order the lemmas were listed
+    """
+    response_body = invoke_model([build_image_message(image_data, LEMMA_PROMPT)], max_tokens=LEMMA_MAX_TOKENS)
+    count_model_call(result, response_body)
+    scene, lemmas = salvage_lemmas(response_body['content'][0]['text'])
+    if not lemmas:
+        return []
+
+    db = SessionLocal()
+    try:
+        known, unknown = word_knowledge.partition(db, lemmas)
+    finally:
+        db.close()
+    result.cached_words = len(known)
+
+    generated = []
+    if unknown:
+        prompt = DETAIL_PROMPT.format(scene=scene or "（説明なし）", words=", ".join(unknown))
+        items = request_vocabulary([{"role": "user", "content": prompt}], result)
+        generated = [SpanishVocabulary(**item) for item in items]
+
+    logger.info(
+        "Two-phase analysis: %d lemmas, %d from word-knowledge cache, %d generated",
+        len(lemmas), len(known), len(generated)
+    )
+    return known + generated
+
+def analyze_image_detailed(image_data: bytes, result: Optional[AnalysisResult] = None) -> AnalysisResult:
+    """
+    Analyze an image and return the vocabulary together with call statistics.
+
+    Set PHOTOWORD_ANALYSIS_MODE=two_phase to reuse known words and generate details
+    only for unseen ones (see ``analyze_image_two_phase``).
+
+    Args:
+        image_data: Binary image data
+        result: Statistics to update in place; pass one to keep the counts of the
+            calls already made when the analysis raises
+
+    Returns:
+        AnalysisResult: Extracted vocabulary and model call statistics
+
+    Raises:
+        ValueError: If no vocabulary data could be parsed from the response
+    """
+    if result is None:
+        result = AnalysisResult()
+    if os.environ.get("PHOTOWORD_ANALYSIS_MODE") == "two_phase":
+        result.vocabulary = analyze_image_two_phase(image_data, result)
+    else:
+        items = request_vocabulary([build_image_message(image_data, ANALYSIS_PROMPT)], result)
+        result.vocabulary = [SpanishVocabulary(**item) for item in items]
+    return result
+
+def analyze_image_core(image_data: bytes, user_id: Optional[int] = None) -> List[SpanishVocabulary]:
+    """
+    Core function to analyze image using Claude Haiku via AWS Bedrock.
+    This function is independent of any UI framework.
+    
+    When ``user_id`` is given, the user's daily budget is checked before the
+    model is called and the token usage is recorded for them afterwards.
+
+    Args:
+        image_data: Binary image data
+        user_id: User the model calls are billed to
+        
+    Returns:
+        list[SpanishVocabulary]: A list of Spanish vocabulary words found in the image
+        
+    Raises:
+        BudgetExceededError: If the user's daily budget is used up
+        ValueError: If structured data parsing fails
+        TimeoutError: If the request times out
+        Exception: For any other unexpected errors
+    """
+    if user_id is not None:
+        _check_user_budget(user_id)
+    return _analyze_and_record(image_data, user_id)
+
+def _check_user_budget(user_id: int):
+    db = SessionLocal()
+    try:
+        check_budget(db, user_id)
+    finally:
+        db.close()
+
+def _analyze_and_record(image_data: bytes, user_id: Optional[int]) -> List[SpanishVocabulary]:
+    """
+    Run the analysis and bill its model calls to ``user_id``, without a budget check.
+
+    Calls made before the analysis failed are billed too, so images that keep
+    failing still count towards the budget.
+    """
+    result = AnalysisResult()
+    try:
+        with profile("analyze_image_core"):
+            analyze_image_detailed(image_data, result)
+    except Exception:
+        logger.exception("Image analysis failed")
+        raise
+    finally:
+        if user_id is not None and result.model_calls:
+            _record_usage(user_id, image_data, result)
+    return result.vocabulary
+
+def _record_usage(user_id: int, image_data: bytes, result: AnalysisResult):
+    db = SessionLocal()
+    try:
+        record_usage(db, user_id, hashlib.sha256(image_data).hexdigest(), MODEL_ID, result)
+    except Exception:
+        # Accounting must not discard an analysis that was already paid for
+        logger.exception("Failed to record model usage for user %s", user_id)
+    finally:
+        db.close()
+
+def _serialize_vocabulary(vocab_list: List[SpanishVocabulary]) -> str:
+    return json.dumps([vocab.model_dump() for vocab in vocab_list], ensure_ascii=False)
+
+def _deserialize_vocabulary(data: str) -> List[SpanishVocabulary]:
+    return [SpanishVocabulary(**item) for item in json.loads(data)]
+
+def get_analysis_flight():
+    """
+    Return the process-wide single-flight used for image analysis.
+
+    Created on first use and shared by every session and rerun in the process.
+    Set PHOTOWORD_SINGLE_FLIGHT=lease to coalesce across worker processes as well.
+    """
+    global _analysis_flight
+    if _analysis_flight is None:
+        with _analysis_flight_lock:
+            if _analysis_flight is None:
+                if os.environ.get("PHOTOWORD_SINGLE_FLIGHT") == "lease":
+                    _analysis_flight = LeaseSingleFlight(SessionLocal, _serialize_vocabulary, _deserialize_vocabulary)
+                else:
+                    _analysis_flight = SingleFlight()
+    return _analysis_flight
+
+def analyze_image_shared(image_data: bytes, user_id: Optional[int] = None) -> List[SpanishVocabulary]:
+    """
+    Analyze an image, sharing the model call with concurrent requests for the same image.
+
+    Every caller's budget is checked before it joins the flight, so only the
+    model call is shared; a shared call is billed to the user whose request
+    actually ran it. Nothing inside the flight checks a budget.
+
+    Args:
+        image_data: Binary image data
+        user_id: User the model calls are billed to
+
+    Returns:
+        list[SpanishVocabulary]: A list of Spanish vocabulary words found in the image
+
+    Raises:
+        BudgetExceededError: If this caller's daily budget is used up
+    """
+    if user_id is not None:
+        _check_user_budget(user_id)
+    key = hashlib.sha256(image_data).hexdigest()
+    return get_analysis_flight().do(key, lambda: _analyze_and_record(image_data, user_id))
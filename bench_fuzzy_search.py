@@ -0,0 +1,64 @@
+"""
+Latency benchmark for the trigram fuzzy search.
+
+Builds an in-memory index of synthetic Spanish/Japanese vocabulary (all owned
+by one user, the worst case for the per-user partitioning) and reports
+p50/p95/max query latency for misspelled queries.
+
+Usage:
+    python bench_fuzzy_search.py --entries 1000000 --queries 200
+"""
+import argparse
+import random
+import string
+import time
+from fuzzy_search import TrigramIndex
+from loadtest import percentile
+
+SYLLABLES = ["ba", "be", "ca", "ce", "da", "de", "la", "le", "ma", "me", "na", "ne", "ño", "pa", "ra", "sa", "ta", "to", "ve", "ri", "lla", "que", "gua"]
+KANA = "アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモラリルレロ"
+
+
+def synthetic_rows(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    for vocab_id in range(1, count + 1):
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        translation = "".join(rng.choice(KANA) for _ in range(rng.randint(2, 4)))
+        yield vocab_id, 1, vocab_id // 5, word, translation
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    position = rng.randrange(len(word))
+    return word[:position] + rng.choice(string.ascii_lowercase) + word[position + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzzy search latency")
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    index = TrigramIndex()
+    start = time.perf_counter()
+    rows = list(synthetic_rows(args.entries))
+    for offset in range(0, len(rows), 50000):
+        index.add_rows(rows[offset:offset + 50000])
+    print(f"indexed {len(index)} entries in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(1)
+    timings = []
+    hits = 0
+    for _ in range(args.queries):
+        query = misspell(rows[rng.randrange(len(rows))][3], rng)
+        start = time.perf_counter()
+        hits += bool(index.search(1, query))
+        timings.append(time.perf_counter() - start)
+    print(
+        f"{args.queries} queries: p50 {percentile(timings, 50) * 1000:.2f} ms, "
+        f"p95 {percentile(timings, 95) * 1000:.2f} ms, max {max(timings) * 1000:.2f} ms, "
+        f"{hits / args.queries:.0%} with results"
+    )
+
+
+if __name__ == "__main__":
+    main()
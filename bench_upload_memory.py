@@ -0,0 +1,117 @@
+"""
+Peak memory benchmark for the upload-to-request path.
+
+Each strategy runs in a fresh process so that peak RSS (``ru_maxrss``) is not
+polluted by the other strategy. Per upload the script reports the peak traced
+Python allocation above the upload itself, and per process the peak RSS growth
+over the baseline after imports.
+
+Strategies:
+    naive     getvalue() + md5, base64 ``str``, ``json.dumps`` and ``.encode()``
+    pipeline  streaming sha256, preallocated base64 buffer, spliced bytes body
+
+Usage:
+    python bench_upload_memory.py --size-mb 5 10 20 --uploads 5
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+PROMPT = "上記の写真をスペイン語で表現したいというスペイン語学習者がいます。"
+
+
+def rss_mb() -> float:
+    """Peak RSS of this process in MB (Linux reports ru_maxrss in KiB)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform != "darwin" else peak / (1024 * 1024)
+
+
+def naive_upload(upload: io.BytesIO) -> int:
+    image_data = upload.getvalue()
+    hashlib.md5(image_data).hexdigest()
+    hashlib.sha256(image_data).hexdigest()
+    encoded = base64.b64encode(image_data).decode("utf-8")
+    body = json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 1000,
+        "messages": [{"role": "user", "content": [
+            {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": encoded}},
+            {"type": "text", "text": PROMPT},
+        ]}],
+    })
+    # botocore encodes str bodies before sending
+    return len(body.encode("utf-8"))
+
+
+def pipeline_upload(upload: io.BytesIO) -> int:
+    from upload_pipeline import Base64Image, build_request_body, check_upload_size, hash_stream
+
+    check_upload_size(len(upload.getbuffer()), limit=1 << 40)
+    hash_stream(upload)
+    image_data = upload.getvalue()
+    body = build_request_body({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 1000,
+        "messages": [{"role": "user", "content": [
+            {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": Base64Image(image_data)}},
+            {"type": "text", "text": PROMPT},
+        ]}],
+    })
+    return len(body)
+
+
+STRATEGIES = {"naive": naive_upload, "pipeline": pipeline_upload}
+
+
+def run_strategy(name: str, size: int, uploads: int, results):
+    sys.path.insert(0, APP_DIR)
+    import upload_pipeline  # noqa: F401  (import cost is not part of the measurement)
+
+    upload_fn = STRATEGIES[name]
+    upload = io.BytesIO(os.urandom(size))
+    baseline = rss_mb()
+    tracemalloc.start()
+    peaks = []
+    for _ in range(uploads):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        upload_fn(upload)
+        peaks.append((tracemalloc.get_traced_memory()[1] - before) / (1024 * 1024))
+    tracemalloc.stop()
+    results.put((max(peaks), sum(peaks) / len(peaks), rss_mb() - baseline))
+
+
+def measure(name: str, size: int, uploads: int):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_strategy, args=(name, size, uploads, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory per upload")
+    parser.add_argument("--size-mb", type=float, nargs="+", default=[5, 10, 20], help="Upload sizes in MB")
+    parser.add_argument("--uploads", type=int, default=5, help="Uploads per process")
+    args = parser.parse_args()
+
+    print(f"{'size MB':>8}{'strategy':>10}{'peak/upload MB':>16}{'mean/upload MB':>16}{'RSS growth MB':>15}{'x upload':>10}")
+    for size_mb in args.size_mb:
+        size = int(size_mb * 1024 * 1024)
+        for name in STRATEGIES:
+            peak, mean, rss = measure(name, size, args.uploads)
+            print(f"{size_mb:>8.1f}{name:>10}{peak:>16.1f}{mean:>16.1f}{rss:>15.1f}{peak / size_mb:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
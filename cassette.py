@@ -0,0 +1,191 @@
+"""
+Record/replay of model calls for deterministic, offline benchmark runs.
+
+A cassette is a JSON Lines file with one recorded Bedrock call per line: the
+request fingerprint, the decoded response body and the observed latency.
+
+- Record mode wraps the real (or fake) client, passes every call through and
+  appends it to the cassette.
+- Replay mode never touches the network: calls are answered from the cassette
+  with either no delay or the latency observed while recording, so end-to-end
+  pipeline timings are reproducible on any machine.
+
+Enable it with ``PHOTOWORD_CASSETTE=<path>`` and
+``PHOTOWORD_CASSETTE_MODE=record|replay`` (see ``analysis.create_model_client``).
+``PHOTOWORD_REPLAY_LATENCY=zero|recorded`` selects the replay delay and
+``PHOTOWORD_CASSETTE_MATCH=loose`` lets unseen images reuse responses recorded
+for the same prompt, e.g. when a load test makes every upload unique.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+RECORD = "record"
+REPLAY = "replay"
+LATENCY_ZERO = "zero"
+LATENCY_RECORDED = "recorded"
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when no recorded call matches a request."""
+
+
+def request_fingerprint(model_id: str, body) -> str:
+    """Fingerprint of the exact request: model id and body bytes."""
+    digest = hashlib.sha256(model_id.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(body if isinstance(body, (bytes, bytearray, memoryview)) else str(body).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _strip_images(value):
+    if isinstance(value, dict):
+        if value.get("type") == "base64" and "data" in value:
+            return {**value, "data": ""}
+        return {key: _strip_images(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_strip_images(item) for item in value]
+    return value
+
+
+def request_shape(model_id: str, body) -> str:
+    """Fingerprint of the request with image data removed (prompts and parameters only)."""
+    payload = _strip_images(json.loads(bytes(body)))
+    return request_fingerprint(model_id, json.dumps(payload, sort_keys=True, ensure_ascii=False))
+
+
+def load_cassette(path: str) -> List[dict]:
+    """Read the recorded calls of a cassette file."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _response(response_body: dict) -> dict:
+    return {"body": io.BytesIO(json.dumps(response_body, ensure_ascii=False).encode("utf-8"))}
+
+
+class RecordingClient:
+    """Pass calls through to ``client`` and append them to a cassette file."""
+
+    def __init__(self, client, path: str):
+        self.client = client
+        self.path = path
+        self.recorded = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def invoke_model(self, modelId: str, body, **kwargs) -> dict:
+        start = time.perf_counter()
+        response = self.client.invoke_model(modelId=modelId, body=body, **kwargs)
+        response_body = json.loads(response.get("body").read())
+        latency = time.perf_counter() - start
+        entry = {
+            "fingerprint": request_fingerprint(modelId, body),
+            "shape": request_shape(modelId, body),
+            "model_id": modelId,
+            "latency": round(latency, 6),
+            "response": response_body,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            # One line per call, flushed immediately, so an interrupted run keeps what it recorded
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self.recorded += 1
+        return _response(response_body)
+
+
+class ReplayClient:
+    """
+    Answer calls from recorded entries.
+
+    A request that was recorded several times is answered with the recordings in
+    order, cycling once they are used up. With ``match="loose"``, requests whose
+    exact fingerprint was never recorded fall back to the recordings with the
+    same prompts and parameters.
+    """
+
+    def __init__(self, entries: List[dict], latency: str = LATENCY_ZERO, match: str = "exact", sleep=time.sleep):
+        if latency not in (LATENCY_ZERO, LATENCY_RECORDED):
+            raise ValueError(f"Unknown replay latency mode: {latency}")
+        if match not in ("exact", "loose"):
+            raise ValueError(f"Unknown cassette match mode: {match}")
+        self.latency = latency
+        self.match = match
+        self.sleep = sleep
+        self.calls = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._by_fingerprint: Dict[str, List[dict]] = defaultdict(list)
+        self._by_shape: Dict[str, List[dict]] = defaultdict(list)
+        self._next: Dict[str, int] = defaultdict(int)
+        for entry in entries:
+            self._by_fingerprint[entry["fingerprint"]].append(entry)
+            self._by_shape[entry["shape"]].append(entry)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ReplayClient":
+        return cls(load_cassette(path), **kwargs)
+
+    @property
+    def latencies(self) -> List[float]:
+        """Recorded latencies of all entries."""
+        return [entry["latency"] for entries in self._by_fingerprint.values() for entry in entries]
+
+    def _take(self, key: str, entries: List[dict]) -> dict:
+        index = self._next[key]
+        self._next[key] = index + 1
+        return entries[index % len(entries)]
+
+    def invoke_model(self, modelId: str, body, **kwargs) -> dict:
+        fingerprint = request_fingerprint(modelId, body)
+        with self._lock:
+            self.calls += 1
+            key, entries = fingerprint, self._by_fingerprint.get(fingerprint)
+            if entries is None and self.match == "loose":
+                shape = request_shape(modelId, body)
+                key, entries = f"shape:{shape}", self._by_shape.get(shape)
+            if entries is None:
+                self.misses += 1
+                raise CassetteMissError(
+                    f"No recorded model call matches request {fingerprint[:12]}; "
+                    "record the cassette again or use PHOTOWORD_CASSETTE_MATCH=loose"
+                )
+            entry = self._take(key, entries)
+        if self.latency == LATENCY_RECORDED and entry["latency"] > 0:
+            self.sleep(entry["latency"])
+        return _response(entry["response"])
+
+
+def wrap_client(create_client, path: Optional[str] = None, mode: Optional[str] = None):
+    """
+    Apply the cassette settings from the environment to a model client factory.
+
+    Args:
+        create_client: Zero-argument factory for the underlying client; not called in replay mode
+        path: Cassette file (default: ``PHOTOWORD_CASSETTE``)
+        mode: ``record`` or ``replay`` (default: ``PHOTOWORD_CASSETTE_MODE``, else ``replay``)
+
+    Returns:
+        The client to use: the underlying one when no cassette is configured
+    """
+    path = path or os.environ.get("PHOTOWORD_CASSETTE")
+    if not path:
+        return create_client()
+    mode = mode or os.environ.get("PHOTOWORD_CASSETTE_MODE", REPLAY)
+    if mode == RECORD:
+        return RecordingClient(create_client(), path)
+    if mode == REPLAY:
+        return ReplayClient.from_file(
+            path,
+            latency=os.environ.get("PHOTOWORD_REPLAY_LATENCY", LATENCY_ZERO),
+            match=os.environ.get("PHOTOWORD_CASSETTE_MATCH", "exact"),
+        )
+    raise ValueError(f"Unknown cassette mode: {mode}")
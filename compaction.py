@@ -0,0 +1,366 @@
+"""
+Background storage compaction for the image table.
+
+Originals are kept at full upload size forever, so the database grows without
+bound. The compaction job
+
+- re-encodes originals older than ``PHOTOWORD_ARCHIVE_AFTER_DAYS`` whose
+  vocabulary has been extracted to WebP (or AVIF when Pillow supports it) at
+  ``PHOTOWORD_ARCHIVE_QUALITY``. ``content_hash`` keeps identifying the
+  original upload for job de-duplication; image URLs add the archive time
+  (``image_address``), so no URL ever serves two different bodies.
+- deletes images without vocabulary, left behind when ``save_vocabulary``
+  failed after ``save_image`` committed.
+- returns freed pages to the file system with ``PRAGMA incremental_vacuum`` in
+  bounded slices, so no slice holds the write lock for long.
+
+Every write is a short transaction of its own; images are decoded and encoded
+outside of any transaction.
+
+Usage:
+    python compaction.py                       # one pass
+    python compaction.py --interval 3600       # run as a background process
+    python compaction.py --enable-incremental-vacuum   # one-time conversion
+"""
+import io
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+from sqlalchemy import exists, func, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from models_db import AnalysisJob, Image, ModelUsage, VocabularyEntry
+from timeline_cache import bump_user_version
+
+ARCHIVE_AFTER_DAYS = float(os.environ.get("PHOTOWORD_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_QUALITY = int(os.environ.get("PHOTOWORD_ARCHIVE_QUALITY", "75"))
+ORPHAN_GRACE_SECONDS = 3600
+BATCH_SIZE = 20
+VACUUM_PAGES_PER_SLICE = 256
+VACUUM_PAUSE = 0.05
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CompactionReport:
+    """What a compaction pass did and how many bytes it reclaimed."""
+    images_recompressed: int = 0
+    recompressed_bytes_saved: int = 0
+    orphans_deleted: int = 0
+    orphan_bytes_deleted: int = 0
+    vacuum_slices: int = 0
+    file_bytes_reclaimed: int = 0
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        """Bytes of image data removed from the database."""
+        return self.recompressed_bytes_saved + self.orphan_bytes_deleted
+
+
+def archive_format(requested: Optional[str] = None) -> str:
+    """
+    Return the Pillow format name used for archived originals.
+
+    AVIF needs a Pillow build with AVIF support; otherwise WebP is used.
+    """
+    from PIL import features
+
+    name = (requested or os.environ.get("PHOTOWORD_ARCHIVE_FORMAT", "webp")).upper()
+    if name == "AVIF" and not features.check("avif"):
+        logger.warning("Pillow has no AVIF support, archiving as WebP instead")
+        name = "WEBP"
+    if name not in ("WEBP", "AVIF"):
+        raise ValueError(f"Unsupported archive format: {name}")
+    return name
+
+
+def recompress_image(image_data: bytes, image_format: str = "WEBP", quality: int = ARCHIVE_QUALITY) -> bytes:
+    """
+    Re-encode an image in an archival format.
+
+    The EXIF orientation is applied to the pixels because the metadata is not
+    carried over.
+
+    Args:
+        image_data: Original image bytes
+        image_format: ``WEBP`` or ``AVIF``
+        quality: Encoder quality (0-100)
+
+    Returns:
+        bytes: The re-encoded image
+    """
+    from PIL import Image as PILImage, ImageOps
+
+    with PILImage.open(io.BytesIO(image_data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+        output = io.BytesIO()
+        image.save(output, format=image_format, quality=quality)
+        return output.getvalue()
+
+
+def _has_vocabulary():
+    return exists().where(VocabularyEntry.image_id == Image.id)
+
+
+def recompress_old_images(
+    db: Session,
+    older_than: datetime,
+    image_format: str = "WEBP",
+    quality: int = ARCHIVE_QUALITY,
+    batch_size: int = BATCH_SIZE,
+    max_images: Optional[int] = None,
+    report: Optional[CompactionReport] = None
+) -> CompactionReport:
+    """
+    Re-encode originals created before ``older_than`` that have vocabulary.
+
+    Images that would not get smaller are marked as archived and left as they are.
+
+    Args:
+        db: Database session
+        older_than: Only images created before this UTC time are archived
+        image_format: Archive format, see ``archive_format``
+        quality: Encoder quality
+        batch_size: Number of image ids fetched per query
+        max_images: Stop after this many images
+        report: Report to add to
+
+    Returns:
+        CompactionReport: The updated report
+    """
+    report = report or CompactionReport()
+    last_id = 0
+    processed = 0
+    while max_images is None or processed < max_images:
+        ids = [
+            row.id for row in
+            db.query(Image.id)
+            .filter(
+                Image.id > last_id,
+                Image.archived_at.is_(None),
+                Image.created_at < older_than.replace(tzinfo=None),
+                _has_vocabulary()
+            )
+            .order_by(Image.id)
+            .limit(batch_size)
+            .all()
+        ]
+        db.commit()
+        if not ids:
+            break
+        for image_id in ids:
+            last_id = image_id
+            if max_images is not None and processed >= max_images:
+                break
+            processed += 1
+            row = db.query(Image.user_id, Image.image_data).filter(Image.id == image_id).first()
+            db.commit()
+            if row is None or not row.image_data:
+                continue
+            original_size = len(row.image_data)
+            try:
+                archived = recompress_image(row.image_data, image_format, quality)
+            except Exception as e:
+                logger.warning("Could not recompress image %d: %s", image_id, e)
+                continue
+            values = {"archived_at": time.time()}
+            if len(archived) < original_size:
+                values["image_data"] = archived
+            # Only touch the row if nobody archived it in the meantime
+            changed = db.execute(
+                update(Image)
+                .where(Image.id == image_id, Image.archived_at.is_(None))
+                .values(**values)
+            ).rowcount
+            if changed:
+                # archived_at is part of the image address shown in the timeline
+                bump_user_version(db, row.user_id)
+            db.commit()
+            if changed and "image_data" in values:
+                report.images_recompressed += 1
+                report.recompressed_bytes_saved += original_size - len(archived)
+    return report
+
+
+def delete_orphaned_images(
+    db: Session,
+    grace_seconds: float = ORPHAN_GRACE_SECONDS,
+    batch_size: int = BATCH_SIZE,
+    report: Optional[CompactionReport] = None
+) -> CompactionReport:
+    """
+    Delete images without vocabulary that are older than ``grace_seconds``.
+
+    The grace period keeps images whose vocabulary is still being saved.
+
+    Args:
+        db: Database session
+        grace_seconds: Minimum age of an orphaned image
+        batch_size: Number of images deleted per transaction
+        report: Report to add to
+
+    Returns:
+        CompactionReport: The updated report
+    """
+    report = report or CompactionReport()
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=grace_seconds)
+    while True:
+        rows = (
+            db.query(Image.id, Image.user_id, func.coalesce(func.length(Image.image_data), 0).label("size"))
+            .filter(Image.created_at < cutoff, ~_has_vocabulary())
+            .order_by(Image.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            db.commit()
+            break
+        ids = [row.id for row in rows]
+        db.execute(update(ModelUsage).where(ModelUsage.image_id.in_(ids)).values(image_id=None))
+        db.execute(update(AnalysisJob).where(AnalysisJob.image_id.in_(ids)).values(image_id=None))
+        deleted = db.query(Image).filter(Image.id.in_(ids)).delete(synchronize_session=False)
+        for user_id in {row.user_id for row in rows if row.user_id is not None}:
+            bump_user_version(db, user_id)
+        db.commit()
+        report.orphans_deleted += deleted
+        report.orphan_bytes_deleted += sum(row.size for row in rows)
+    return report
+
+
+def enable_incremental_vacuum(engine: Engine):
+    """
+    Switch a SQLite database to ``auto_vacuum=INCREMENTAL``.
+
+    This runs a full VACUUM once, which locks the database while it rewrites
+    the file; run it during maintenance. PostgreSQL reclaims space with
+    autovacuum and is rejected.
+
+    Raises:
+        ValueError: If the database is not SQLite
+    """
+    if engine.dialect.name != "sqlite":
+        raise ValueError("Incremental vacuum is only available for SQLite databases")
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.commit()
+        conn.exec_driver_sql("VACUUM")
+
+
+def incremental_vacuum(
+    engine: Engine,
+    pages_per_slice: int = VACUUM_PAGES_PER_SLICE,
+    max_slices: Optional[int] = None,
+    pause: float = VACUUM_PAUSE,
+    report: Optional[CompactionReport] = None
+) -> CompactionReport:
+    """
+    Return free pages to the file system in bounded slices.
+
+    Each slice frees at most ``pages_per_slice`` pages in its own short write
+    transaction; other connections can write between slices. Does nothing
+    unless the database is SQLite with ``auto_vacuum=INCREMENTAL``.
+
+    Args:
+        engine: Database engine
+        pages_per_slice: Pages freed per slice
+        max_slices: Stop after this many slices
+        pause: Seconds to sleep between slices
+        report: Report to add to
+
+    Returns:
+        CompactionReport: The updated report
+    """
+    report = report or CompactionReport()
+    if engine.dialect.name != "sqlite":
+        return report
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            logger.warning("auto_vacuum is not INCREMENTAL; run with --enable-incremental-vacuum once to reclaim file space")
+            return report
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+        start_pages = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        slices = 0
+        while max_slices is None or slices < max_slices:
+            if not conn.exec_driver_sql("PRAGMA freelist_count").scalar():
+                break
+            # pysqlite steps this pragma only once per execute(), which frees a
+            # single page; executescript() runs it to completion
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(pages_per_slice)})")
+            conn.commit()
+            slices += 1
+            if pause:
+                time.sleep(pause)
+        end_pages = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        conn.commit()
+    report.vacuum_slices += slices
+    report.file_bytes_reclaimed += (start_pages - end_pages) * page_size
+    return report
+
+
+def run_compaction(
+    session_factory: Callable[[], Session],
+    engine: Engine,
+    archive_after_days: float = ARCHIVE_AFTER_DAYS,
+    image_format: Optional[str] = None,
+    quality: int = ARCHIVE_QUALITY,
+    max_images: Optional[int] = None,
+    max_vacuum_slices: Optional[int] = None
+) -> CompactionReport:
+    """Run one full compaction pass and log what was reclaimed."""
+    report = CompactionReport()
+    db = session_factory()
+    try:
+        delete_orphaned_images(db, report=report)
+        older_than = datetime.now(timezone.utc) - timedelta(days=archive_after_days)
+        recompress_old_images(
+            db, older_than, archive_format(image_format), quality,
+            max_images=max_images, report=report
+        )
+    finally:
+        db.close()
+    incremental_vacuum(engine, max_slices=max_vacuum_slices, report=report)
+    logger.info(
+        "Compaction: %d images recompressed (%d bytes saved), %d orphaned images deleted (%d bytes), "
+        "%d vacuum slices returned %d bytes to the file system",
+        report.images_recompressed, report.recompressed_bytes_saved,
+        report.orphans_deleted, report.orphan_bytes_deleted,
+        report.vacuum_slices, report.file_bytes_reclaimed
+    )
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    from db import SessionLocal, get_engine
+
+    parser = argparse.ArgumentParser(description="Photoword storage compaction")
+    parser.add_argument("--archive-after-days", type=float, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--format", choices=["webp", "avif"], help="Archive format (default PHOTOWORD_ARCHIVE_FORMAT or webp)")
+    parser.add_argument("--quality", type=int, default=ARCHIVE_QUALITY)
+    parser.add_argument("--max-images", type=int, help="Recompress at most this many images per pass")
+    parser.add_argument("--max-vacuum-slices", type=int, help="Run at most this many vacuum slices per pass")
+    parser.add_argument("--interval", type=float, help="Repeat every N seconds instead of running once")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true", help="Convert the database to auto_vacuum=INCREMENTAL (full VACUUM) and exit")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = get_engine()
+    engine.echo = False
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum(engine)
+    else:
+        while True:
+            report = run_compaction(
+                SessionLocal, engine, args.archive_after_days, args.format, args.quality,
+                args.max_images, args.max_vacuum_slices
+            )
+            print(f"reclaimed {report.bytes_reclaimed} bytes of image data, {report.file_bytes_reclaimed} bytes of file space")
+            if not args.interval:
+                break
+            time.sleep(args.interval)
@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db import Base
+from models_db import User, Image, VocabularyEntry
+from timeline_cache import bump_user_version
+
+@pytest.fixture
+def engine(tmp_path):
+    """Engine bound to a fresh SQLite database with the full schema."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+@pytest.fixture
+def test_db(session_factory):
+    db = session_factory()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@pytest.fixture
+def test_user(test_db):
+    user = User(username="test_user")
+    test_db.add(user)
+    test_db.commit()
+    test_db.refresh(user)
+    return user
+
+@pytest.fixture
+def add_image():
+    """
+    Helper that saves an image with one vocabulary entry per ``(spanish, japanese)``
+    pair, bumps the user's data version, and returns the image id.
+    Extra keyword arguments are passed to ``Image``.
+    """
+    def add(db, user_id, *words, image_data=b"image", **columns):
+        image = Image(user_id=user_id, image_data=image_data, **columns)
+        db.add(image)
+        db.flush()
+        for spanish, japanese in words:
+            db.add(VocabularyEntry(
+                user_id=user_id,
+                image_id=image.id,
+                spanish_word=spanish,
+                part_of_speech="名詞",
+                japanese_translation=japanese,
+                example_sentence="Ejemplo."
+            ))
+        bump_user_version(db, user_id)
+        db.commit()
+        return image.id
+    return add
@@ -1,12 +1,67 @@
 import os
+import threading
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite:///photoword.db"
-engine = create_engine(DATABASE_URL, echo=True)  # echo=True for debugging
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+def normalize_database_url(url: str) -> str:
+    """Use the psycopg (v3) driver for ``postgres://`` and driverless ``postgresql://`` URLs."""
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("postgresql://"):
+        url = "postgresql+psycopg://" + url[len("postgresql://"):]
+    return url
+
+DATABASE_URL = normalize_database_url(os.environ.get("DATABASE_URL", "sqlite:///photoword.db"))
 Base = declarative_base()
 
+_engine = None
+_engine_lock = threading.Lock()
+
+def engine_options(url: str) -> dict:
+    """
+    Keyword arguments for ``create_engine`` tuned for the database backend.
+
+    SQLite keeps SQLAlchemy's defaults. For PostgreSQL every process (Streamlit
+    server, job worker) gets its own connection pool, sized with
+    ``PHOTOWORD_DB_POOL_SIZE`` (default 5) and ``PHOTOWORD_DB_MAX_OVERFLOW``
+    (default 10) so that sessions and worker threads rarely wait for a
+    connection. The server's ``max_connections`` must cover
+    processes x (pool size + overflow).
+    """
+    options = {"echo": True}  # echo=True for debugging
+    if make_url(url).get_backend_name() == "postgresql":
+        options.update(
+            pool_size=int(os.environ.get("PHOTOWORD_DB_POOL_SIZE", "5")),
+            max_overflow=int(os.environ.get("PHOTOWORD_DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.environ.get("PHOTOWORD_DB_POOL_TIMEOUT", "10")),
+            # Drop connections closed by the server or a proxy instead of failing a request
+            pool_pre_ping=True,
+            pool_recycle=1800,
+            # CURRENT_TIMESTAMP defaults are naive UTC, as on SQLite
+            connect_args={"application_name": "photoword", "options": "-c timezone=UTC"},
+        )
+    return options
+
+def get_engine():
+    """Return the process-wide engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+    return _engine
+
+class LazySessionMaker(sessionmaker):
+    """Session factory that binds to the engine when the first session is created."""
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+SessionLocal = LazySessionMaker(autoflush=False, autocommit=False)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
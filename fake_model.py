@@ -0,0 +1,70 @@
+"""
+Fake Bedrock runtime client for load tests and offline development.
+
+Enable it with ``PHOTOWORD_MODEL_BACKEND=fake``. Responses have the shape of a
+Bedrock Messages API response and are returned after a configurable latency
+(``PHOTOWORD_FAKE_LATENCY`` seconds), so the rest of the pipeline runs unchanged.
+The lemma prompt of the two-phase analysis gets only the words, and the detail
+prompt only the details of the words it lists, so token counts behave like the
+real model's.
+"""
+import io
+import json
+import random
+import re
+import time
+from typing import List, Optional
+
+FAKE_VOCABULARY = [
+    {"word": "mesa", "part_of_speech": "名詞", "translation": "テーブル", "example_sentence": "Hay una mesa junto a la ventana."},
+    {"word": "silla", "part_of_speech": "名詞", "translation": "椅子", "example_sentence": "La silla es muy cómoda."},
+    {"word": "ventana", "part_of_speech": "名詞", "translation": "窓", "example_sentence": "La ventana está abierta."},
+    {"word": "lámpara", "part_of_speech": "名詞", "translation": "ランプ", "example_sentence": "La lámpara ilumina la sala."},
+    {"word": "comer", "part_of_speech": "動詞", "translation": "食べる", "example_sentence": "Vamos a comer en el restaurante."},
+    {"word": "luminoso", "part_of_speech": "形容詞", "translation": "明るい", "example_sentence": "El comedor es muy luminoso."},
+]
+
+
+class FakeModelClient:
+    """Stand-in for the boto3 ``bedrock-runtime`` client."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, vocabulary: Optional[List[dict]] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.vocabulary = vocabulary or FAKE_VOCABULARY
+        self.calls = 0
+
+    def respond(self, messages: list) -> dict:
+        """Return the JSON payload answering the last message of the request."""
+        content = messages[-1]["content"]
+        if isinstance(content, list):
+            prompt = "".join(part.get("text", "") for part in content if part.get("type") == "text")
+        else:
+            prompt = content
+        # Detail prompt of the two-phase analysis: "単語: a, b, c"
+        listed = re.search(r"^単語: (.*)$", prompt, re.MULTILINE)
+        if listed:
+            words = [word.strip() for word in listed.group(1).split(",")]
+            by_word = {item["word"]: item for item in self.vocabulary}
+            return {"vocabulary": [by_word[word] for word in words if word in by_word]}
+        if '"words"' in prompt:
+            return {"scene": "レストランの店内", "words": [item["word"] for item in self.vocabulary]}
+        return {"vocabulary": self.vocabulary}
+
+    def invoke_model(self, modelId: str, body, **kwargs) -> dict:
+        """Return a canned response after the configured latency."""
+        self.calls += 1
+        request = json.loads(body)
+        delay = self.latency + random.uniform(0, self.jitter) if self.jitter else self.latency
+        if delay:
+            time.sleep(delay)
+        text = json.dumps(self.respond(request["messages"]), ensure_ascii=False)
+        response_body = {
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": {
+                "input_tokens": len(json.dumps(request["messages"])) // 4,
+                "output_tokens": len(text) // 4
+            }
+        }
+        return {"body": io.BytesIO(json.dumps(response_body).encode("utf-8"))}
@@ -0,0 +1,110 @@
+"""
+Process-wide, byte-bounded LRU cache of image and thumbnail bytes.
+
+Images are keyed by address (``image_address``), which changes when compaction
+re-encodes the stored bytes, so cached bytes never go stale. The cache is
+filled on demand by the image server and the inline image path, and ahead of
+time by the timeline prefetcher (prefetch.py). Its size is capped with
+``PHOTOWORD_IMAGE_CACHE_MB`` (default 64).
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+IMAGE_CACHE_BYTES = int(float(os.environ.get("PHOTOWORD_IMAGE_CACHE_MB", "64")) * 1024 * 1024)
+
+
+def image_address(content_hash: str, archived_at: Optional[float]) -> str:
+    """
+    Return the address of an image's stored bytes.
+
+    Compaction re-encodes ``image_data`` but keeps ``content_hash``, so archived
+    images get the archive time as a revision suffix: ``<sha256>.<seconds>``.
+
+    Args:
+        content_hash: sha256 hex digest of the original upload
+        archived_at: ``Image.archived_at``, None for originals
+    """
+    if archived_at is None:
+        return content_hash
+    return f"{content_hash}.{int(archived_at)}"
+
+
+class ByteLRUCache:
+    """Thread-safe LRU mapping keys to bytes, bounded by the total size of its values."""
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._items
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Return the cached bytes and mark them as recently used, counting the hit or miss."""
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: bytes) -> bool:
+        """
+        Cache ``value``, evicting least recently used entries to stay within ``max_bytes``.
+
+        Returns:
+            bool: False if the value alone is larger than the cache and was not stored
+        """
+        if len(value) > self.max_bytes:
+            return False
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+            return True
+
+    def clear(self):
+        """Drop all cached values."""
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        """Counters for reporting."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate,
+                "evictions": self.evictions,
+                "entries": len(self._items),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+image_cache = ByteLRUCache()
@@ -0,0 +1,290 @@
+"""
+Cache-friendly HTTP serving of images and thumbnails by content hash.
+
+``st.image(bytes)`` pushes the image through the Streamlit websocket on every
+rerun, so the browser can never cache it. This module runs a small Tornado
+server next to Streamlit that serves ``/images/<address>`` and
+``/thumbnails/<address>``. The address is the sha256 of the upload, plus the
+archive time once compaction re-encoded the stored bytes (see
+``image_address``). Because the address changes whenever the bytes do,
+responses are immutable: they carry a long-lived ``Cache-Control``, a strong
+``ETag`` and support ``Range`` requests, and repeat views are answered from the
+browser cache. A superseded address redirects to the current one.
+"""
+import asyncio
+import io
+import re
+import threading
+from typing import Callable, Optional, Tuple
+import tornado.web
+from sqlalchemy.orm import Session
+from models_db import Image
+from image_cache import ByteLRUCache, image_address, image_cache
+
+THUMBNAIL_SIZE = 320
+THUMBNAIL_QUALITY = 80
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_ADDRESS_PATTERN = r"([0-9a-f]{64}(?:\.[0-9]+)?)"
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _address_filter(address: str):
+    """SQL conditions selecting the images stored under ``address``."""
+    content_hash, _, revision = address.partition(".")
+    if not revision:
+        return [Image.content_hash == content_hash, Image.archived_at.is_(None)]
+    return [
+        Image.content_hash == content_hash,
+        Image.archived_at >= int(revision),
+        Image.archived_at < int(revision) + 1,
+    ]
+
+
+def current_address(db: Session, address: str) -> Optional[str]:
+    """
+    Return the address under which the image behind ``address`` is stored now.
+
+    Args:
+        db: Database session
+        address: Possibly superseded image address
+
+    Returns:
+        The current address, or None if no image has the address's content hash
+    """
+    content_hash = address.partition(".")[0]
+    rows = db.query(Image.archived_at).filter(Image.content_hash == content_hash).all()
+    if not rows:
+        return None
+    addresses = {image_address(content_hash, row.archived_at) for row in rows}
+    return address if address in addresses else min(addresses)
+
+
+def guess_content_type(data: bytes) -> str:
+    """Return the MIME type of JPEG, PNG, WebP or AVIF data based on its magic bytes."""
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:12] == b"ftypavif":
+        return "image/avif"
+    return "image/jpeg"
+
+
+def make_thumbnail(image_data: bytes, size: int = THUMBNAIL_SIZE) -> bytes:
+    """
+    Create a JPEG thumbnail that fits in a ``size`` x ``size`` box.
+
+    Args:
+        image_data: Original image bytes
+        size: Maximum width and height in pixels
+
+    Returns:
+        bytes: JPEG encoded thumbnail
+    """
+    from PIL import Image as PILImage
+
+    with PILImage.open(io.BytesIO(image_data)) as image:
+        # Let the JPEG decoder downscale while decoding instead of materializing full-size pixels
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        return output.getvalue()
+
+
+def parse_range(header: str, length: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range ``Range`` header.
+
+    Args:
+        header: Value of the Range header, e.g. ``bytes=0-1023``
+        length: Size of the full body
+
+    Returns:
+        (start, end) with an exclusive end, or None if the range is not satisfiable
+
+    Raises:
+        ValueError: If the header is not a single byte range
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        raise ValueError(f"Unsupported range: {header}")
+    start, end = match.groups()
+    if start == "":
+        # Suffix range: the last N bytes
+        start, end = max(0, length - int(end)), length
+    else:
+        start = int(start)
+        end = min(length, int(end) + 1) if end else length
+    if start >= length or start >= end:
+        return None
+    return start, end
+
+
+def load_image(db: Session, address: str, thumbnail: bool) -> Optional[bytes]:
+    """
+    Load image or thumbnail bytes by address.
+
+    Missing thumbnails are generated from the stored image and stored.
+
+    Args:
+        db: Database session
+        address: Image address, see ``image_address``
+        thumbnail: Whether to return the thumbnail instead of the image
+
+    Returns:
+        The bytes, or None if no image is stored under this address
+    """
+    conditions = _address_filter(address)
+    if not thumbnail:
+        return (
+            db.query(Image.image_data)
+            .filter(*conditions)
+            .limit(1)
+            .scalar()
+        )
+    row = (
+        db.query(Image.id, Image.thumbnail_data)
+        .filter(*conditions)
+        .first()
+    )
+    if row is None:
+        return None
+    if row.thumbnail_data is not None:
+        return row.thumbnail_data
+    original = db.query(Image.image_data).filter(Image.id == row.id).scalar()
+    thumbnail_data = make_thumbnail(original)
+    db.query(Image).filter(*conditions).update(
+        {Image.thumbnail_data: thumbnail_data}, synchronize_session=False
+    )
+    db.commit()
+    return thumbnail_data
+
+
+def load_image_cached(db: Session, address: str, thumbnail: bool, cache: ByteLRUCache = image_cache) -> Optional[bytes]:
+    """``load_image`` through the process-wide byte-bounded image cache."""
+    key = (address, thumbnail)
+    data = cache.get(key)
+    if data is None:
+        data = load_image(db, address, thumbnail)
+        if data is not None:
+            cache.put(key, data)
+    return data
+
+
+class ImageHandler(tornado.web.RequestHandler):
+    """Serve an image or thumbnail by its address."""
+
+    def initialize(self, session_factory: Callable[[], Session], thumbnail: bool):
+        self.session_factory = session_factory
+        self.thumbnail = thumbnail
+
+    def _load(self, address: str, load_body: bool) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Return the bytes and the current address of the image behind ``address``.
+
+        The address is None if no image has its content hash. The bytes are None
+        if ``load_body`` is False or the address was superseded.
+        """
+        db = self.session_factory()
+        try:
+            if load_body:
+                data = load_image_cached(db, address, self.thumbnail)
+                if data is not None:
+                    return data, address
+            return None, current_address(db, address)
+        finally:
+            db.close()
+
+    def _not_modified(self, etag: str) -> bool:
+        if_none_match = self.request.headers.get("If-None-Match", "")
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    async def get(self, address: str):
+        etag = f'"{address}{"-thumb" if self.thumbnail else ""}"'
+        # Database access is blocking, keep it off the event loop. A conditional
+        # request only needs to know the address is still served, not the bytes
+        not_modified = self._not_modified(etag)
+        data, current = await asyncio.get_running_loop().run_in_executor(None, self._load, address, not not_modified)
+        if current is None:
+            raise tornado.web.HTTPError(404)
+        if current != address:
+            # Compaction re-encoded the image; the old address must not be cached as the new bytes
+            kind = "thumbnails" if self.thumbnail else "images"
+            self.redirect(f"/{kind}/{current}")
+            return
+
+        self.set_header("ETag", etag)
+        self.set_header("Cache-Control", IMMUTABLE_CACHE_CONTROL)
+        self.set_header("Accept-Ranges", "bytes")
+        # The address changes with the stored bytes, so a matching ETag never needs a body
+        if not_modified:
+            self.set_status(304)
+            return
+        if data is None:
+            raise tornado.web.HTTPError(404)
+
+        self.set_header("Content-Type", guess_content_type(data))
+        range_header = self.request.headers.get("Range")
+        if range_header:
+            try:
+                byte_range = parse_range(range_header, len(data))
+            except ValueError:
+                byte_range = (0, len(data))
+            if byte_range is None:
+                self.set_status(416)
+                self.set_header("Content-Range", f"bytes */{len(data)}")
+                return
+            start, end = byte_range
+            if (start, end) != (0, len(data)):
+                self.set_status(206)
+                self.set_header("Content-Range", f"bytes {start}-{end - 1}/{len(data)}")
+            data = memoryview(data)[start:end]
+        self.write(bytes(data))
+
+
+def make_app(session_factory: Callable[[], Session]) -> tornado.web.Application:
+    """Create the Tornado application serving images and thumbnails."""
+    return tornado.web.Application([
+        (rf"/images/{_ADDRESS_PATTERN}", ImageHandler, dict(session_factory=session_factory, thumbnail=False)),
+        (rf"/thumbnails/{_ADDRESS_PATTERN}", ImageHandler, dict(session_factory=session_factory, thumbnail=True)),
+    ])
+
+
+def start_image_server(session_factory: Callable[[], Session], port: int, address: str = "127.0.0.1") -> threading.Thread:
+    """
+    Run the image server on its own event loop in a daemon thread.
+
+    Args:
+        session_factory: Factory for database sessions
+        port: TCP port to listen on
+        address: Interface to bind to (loopback by default, for a reverse proxy
+            on the same host; "" binds all interfaces)
+
+    Returns:
+        threading.Thread: The thread running the server
+    """
+    started = threading.Event()
+    errors = []
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            make_app(session_factory).listen(port, address=address)
+        except Exception as e:
+            errors.append(e)
+            started.set()
+            return
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, name="photoword-image-server", daemon=True)
+    thread.start()
+    started.wait()
+    if errors:
+        raise errors[0]
+    return thread
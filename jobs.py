@@ -0,0 +1,393 @@
+"""
+Persistent background job queue for image analysis.
+
+Analysis and persistence run in worker threads (in the Streamlit process) or in
+a separate worker process, so widget interactions, page refreshes and reruns no
+longer abort or duplicate the 5-10 second model call. The UI only enqueues a job
+and polls its status.
+
+Run a standalone worker process with::
+
+    python jobs.py --concurrency 2
+"""
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional
+from sqlalchemy import or_, and_, update
+from sqlalchemy.orm import Session
+from models import SpanishVocabulary
+from models_db import AnalysisJob
+from usage import BudgetExceededError
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+LEASE_SECONDS = 120.0
+RETRY_BASE_DELAY = 5.0
+
+AnalyzeFn = Callable[[bytes, int], List[SpanishVocabulary]]
+PersistFn = Callable[[Session, int, bytes, List[SpanishVocabulary]], int]
+
+
+def enqueue_analysis(db: Session, user_id: int, image_data: bytes, max_attempts: int = 3, image_hash: Optional[str] = None) -> AnalysisJob:
+    """
+    Queue an image for analysis, reusing an active job for the same image.
+
+    Args:
+        db: Database session
+        user_id: Owner of the image
+        image_data: Binary image data
+        max_attempts: How many times the job may be tried before it fails
+        image_hash: sha256 of ``image_data`` if the caller already computed it
+
+    Returns:
+        AnalysisJob: The queued (or already active) job
+    """
+    if image_hash is None:
+        image_hash = hashlib.sha256(image_data).hexdigest()
+    job = (
+        db.query(AnalysisJob)
+        .filter(
+            AnalysisJob.user_id == user_id,
+            AnalysisJob.image_hash == image_hash,
+            AnalysisJob.status.in_(ACTIVE_STATUSES)
+        )
+        .first()
+    )
+    if job:
+        return job
+    job = AnalysisJob(
+        user_id=user_id,
+        image_hash=image_hash,
+        image_data=image_data,
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts,
+        next_attempt_at=time.time(),
+        updated_at=time.time()
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def get_active_job_ids(db: Session, user_id: int) -> List[int]:
+    """Return the ids of the user's queued or running jobs, oldest first."""
+    rows = (
+        db.query(AnalysisJob.id)
+        .filter(AnalysisJob.user_id == user_id, AnalysisJob.status.in_(ACTIVE_STATUSES))
+        .order_by(AnalysisJob.id)
+        .all()
+    )
+    return [row.id for row in rows]
+
+
+def get_job_statuses(db: Session, job_ids: List[int]) -> List[AnalysisJob]:
+    """Return the jobs with the given ids without loading their image data."""
+    if not job_ids:
+        return []
+    return (
+        db.query(AnalysisJob)
+        .filter(AnalysisJob.id.in_(job_ids))
+        .with_entities(
+            AnalysisJob.id,
+            AnalysisJob.user_id,
+            AnalysisJob.image_hash,
+            AnalysisJob.status,
+            AnalysisJob.attempts,
+            AnalysisJob.max_attempts,
+            AnalysisJob.error,
+            AnalysisJob.image_id
+        )
+        .all()
+    )
+
+
+def claim_next_job(db: Session, worker_id: str) -> Optional[AnalysisJob]:
+    """
+    Atomically claim the next runnable job.
+
+    Queued jobs whose retry time has come are runnable, as are running jobs whose
+    lease expired because their worker died (e.g. the server restarted).
+
+    Args:
+        db: Database session
+        worker_id: Identity of the claiming worker
+
+    Returns:
+        AnalysisJob or None: The claimed job, or None if nothing is runnable
+    """
+    now = time.time()
+    runnable = or_(
+        and_(AnalysisJob.status == "queued", AnalysisJob.next_attempt_at <= now),
+        and_(AnalysisJob.status == "running", AnalysisJob.locked_until < now)
+    )
+    candidates = (
+        db.query(AnalysisJob.id)
+        .filter(runnable)
+        .order_by(AnalysisJob.next_attempt_at, AnalysisJob.id)
+        .limit(5)
+        .all()
+    )
+    for candidate in candidates:
+        # Compare-and-swap so that two workers never claim the same job
+        claimed = db.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == candidate.id, runnable)
+            .values(
+                status="running",
+                attempts=AnalysisJob.attempts + 1,
+                locked_by=worker_id,
+                locked_until=now + LEASE_SECONDS,
+                updated_at=now
+            )
+        )
+        db.commit()
+        if claimed.rowcount == 1:
+            return db.get(AnalysisJob, candidate.id)
+    return None
+
+
+def renew_lease(db: Session, job_id: int, worker_id: str) -> bool:
+    """
+    Extend the lease of a running job held by ``worker_id``.
+
+    Returns:
+        bool: False if the worker no longer holds the job (its lease expired
+        and another worker claimed it)
+    """
+    now = time.time()
+    renewed = db.execute(
+        update(AnalysisJob)
+        .where(AnalysisJob.id == job_id, AnalysisJob.locked_by == worker_id, AnalysisJob.status == "running")
+        .values(locked_until=now + LEASE_SECONDS, updated_at=now)
+    )
+    db.commit()
+    return renewed.rowcount == 1
+
+
+class LeaseHeartbeat:
+    """Renew a claimed job's lease from a background thread while the job is processed."""
+
+    def __init__(self, engine, job_id: int, worker_id: str, interval: float = LEASE_SECONDS / 3):
+        self.engine = engine
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"photoword-lease-{job_id}", daemon=True)
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # Sessions are not thread-safe; the worker thread keeps using its own
+            db = Session(bind=self.engine)
+            try:
+                if not renew_lease(db, self.job_id, self.worker_id):
+                    self.lost = True
+                    return
+            except Exception:
+                logger.exception("Could not renew the lease of job %d", self.job_id)
+            finally:
+                db.close()
+
+
+def _update_held_job(db: Session, job: AnalysisJob, worker_id: str, **values) -> bool:
+    """Update a job only while ``worker_id`` still holds it; returns False if it does not."""
+    updated = db.execute(
+        update(AnalysisJob)
+        .where(AnalysisJob.id == job.id, AnalysisJob.locked_by == worker_id, AnalysisJob.status == "running")
+        .values(**values)
+    )
+    db.commit()
+    if updated.rowcount != 1:
+        logger.warning("Worker %s lost the lease of job %d; dropping its result", worker_id, job.id)
+        return False
+    return True
+
+
+def complete_job(db: Session, job: AnalysisJob, image_id: int, worker_id: Optional[str] = None) -> bool:
+    """
+    Mark a job as done and drop its copy of the image data.
+
+    Args:
+        db: Database session
+        job: Job claimed by ``worker_id``
+        image_id: Id of the saved image
+        worker_id: Worker holding the job; defaults to the job's current holder
+
+    Returns:
+        bool: False if the worker lost the job to another worker and nothing was changed
+    """
+    return _update_held_job(
+        db, job, worker_id or job.locked_by,
+        status="done",
+        image_id=image_id,
+        error=None,
+        locked_by=None,
+        locked_until=None,
+        image_data=b"",
+        updated_at=time.time()
+    )
+
+
+def fail_job(db: Session, job: AnalysisJob, error: str, retry: bool = True, worker_id: Optional[str] = None) -> bool:
+    """
+    Schedule a retry with exponential backoff, or fail the job for good.
+
+    A job that failed for good drops its image data, like a completed one.
+
+    Returns:
+        bool: False if the worker lost the job to another worker and nothing was changed
+    """
+    now = time.time()
+    values = dict(error=error, locked_by=None, locked_until=None, updated_at=now)
+    if not retry or job.attempts >= job.max_attempts:
+        values["status"] = "failed"
+        values["image_data"] = b""
+    else:
+        values["status"] = "queued"
+        values["next_attempt_at"] = now + RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+    return _update_held_job(db, job, worker_id or job.locked_by, **values)
+
+
+def process_job(db: Session, job: AnalysisJob, analyze: AnalyzeFn, persist: PersistFn):
+    """
+    Analyze a claimed job's image and persist the vocabulary.
+
+    The lease is renewed while the job runs. If it is lost anyway (e.g. the
+    worker stalled and another worker claimed the job), the result is dropped.
+
+    Args:
+        db: Database session the job was claimed with
+        job: Claimed job
+        analyze: Function returning the vocabulary for an image, billed to the given user
+        persist: Function saving the image and vocabulary, returning the image id
+    """
+    user_id, image_data, worker_id = job.user_id, job.image_data, job.locked_by
+    # End the read transaction so no lock is held during the model call
+    db.commit()
+    with LeaseHeartbeat(db.get_bind(), job.id, worker_id):
+        try:
+            vocab_list = analyze(image_data, user_id)
+            if not vocab_list:
+                raise ValueError("No vocabulary extracted from image")
+            # Do not save a result another worker is producing as well
+            if not renew_lease(db, job.id, worker_id):
+                logger.warning("Worker %s lost the lease of job %d; dropping its result", worker_id, job.id)
+                return
+            image_id = persist(db, user_id, image_data, vocab_list)
+        except Exception as e:
+            db.rollback()
+            logger.warning("Analysis job %d failed (attempt %d/%d): %s", job.id, job.attempts, job.max_attempts, e)
+            # Retrying cannot help until the user's budget resets
+            fail_job(db, job, str(e), retry=not isinstance(e, BudgetExceededError), worker_id=worker_id)
+        else:
+            complete_job(db, job, image_id, worker_id=worker_id)
+
+
+class JobWorkerPool:
+    """Fixed-size pool of threads that claim and process analysis jobs."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        analyze: AnalyzeFn,
+        persist: PersistFn,
+        concurrency: int = 2,
+        poll_interval: float = 1.0
+    ):
+        self.session_factory = session_factory
+        self.analyze = analyze
+        self.persist = persist
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Start the worker threads."""
+        for i in range(self.concurrency):
+            thread = threading.Thread(
+                target=self._run,
+                args=(f"{self.worker_prefix}:{i}",),
+                name=f"photoword-job-worker-{i}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        """Wake idle workers after a job was enqueued."""
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask the workers to finish their current job and exit."""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_once(self, worker_id: Optional[str] = None) -> bool:
+        """
+        Claim and process a single job.
+
+        Returns:
+            bool: True if a job was processed
+        """
+        db = self.session_factory()
+        try:
+            job = claim_next_job(db, worker_id or f"{self.worker_prefix}:once")
+            if job is None:
+                return False
+            process_job(db, job, self.analyze, self.persist)
+            return True
+        finally:
+            db.close()
+
+    def _run(self, worker_id: str):
+        while not self._stop.is_set():
+            try:
+                processed = self.run_once(worker_id)
+            except Exception:
+                logger.exception("Job worker %s crashed while processing a job", worker_id)
+                processed = False
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+if __name__ == "__main__":
+    import argparse
+    from db import SessionLocal
+    from analysis import analyze_image_shared
+    from persistence import persist_analysis
+
+    parser = argparse.ArgumentParser(description="Photoword analysis worker")
+    parser.add_argument("--concurrency", type=int, default=2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pool = JobWorkerPool(SessionLocal, analyze_image_shared, persist_analysis, concurrency=args.concurrency)
+    pool.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,335 @@
+"""
+Concurrent-session load test for the Photoword Streamlit app.
+
+Drives ``main.py`` through Streamlit's ``AppTest`` with N simulated sessions that
+upload photos, search and paginate against the fake model backend, and reports
+p50/p95/p99 latency and error rate per action plus SQLite lock waits as the
+number of concurrent sessions grows.
+
+``AppTest`` keeps a process-wide runtime and cannot run several sessions in one
+process, so every session runs in its own process against the shared database
+while the analysis worker pool runs in the harness process (the same layout as
+``PHOTOWORD_WORKER_MODE=external``).
+
+Limitation: ``AppTest`` cannot drive ``st.file_uploader`` (Streamlit 1.41 has
+no test API for it), so the ``upload`` action enqueues the job with
+``enqueue_analysis`` directly instead of through the script's upload path.
+It measures queueing, analysis and persistence plus the rerun that shows the
+result; the script's own upload handling (size check, hashing, budget check)
+is not exercised.
+
+With ``--cassette`` the model calls are replayed from a recorded cassette (see
+cassette.py) instead of the fake backend, with the recorded latencies unless
+``--replay-latency zero`` is given.
+
+Usage:
+    python loadtest.py --sessions 1 4 8 16 --iterations 5 --latency 1.0
+    python loadtest.py --cassette cassettes/restaurant.jsonl
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "main.py")
+TEST_IMAGE = os.path.join(APP_DIR, "test_image", "test1_restaurant.jpg")
+SEARCH_TERMS = ["mesa", "silla", "ventana", "テーブル", "窓", "comer"]
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+LOCK_WAIT_THRESHOLD = 0.05
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of ``values`` (q in 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class Metrics:
+    """Thread-safe collection of per-action timings and errors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.cache_counts: Dict[str, int] = defaultdict(int)
+
+    def merge(self, timings: Dict[str, List[float]], errors: Dict[str, int], prefetch: Optional[dict] = None):
+        """Add the results reported by a session process."""
+        with self._lock:
+            for action, values in timings.items():
+                self.timings[action].extend(values)
+            for action, count in errors.items():
+                self.errors[action] += count
+            if prefetch:
+                self.cache_counts["page_hits"] += prefetch["page_hits"]
+                self.cache_counts["page_misses"] += prefetch["page_misses"]
+                self.cache_counts["image_hits"] += prefetch["images"]["hits"]
+                self.cache_counts["image_misses"] += prefetch["images"]["misses"]
+                self.cache_counts["prefetches"] += prefetch["completed"]
+
+    def measure(self, action: str, fn: Callable[[], bool]):
+        """Time ``fn``; it returns False (or raises) to signal an error."""
+        start = time.perf_counter()
+        try:
+            ok = fn()
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.timings[action].append(elapsed)
+            if not ok:
+                self.errors[action] += 1
+
+
+class DbMonitor:
+    """Collect statement timings and lock errors from SQLAlchemy engine events."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self._lock = threading.Lock()
+        self.statements = 0
+        self.write_times: List[float] = []
+        self.lock_errors = 0
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+        event.listen(engine, "handle_error", self._error)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("loadtest_start", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["loadtest_start"].pop()
+        with self._lock:
+            self.statements += 1
+            if statement.lstrip().upper().startswith(WRITE_PREFIXES):
+                self.write_times.append(elapsed)
+
+    def _error(self, context):
+        start = context.connection.info.get("loadtest_start") if context.connection is not None else None
+        if start:
+            start.pop()
+        if "database is locked" in str(context.original_exception):
+            with self._lock:
+                self.lock_errors += 1
+
+    def reset(self):
+        with self._lock:
+            self.statements = 0
+            self.write_times = []
+            self.lock_errors = 0
+
+    def merge(self, statements: int, write_times: List[float], lock_errors: int):
+        """Add the statistics reported by a session process."""
+        with self._lock:
+            self.statements += statements
+            self.write_times.extend(write_times)
+            self.lock_errors += lock_errors
+
+
+def setup_environment(workdir: str, latency: float):
+    """Point the app at the fake model and the load-test database."""
+    os.environ.update({
+        "PHOTOWORD_MODEL_BACKEND": "fake",
+        "PHOTOWORD_FAKE_LATENCY": str(latency),
+        "PHOTOWORD_IMAGE_SERVER": "off",
+        "PHOTOWORD_WORKER_MODE": "external",
+    })
+    # db.py uses a relative SQLite path, so run against a scratch directory
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+
+    import logging
+    from db import get_engine
+
+    engine = get_engine()
+    engine.echo = False
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+    return engine
+
+
+def unique_image(base: bytes, tag: str) -> bytes:
+    """Make the image unique so uploads are not coalesced; JPEG ignores trailing bytes."""
+    return base + f"loadtest:{tag}:{random.random()}".encode()
+
+
+def upload(user_id: int, image_data: bytes, timeout: float) -> bool:
+    """
+    Enqueue an analysis the way the upload widget does and wait until it is saved.
+
+    Bypasses main.py, whose file uploader AppTest cannot drive (see the module docstring).
+    """
+    from db import SessionLocal
+    from jobs import enqueue_analysis, get_job_statuses
+
+    db = SessionLocal()
+    try:
+        job_id = enqueue_analysis(db, user_id, image_data).id
+    finally:
+        db.close()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = SessionLocal()
+        try:
+            status = get_job_statuses(db, [job_id])[0].status
+        finally:
+            db.close()
+        if status == "done":
+            return True
+        if status == "failed":
+            return False
+        time.sleep(0.05)
+    return False
+
+
+def run_session(session_no: int, iterations: int, base_image: bytes, timeout: float, workdir: str, latency: float, start_event, results):
+    """Simulate one browser session in its own process and report its measurements."""
+    engine = setup_environment(workdir, latency)
+    monitor = DbMonitor(engine)
+    metrics = Metrics()
+
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    start_event.wait()
+    metrics.measure("initial_load", lambda: not at.run().exception)
+    user_id = at.session_state["user_id"]
+
+    for i in range(iterations):
+        image_data = unique_image(base_image, f"{session_no}:{i}")
+        metrics.measure("upload", lambda: upload(user_id, image_data, timeout) and not at.run().exception)
+        term = random.choice(SEARCH_TERMS)
+        metrics.measure("search", lambda: not at.text_input(key="search_term").input(term).run().exception)
+        metrics.measure("clear_search", lambda: not at.text_input(key="search_term").input("").run().exception)
+        page = random.randint(1, 3)
+        metrics.measure("paginate", lambda: not at.number_input(key="page_number").set_value(page).run().exception)
+
+    from prefetch import prefetch_stats
+
+    results.put((
+        dict(metrics.timings), dict(metrics.errors), monitor.statements, monitor.write_times, monitor.lock_errors,
+        prefetch_stats()
+    ))
+
+
+def run_level(sessions: int, iterations: int, base_image: bytes, timeout: float, workdir: str, latency: float, monitor: DbMonitor) -> Metrics:
+    """Run ``sessions`` concurrent session processes and collect their results."""
+    context = multiprocessing.get_context("spawn")
+    start_event = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=run_session,
+            args=(n, iterations, base_image, timeout, workdir, latency, start_event, results)
+        )
+        for n in range(sessions)
+    ]
+    for process in processes:
+        process.start()
+    # Release all sessions at once after they finished importing
+    time.sleep(1.0)
+    start_event.set()
+
+    metrics = Metrics()
+    for _ in processes:
+        timings, errors, statements, write_times, lock_errors, prefetch = results.get()
+        metrics.merge(timings, errors, prefetch)
+        monitor.merge(statements, write_times, lock_errors)
+    for process in processes:
+        process.join()
+    return metrics
+
+
+def print_report(sessions: int, wall: float, metrics: Metrics, monitor: DbMonitor):
+    print(f"\n=== {sessions} concurrent session(s), {wall:.1f}s wall time ===")
+    print(f"{'action':<14}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}")
+    for action, timings in metrics.timings.items():
+        errors = metrics.errors.get(action, 0)
+        print(
+            f"{action:<14}{len(timings):>7}"
+            f"{percentile(timings, 50) * 1000:>10.1f}"
+            f"{percentile(timings, 95) * 1000:>10.1f}"
+            f"{percentile(timings, 99) * 1000:>10.1f}"
+            f"{errors / len(timings):>8.1%}"
+        )
+    writes = monitor.write_times
+    waits = [t for t in writes if t > LOCK_WAIT_THRESHOLD]
+    print(
+        f"db: {monitor.statements} statements, {len(writes)} writes, "
+        f"write p95 {percentile(writes, 95) * 1000:.1f} ms, "
+        f"{len(waits)} writes waited >{LOCK_WAIT_THRESHOLD * 1000:.0f} ms (total {sum(waits):.2f}s), "
+        f"{monitor.lock_errors} 'database is locked' errors"
+    )
+    counts = metrics.cache_counts
+    if counts:
+        page_lookups = counts["page_hits"] + counts["page_misses"]
+        image_lookups = counts["image_hits"] + counts["image_misses"]
+        print(
+            f"cache: page hit rate {counts['page_hits'] / max(1, page_lookups):.0%} of {page_lookups}, "
+            f"image hit rate {counts['image_hits'] / max(1, image_lookups):.0%} of {image_lookups}, "
+            f"{counts['prefetches']} prefetches"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Photoword concurrent-session load test")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="Concurrency levels to run")
+    parser.add_argument("--iterations", type=int, default=3, help="Upload/search/paginate rounds per session")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake model latency in seconds")
+    parser.add_argument("--workers", type=int, default=2, help="Analysis worker threads")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout per action in seconds")
+    parser.add_argument("--workdir", help="Directory for the load-test database (default: a temp dir)")
+    parser.add_argument("--cassette", help="Replay model calls from this cassette instead of the fake backend")
+    parser.add_argument("--replay-latency", choices=["recorded", "zero"], default="recorded", help="Delay of replayed calls")
+    args = parser.parse_args()
+
+    if args.cassette:
+        # Set before the session processes are spawned so that they inherit it
+        os.environ.update({
+            "PHOTOWORD_CASSETTE": os.path.abspath(args.cassette),
+            "PHOTOWORD_CASSETTE_MODE": "replay",
+            "PHOTOWORD_REPLAY_LATENCY": args.replay_latency,
+            # Uploads are made unique, so match recordings by prompt rather than by image
+            "PHOTOWORD_CASSETTE_MATCH": "loose",
+        })
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="photoword-loadtest-"))
+    engine = setup_environment(workdir, args.latency)
+
+    from db import Base, SessionLocal
+    from jobs import JobWorkerPool
+    from analysis import analyze_image_shared
+    from persistence import persist_analysis
+
+    Base.metadata.create_all(bind=engine)
+    monitor = DbMonitor(engine)
+    pool = JobWorkerPool(SessionLocal, analyze_image_shared, persist_analysis, concurrency=args.workers, poll_interval=0.05)
+    pool.start()
+
+    with open(TEST_IMAGE, "rb") as f:
+        base_image = f.read()
+
+    # DATABASE_URL may point at a PostgreSQL server shared by all session processes
+    database = os.path.join(workdir, "photoword.db") if engine.dialect.name == "sqlite" else engine.url.render_as_string()
+    print(f"database: {database}")
+    for sessions in args.sessions:
+        monitor.reset()
+        start = time.perf_counter()
+        metrics = run_level(sessions, args.iterations, base_image, args.timeout, workdir, args.latency, monitor)
+        print_report(sessions, time.perf_counter() - start, metrics, monitor)
+    pool.stop(timeout=args.timeout)
+
+
+if __name__ == "__main__":
+    main()
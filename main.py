@@ -1,199 +1,266 @@
 import streamlit as st
-import boto3
-import base64
-import hashlib
 import os
-import json
-import re
-from typing import List
-from datetime import datetime
-from models import SpanishVocabulary, ImageVocabularyResponse
+import logging
+from typing import Optional
+# analyze_image_core is re-exported for test_analyze_image_core.py
+from analysis import analyze_image_core, analyze_image_shared
+from persistence import get_or_create_user, persist_analysis
 from db import SessionLocal
-from models_db import User, Image, VocabularyEntry
+from jobs import JobWorkerPool, enqueue_analysis, get_active_job_ids, get_job_statuses
 from sqlalchemy.orm import Session
-from timeline import TimelineEntry, get_timeline_entries
+from timeline import TimelineEntry, get_image_data
+from timeline_cache import timeline_cache, get_user_version
+from image_server import start_image_server, make_thumbnail, load_image_cached
+from prefetch import prefetch_after_render
+from fuzzy_search import vocabulary_index
+from upload_pipeline import check_upload_size, hash_stream, UploadTooLargeError
+from profiling import profile, profiling_requested
+from usage import check_budget, BudgetExceededError
 
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-east-1',
-    aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
-    aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"]
-)
+logger = logging.getLogger(__name__)
 
-def encode_image_data(image_data):
+@st.cache_resource
+def get_worker_pool():
     """
-    Encode image data to base64.
-    
-    Args:
-        image_data: Binary image data from uploaded file
-        
-    Returns:
-        str: Base64 encoded image data
+    Start the process-wide analysis worker pool.
+
+    Returns None when PHOTOWORD_WORKER_MODE=external, in which case jobs are
+    processed by a separate ``python jobs.py`` worker process.
     """
-    return base64.b64encode(image_data).decode('utf-8')
+    if os.environ.get("PHOTOWORD_WORKER_MODE") == "external":
+        return None
+    pool = JobWorkerPool(
+        SessionLocal,
+        analyze_image_shared,
+        persist_analysis,
+        concurrency=int(os.environ.get("PHOTOWORD_WORKER_CONCURRENCY", "2"))
+    )
+    pool.start()
+    return pool
+
+@st.fragment(run_every=1.0)
+def render_job_status():
+    """Poll the pending analysis jobs and rerun the app when one finishes."""
+    db = SessionLocal()
+    try:
+        jobs = get_job_statuses(db, st.session_state.pending_job_ids)
+    finally:
+        db.close()
 
-def analyze_image_core(image_data: bytes) -> List[SpanishVocabulary]:
+    if record_finished_jobs(jobs):
+        st.rerun()
+
+def record_finished_jobs(jobs) -> bool:
     """
-    Core function to analyze image using Claude Haiku via AWS Bedrock.
-    This function is independent of any UI framework.
-    
-    Args:
-        image_data: Binary image data
-        
+    Update the session state for finished jobs and show the progress of the others.
+
     Returns:
-        list[SpanishVocabulary]: A list of Spanish vocabulary words found in the image
-        
-    Raises:
-        ValueError: If structured data parsing fails
-        TimeoutError: If the request times out
-        Exception: For any other unexpected errors
+        bool: True if a job finished, so the app should rerun
     """
-    base64_image = encode_image_data(image_data)
-    
-    prompt = """
-上記の写真をスペイン語で表現したいというスペイン語学習者がいます。
-
-あなたは上記の画像に写っている状況を説明するのに必要なスペイン語の単語や表現のリストを作ってあげてください。上記の写真に写っているものの名前などを、スペイン語・品詞・日本語・スペイン語例文の４つのデータのセットとして列挙してほしいです。
+    finished = False
+    for job in jobs:
+        if job.status == "done":
+            # Saving the result bumped the user's data version, so the rerun shows it
+            finished = True
+        elif job.status == "failed":
+            finished = True
+            # Not resubmitted automatically: an image that always fails would loop on paid model calls
+            st.session_state.failed_images[job.image_hash] = job.error or ""
+            if st.session_state.processed_image_hash == job.image_hash:
+                st.session_state.processed_image_hash = None
+        elif job.attempts > 1:
+            st.info(f"画像を解析中です... (再試行 {job.attempts}/{job.max_attempts})")
+        else:
+            st.info("画像を解析中です...")
 
-以下のようなデータ構成でリストを作ってください。(配列の中に、さらに４つの属性を持つデータとして作ってください。)
-{
-    "vocabulary": [{
-        "word": "スペイン語の単語",
-        "part_of_speech": "品詞（必ず「名詞」「動詞」「形容詞」「副詞」のなどを指定）",
-        "translation": "日本語訳",
-        "example_sentence": "その単語を使用したスペイン語の例文（必ず完全な文を記載）"
-    }]
-}
+    if finished:
+        st.session_state.pending_job_ids = [
+            job.id for job in jobs if job.status not in ("done", "failed")
+        ]
+    return finished
 
-重要な注意点：
-1. 各単語について、必ず4つの情報（word, part_of_speech, translation, example_sentence）を含めてください
-2. 例文は必ず完全な文で記載してください
-3. JSONの形式を厳密に守ってください
-"""
-    
-    try:
-        response = bedrock.invoke_model(
-            modelId="anthropic.claude-3-haiku-20240307-v1:0",
-            body=json.dumps({
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1000,
-                "temperature": 0,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "image/jpeg",
-                                    "data": base64_image
-                                }
-                            },
-                            {
-                                "type": "text",
-                                "text": prompt
-                            }
-                        ]
-                    }
-                ]
-            })
-        )
-        
-        response_body = json.loads(response.get('body').read())
-        response_text = response_body['content'][0]['text']
-        
-        # Extract JSON from response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if not json_match:
-            raise ValueError("No JSON found in response")
-            
-        json_str = json_match.group()
-        data = json.loads(json_str)
-        
-        # Convert to SpanishVocabulary objects
-        vocab_list = []
-        for item in data.get("vocabulary", []):
-            vocab = SpanishVocabulary(
-                word=item["word"],
-                part_of_speech=item["part_of_speech"],
-                translation=item["translation"],
-                example_sentence=item["example_sentence"]
-            )
-            vocab_list.append(vocab)
-        
-        return vocab_list
-    except Exception as e:
-        st.error(f"画像分析中にエラーが発生しました: {str(e)}")
-        raise
+def retry_failed_image(image_hash: str):
+    """Allow a failed image to be analyzed again on the next rerun."""
+    st.session_state.failed_images.pop(image_hash, None)
 
-def analyze_image(image_data: bytes) -> list[SpanishVocabulary]:
+def submit_upload(db: Session, user_id: int, uploaded_file, worker_pool: Optional[JobWorkerPool]) -> Optional[str]:
     """
-    Analyze image using Google's Gemini model via Langchain.
-    This function wraps analyze_image_core with Streamlit UI feedback.
-    
-    Args:
-        image_data: Binary image data from uploaded file
-        
+    Queue an uploaded image for analysis unless it was already submitted.
+
+    An image whose analysis failed is only queued again when the user presses
+    "再試行" or uploads it anew.
+
     Returns:
-        list[SpanishVocabulary]: A list of Spanish vocabulary words found in the image
+        Optional[str]: sha256 of the upload, or None if it was rejected
     """
     try:
-        vocab = analyze_image_core(image_data)
-        if not vocab:
-            st.warning("画像から単語を抽出できませんでした。別の画像を試してください。")
-        return vocab
-    except ValueError as e:
-        st.error("構造化データの解析に失敗しました。もう一度お試しください。")
-        return []
-    except TimeoutError as e:
-        st.error("画像解析がタイムアウトしました。もう一度お試しください。")
-        return []
-    except Exception as e:
-        st.error(f"予期せぬエラーが発生しました: {str(e)}")
-        return []
+        check_upload_size(uploaded_file.size)
+    except UploadTooLargeError as e:
+        st.error(f"画像が大きすぎます（上限 {e.limit // (1024 * 1024)}MB）。サイズを小さくしてからアップロードしてください。")
+        return None
+    current_hash = hash_stream(uploaded_file)
+    if current_hash in st.session_state.failed_images:
+        st.error(f"画像の解析に失敗しました。({st.session_state.failed_images[current_hash]})")
+        st.button("再試行", key="retry_btn", on_click=retry_failed_image, args=(current_hash,))
+    # Only process if this image hash is different from the last processed
+    elif st.session_state.processed_image_hash != current_hash:
+        try:
+            check_budget(db, user_id)
+        except BudgetExceededError:
+            st.error("本日の画像解析の利用上限に達しました。明日もう一度お試しください。")
+        else:
+            image_data = uploaded_file.getvalue()
+            # Preview a thumbnail so the full-size upload is not kept by the media store
+            st.image(make_thumbnail(image_data), use_container_width=True)
+            # Analysis and saving run in the background so reruns cannot abort them
+            job = enqueue_analysis(db, user_id, image_data, image_hash=current_hash)
+            if job.id not in st.session_state.pending_job_ids:
+                st.session_state.pending_job_ids.append(job.id)
+            if worker_pool is not None:
+                worker_pool.notify()
+            st.session_state.processed_image_hash = current_hash
+    elif not st.session_state.pending_job_ids:
+        st.warning("この画像は既に処理済みです。")
+    return current_hash
 
-def get_or_create_user(db: Session, username: str = "test_user") -> User:
-    """Get or create a test user for development."""
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        user = User(username=username)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    return user
+@st.cache_resource
+def get_image_base_url() -> Optional[str]:
+    """
+    Start the content-addressed image server once per process.
 
-def save_image(db: Session, user_id: int, image_data: bytes) -> Image:
-    """Save uploaded image to database."""
+    The server is only used when PHOTOWORD_IMAGE_BASE_URL says where browsers
+    reach it (typically a path on the reverse proxy in front of Streamlit); a
+    localhost default would break every browser not running on the server.
+    Returns that base URL, or None to send image bytes inline (also when
+    PHOTOWORD_IMAGE_SERVER=off).
+    """
+    base_url = os.environ.get("PHOTOWORD_IMAGE_BASE_URL")
+    if not base_url or os.environ.get("PHOTOWORD_IMAGE_SERVER") == "off":
+        return None
+    port = int(os.environ.get("PHOTOWORD_IMAGE_PORT", "8502"))
+    address = os.environ.get("PHOTOWORD_IMAGE_BIND", "127.0.0.1")
     try:
-        image = Image(user_id=user_id, image_data=image_data)
-        db.add(image)
-        db.commit()
-        db.refresh(image)
-        return image
-    except Exception as e:
-        db.rollback()
-        st.error(f"画像の保存中にエラーが発生しました: {str(e)}")
-        raise
+        start_image_server(SessionLocal, port, address=address)
+    except OSError as e:
+        logger.warning("Image server could not listen on %s:%d, sending images inline: %s", address, port, e)
+        return None
+    return base_url.rstrip("/")
 
-def save_vocabulary(db: Session, user_id: int, image_id: int, vocab_items: List[SpanishVocabulary]):
-    """Save vocabulary entries to database."""
-    try:
-        for item in vocab_items:
-            vocab_entry = VocabularyEntry(
-                user_id=user_id,
-                image_id=image_id,
-                spanish_word=item.word,
-                part_of_speech=item.part_of_speech,
-                japanese_translation=item.translation,
-                example_sentence=item.example_sentence
+MAX_EXPANDED_ENTRIES = 3
+SCROLL_WINDOW_PAGES = 2
+
+def toggle_entry_expanded(entry_id: int):
+    """Expand or collapse a timeline entry, keeping at most MAX_EXPANDED_ENTRIES open."""
+    expanded = st.session_state.expanded_entry_ids
+    if entry_id in expanded:
+        expanded.remove(entry_id)
+    else:
+        expanded.append(entry_id)
+        # Collapse the oldest entries so the images sent per rerun stay bounded
+        del expanded[:-MAX_EXPANDED_ENTRIES]
+
+def shift_scroll_window(delta: int):
+    """Load more (or go back to earlier) entries in scroll mode."""
+    st.session_state.scroll_loaded = max(st.session_state.page_size, st.session_state.scroll_loaded + delta)
+
+def show_entry_detail(entry_id: Optional[int]):
+    """Open the detail view for an entry, or close it with None."""
+    st.session_state["show_detail"] = entry_id
+
+def render_timeline_entry(db: Session, entry: TimelineEntry):
+    """
+    Render one timeline entry.
+
+    Collapsed entries are a one-line placeholder. Expanded entries show a thumbnail
+    and the detail view the full image, both referenced by content-addressed URLs
+    so the browser caches them. Without the image server, bytes are loaded through
+    the process-wide image cache and sent inline only for expanded entries or the
+    open detail view.
+    """
+    expanded = entry.id in st.session_state.expanded_entry_ids
+    show_detail = st.session_state["show_detail"] == entry.id
+    base_url = get_image_base_url()
+    if base_url and entry.image_hash:
+        thumbnail = f"{base_url}/thumbnails/{entry.image_hash}"
+        full_image = f"{base_url}/images/{entry.image_hash}"
+    elif entry.image_hash and (expanded or show_detail):
+        thumbnail = load_image_cached(db, entry.image_hash, thumbnail=True) if expanded and not show_detail else None
+        full_image = load_image_cached(db, entry.image_hash, thumbnail=False) if show_detail else None
+    elif expanded or show_detail:
+        thumbnail = full_image = get_image_data(db, entry.id)
+    else:
+        thumbnail = full_image = None
+
+    with st.container(border=True):
+        header_col, toggle_col = st.columns([5, 1])
+        with header_col:
+            words = " / ".join(vocab.spanish_word for vocab in entry.vocabulary_entries)
+            st.markdown(f"**📸 {entry.created_at.strftime('%Y年%m月%d日 %H:%M')}**　{words}")
+        with toggle_col:
+            st.button(
+                "閉じる" if expanded else "開く",
+                key=f"toggle_btn_{entry.id}",
+                on_click=toggle_entry_expanded,
+                args=(entry.id,)
             )
-            db.add(vocab_entry)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        st.error(f"単語の保存中にエラーが発生しました: {str(e)}")
-        raise
+
+        if expanded:
+            # Create columns for image, vocabulary, and detail button
+            img_col, vocab_col, btn_col = st.columns([2, 3, 1])
+            
+            # Display image in left column unless the detail view already shows it
+            with img_col:
+                if thumbnail is not None and not show_detail:
+                    st.image(thumbnail, use_container_width=True)
+            
+            # Display vocabulary items in middle column
+            with vocab_col:
+                for vocab in entry.vocabulary_entries:
+                    markdown_text = f"""
+                    ### {vocab.spanish_word}
+                    - 📚 [{vocab.part_of_speech}] {vocab.japanese_translation}
+                    - 💭 {vocab.example_sentence}
+                    ---
+                    """
+                    st.markdown(markdown_text)
+            
+            # Add detail view button in right column
+            with btn_col:
+                st.button(
+                    "詳細を表示",
+                    key=f"detail_btn_{entry.id}",
+                    on_click=show_entry_detail,
+                    args=(entry.id,)
+                )
+    
+    # Show detail modal if this entry is selected
+    if show_detail:
+        with st.container():
+            st.markdown("---")
+            st.markdown("## 📝 詳細表示")
+            
+            # Display full-size image
+            if full_image is not None:
+                st.image(full_image, use_container_width=True)
+            
+            # Display comprehensive vocabulary information
+            st.markdown("### 📚 単語リスト")
+            for vocab in entry.vocabulary_entries:
+                st.markdown(f"""
+                #### {vocab.spanish_word}
+                - **品詞**: {vocab.part_of_speech}
+                - **日本語**: {vocab.japanese_translation}
+                - **例文**: {vocab.example_sentence}
+                """)
+            
+            # Add close button
+            st.button(
+                "閉じる",
+                key=f"close_btn_{entry.id}",
+                on_click=show_entry_detail,
+                args=(None,)
+            )
+            st.markdown("---")
 
 def main():
     """
@@ -206,12 +273,26 @@ def main():
     # Initialize session state for tracking processed images
     if "processed_image_hash" not in st.session_state:
         st.session_state.processed_image_hash = None
+    if "pending_job_ids" not in st.session_state:
+        st.session_state.pending_job_ids = []
+    if "failed_images" not in st.session_state:
+        # sha256 of each failed image -> error message
+        st.session_state.failed_images = {}
+    
+    # Start background workers (no-op after the first session)
+    worker_pool = get_worker_pool()
+    # Load the typo-tolerant search index off the rerun path (no-op once loading)
+    vocabulary_index.warm_in_background(SessionLocal)
     
-    # Initialize database session
+    # Database session of this rerun, closed when it ends
     db = SessionLocal()
     try:
-        # Get or create test user
-        user = get_or_create_user(db)
+        # Get or create test user once per session
+        if "user_id" not in st.session_state:
+            st.session_state.user_id = get_or_create_user(db).id
+            # Pick up jobs that are still running from before a refresh or restart
+            st.session_state.pending_job_ids = get_active_job_ids(db, st.session_state.user_id)
+        user_id = st.session_state.user_id
         
         # File uploader widget
         uploaded_file = st.file_uploader(
@@ -221,26 +302,16 @@ def main():
         )
         
         # Display uploaded image and analyze
+        current_hash = None
         if uploaded_file is not None:
-            image_data = uploaded_file.getvalue()
-            current_hash = hashlib.md5(image_data).hexdigest()
-            # Only process if this image hash is different from the last processed
-            if st.session_state.processed_image_hash != current_hash:
-                st.image(uploaded_file, use_container_width=True)
-                vocab_list = analyze_image(image_data)
-                
-                if vocab_list:
-                    # Save image and vocabulary to database
-                    image = save_image(db, user.id, image_data)
-                    save_vocabulary(db, user.id, image.id, vocab_list)
-                    # Mark as processed
-                    st.session_state.processed_image_hash = current_hash
-                    # Clear file uploader by triggering a rerun
-                    st.rerun()
-                else:
-                    st.write("単語を抽出できませんでした。")
-            else:
-                st.warning("この画像は既に処理済みです。")
+            current_hash = submit_upload(db, user_id, uploaded_file, worker_pool)
+        
+        # Report failures of images no longer selected once; uploading them again starts a new job
+        for image_hash in [h for h in st.session_state.failed_images if h != current_hash]:
+            error = st.session_state.failed_images.pop(image_hash)
+            st.error(f"画像の解析に失敗しました。もう一度お試しください。({error})")
+        if st.session_state.pending_job_ids:
+            render_job_status()
         
         # Display timeline entries with styling
         st.markdown("## 📸 タイムライン")
@@ -256,6 +327,8 @@ def main():
             st.session_state.page_size = 5
         if "page_number" not in st.session_state:
             st.session_state.page_number = 1
+        if "view_mode" not in st.session_state:
+            st.session_state.view_mode = "ページ"
 
         # Add search and date filter widgets with better styling
         st.markdown("### 🔍 フィルター")
@@ -285,101 +358,106 @@ def main():
         st.markdown("### 📄 ページ設定")
         pagination_container = st.container()
         with pagination_container:
-            col1, col2 = st.columns([1, 3])
+            col1, col2, col3 = st.columns([1, 1, 2])
             with col1:
+                st.radio(
+                    "表示モード",
+                    options=["ページ", "スクロール"],
+                    key="view_mode",
+                    horizontal=True
+                )
+            with col2:
                 st.selectbox(
                     "表示件数",
                     options=[5, 10, 20],
                     key="page_size"
                 )
-            with col2:
-                st.number_input(
-                    "ページ番号",
-                    min_value=1,
-                    step=1,
-                    key="page_number"
-                )
-        skip = (st.session_state.page_number - 1) * st.session_state.page_size
-        
-        # Get timeline entries with search
-        timeline_entries = get_timeline_entries(
-            db,
-            user.id,
-            skip=skip,
-            limit=st.session_state.page_size,
+            with col3:
+                if st.session_state.view_mode == "ページ":
+                    st.number_input(
+                        "ページ番号",
+                        min_value=1,
+                        step=1,
+                        key="page_number"
+                    )
+        filters = dict(
             start_date=st.session_state.start_date if st.session_state.start_date else None,
             end_date=st.session_state.end_date if st.session_state.end_date else None,
             search_term=st.session_state.search_term if st.session_state.search_term else None
         )
+        page_size = st.session_state.page_size
+        # Read once per rerun; the cached pages of every process are keyed by it
+        data_version = get_user_version(db, user_id)
         
         # Initialize detail view state
         if "show_detail" not in st.session_state:
             st.session_state["show_detail"] = None
+        if "expanded_entry_ids" not in st.session_state:
+            st.session_state.expanded_entry_ids = []
+        
+        # Get timeline entries with search (cached until the user's data changes)
+        if st.session_state.view_mode == "スクロール":
+            # Only a sliding window of the loaded entries is rendered
+            filter_key = (filters["start_date"], filters["end_date"], filters["search_term"], page_size)
+            if st.session_state.get("scroll_filter_key") != filter_key:
+                st.session_state.scroll_filter_key = filter_key
+                st.session_state.scroll_loaded = page_size
+            window_start = max(0, st.session_state.scroll_loaded - SCROLL_WINDOW_PAGES * page_size)
+            if window_start > 0:
+                st.button(
+                    "⬆ 前のエントリーを表示",
+                    key="scroll_back_btn",
+                    on_click=shift_scroll_window,
+                    args=(-page_size,)
+                )
+            timeline_entries = []
+            has_more = True
+            for chunk_skip in range(window_start, st.session_state.scroll_loaded, page_size):
+                chunk = timeline_cache.get_entries(db, user_id, skip=chunk_skip, limit=page_size, version=data_version, **filters)
+                timeline_entries.extend(chunk)
+                has_more = len(chunk) == page_size
+            next_skip = st.session_state.scroll_loaded if has_more else None
+        else:
+            skip = (st.session_state.page_number - 1) * page_size
+            timeline_entries = timeline_cache.get_entries(db, user_id, skip=skip, limit=page_size, version=data_version, **filters)
+            has_more = False
+            next_skip = skip + page_size if len(timeline_entries) == page_size else None
 
         # Display timeline entries with improved styling
         if timeline_entries:
             for entry in timeline_entries:
-                with st.expander(
-                    f"📸 {entry.created_at.strftime('%Y年%m月%d日 %H:%M')}",
-                    expanded=True
-                ):
-                    # Create columns for image, vocabulary, and detail button
-                    img_col, vocab_col, btn_col = st.columns([2, 3, 1])
-                    
-                    # Display image in left column
-                    with img_col:
-                        st.image(entry.image_data, use_container_width=True)
-                    
-                    # Display vocabulary items in middle column
-                    with vocab_col:
-                        for vocab in entry.vocabulary_entries:
-                            markdown_text = f"""
-                            ### {vocab.spanish_word}
-                            - 📚 [{vocab.part_of_speech}] {vocab.japanese_translation}
-                            - 💭 {vocab.example_sentence}
-                            ---
-                            """
-                            st.markdown(markdown_text)
-                    
-                    # Add detail view button in right column
-                    with btn_col:
-                        if st.button("詳細を表示", key=f"detail_btn_{entry.id}"):
-                            st.session_state["show_detail"] = entry.id
-                
-                # Show detail modal if this entry is selected
-                if st.session_state["show_detail"] == entry.id:
-                    with st.container():
-                        st.markdown("---")
-                        st.markdown("## 📝 詳細表示")
-                        
-                        # Display full-size image
-                        st.image(entry.image_data, use_container_width=True)
-                        
-                        # Display comprehensive vocabulary information
-                        st.markdown("### 📚 単語リスト")
-                        for vocab in entry.vocabulary_entries:
-                            st.markdown(f"""
-                            #### {vocab.spanish_word}
-                            - **品詞**: {vocab.part_of_speech}
-                            - **日本語**: {vocab.japanese_translation}
-                            - **例文**: {vocab.example_sentence}
-                            """)
-                        
-                        # Add close button
-                        if st.button("閉じる", key=f"close_btn_{entry.id}"):
-                            st.session_state["show_detail"] = None
-                        st.markdown("---")
+                render_timeline_entry(db, entry)
+            if has_more:
+                st.button(
+                    "さらに読み込む",
+                    key="scroll_more_btn",
+                    on_click=shift_scroll_window,
+                    args=(page_size,)
+                )
         else:
             st.info("表示するエントリーがありません。新しい画像をアップロードしてください。")
+
+        # Load the next page and the images the user may open next in the background
+        prefetch_after_render(
+            user_id,
+            data_version,
+            next_skip,
+            page_size,
+            filters,
+            visible_hashes=[entry.image_hash for entry in timeline_entries if entry.image_hash],
+            expanded_hashes=[
+                entry.image_hash for entry in timeline_entries
+                if entry.image_hash and entry.id in st.session_state.expanded_entry_ids
+            ]
+        )
     except Exception as e:
         st.error(f"エラーが発生しました: {str(e)}")
         raise
+    finally:
+        # Every rerun opens a session; return its connection to the pool
+        db.close()
 
 
 if __name__ == "__main__":
-    try:
+    with profile("rerun", enabled=profiling_requested(st.query_params.get("profile"))):
         main()
-    finally:
-        # Ensure database session is closed
-        if 'db' in locals():
-            db.close()
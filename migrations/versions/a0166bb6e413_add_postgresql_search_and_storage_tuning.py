@@ -0,0 +1,55 @@
+"""Add PostgreSQL trigram search indexes and bytea storage settings
+
+Revision ID: a0166bb6e413
+Revises: 33a2f8ed6f1d
+Create Date: 2026-10-19 01:05:42.310274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a0166bb6e413'
+down_revision: Union[str, None] = '33a2f8ed6f1d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Image bytes are already compressed (JPEG/PNG/WebP); storing them EXTERNAL skips
+# TOAST's compression attempt on every write
+BINARY_COLUMNS = [
+    ('images', 'image_data'),
+    ('images', 'thumbnail_data'),
+    ('analysis_jobs', 'image_data'),
+]
+
+# The timeline search runs ILIKE '%term%', which only a trigram index can serve
+TRIGRAM_INDEXES = [
+    ('ix_vocabulary_entries_spanish_word_trgm', 'spanish_word'),
+    ('ix_vocabulary_entries_japanese_translation_trgm', 'japanese_translation'),
+]
+
+
+def upgrade() -> None:
+    # PostgreSQL only; SQLite has neither setting
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, column in BINARY_COLUMNS:
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET STORAGE EXTERNAL')
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in TRIGRAM_INDEXES:
+        op.create_index(
+            name, 'vocabulary_entries', [column], unique=False,
+            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'}
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, column in TRIGRAM_INDEXES:
+        op.drop_index(name, table_name='vocabulary_entries')
+    for table, column in BINARY_COLUMNS:
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET STORAGE EXTENDED')
@@ -0,0 +1,59 @@
+"""Add vocabulary_entries.lemma_key for accent-aware known-word lookups
+
+Revision ID: cc7e35136c8b
+Revises: 5eea44fa8d61
+Create Date: 2026-10-19 02:41:53.902117
+
+"""
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cc7e35136c8b'
+down_revision: Union[str, None] = '5eea44fa8d61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 5000
+
+
+def normalize_lemma(word: str) -> str:
+    # Copy of word_knowledge.normalize_lemma at the time of this migration
+    return " ".join(unicodedata.normalize("NFC", word).lower().split())
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('vocabulary_entries') as batch_op:
+        batch_op.add_column(sa.Column('lemma_key', sa.String(), nullable=True))
+    # SQL lower() folds ASCII only, so the keys are computed in Python
+    conn = op.get_bind()
+    vocabulary = sa.table('vocabulary_entries', sa.column('id', sa.Integer), sa.column('spanish_word', sa.String), sa.column('lemma_key', sa.String))
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(vocabulary.c.id, vocabulary.c.spanish_word)
+            .where(vocabulary.c.id > last_id)
+            .order_by(vocabulary.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            vocabulary.update().where(vocabulary.c.id == sa.bindparam('row_id')).values(lemma_key=sa.bindparam('key')),
+            [{'row_id': row.id, 'key': normalize_lemma(row.spanish_word)} for row in rows]
+        )
+        last_id = rows[-1].id
+    op.drop_index('ix_vocabulary_entries_lower_spanish_word', table_name='vocabulary_entries')
+    op.create_index(op.f('ix_vocabulary_entries_lemma_key'), 'vocabulary_entries', ['lemma_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_vocabulary_entries_lemma_key'), table_name='vocabulary_entries')
+    with op.batch_alter_table('vocabulary_entries') as batch_op:
+        batch_op.drop_column('lemma_key')
+    # After the batch operation, which cannot copy expression indexes on SQLite
+    op.create_index('ix_vocabulary_entries_lower_spanish_word', 'vocabulary_entries', [sa.text('lower(spanish_word)')], unique=False)
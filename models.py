@@ -29,3 +29,34 @@ class ImageVocabularyResponse(BaseModel):
         description="抽出されたSpanishVocabularyのリスト",
         min_length=1
     )
+
+class AnalysisResult(BaseModel):
+    """画像解析の結果と呼び出し統計"""
+    vocabulary: List[SpanishVocabulary] = Field(
+        default_factory=list,
+        description="抽出されたSpanishVocabularyのリスト"
+    )
+    model_calls: int = Field(
+        default=0,
+        description="モデル呼び出しの回数"
+    )
+    continuation_calls: int = Field(
+        default=0,
+        description="途中で打ち切られた応答の続きを取得した呼び出しの回数"
+    )
+    calls_saved: int = Field(
+        default=0,
+        description="部分的な応答を再利用したことで不要になった再解析の回数"
+    )
+    cached_words: int = Field(
+        default=0,
+        description="単語知識キャッシュから詳細を再利用した単語の数"
+    )
+    input_tokens: int = Field(
+        default=0,
+        description="全呼び出しの入力トークン数の合計"
+    )
+    output_tokens: int = Field(
+        default=0,
+        description="全呼び出しの出力トークン数の合計"
+    )
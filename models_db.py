@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text, CheckConstraint, LargeBinary
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, CheckConstraint, LargeBinary, Float
 from sqlalchemy.sql import func
 from sqlalchemy.types import TIMESTAMP
 from db import Base
@@ -7,6 +7,8 @@ class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, nullable=False)
+    daily_budget_usd = Column(Float)  # Overrides PHOTOWORD_DAILY_BUDGET_USD when set
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped by timeline writes, see timeline_cache
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
 
 class Image(Base):
@@ -14,13 +16,23 @@ class Image(Base):
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     image_data = Column(LargeBinary)  # Using LargeBinary for image data
+    content_hash = Column(String, index=True)  # sha256 of image_data, used in image URLs
+    thumbnail_data = Column(LargeBinary)  # Generated on first thumbnail request
+    archived_at = Column(Float)  # Set when compaction re-encoded image_data; part of the image address (image_cache.image_address)
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
 
+def _lemma_key(context) -> str:
+    from word_knowledge import normalize_lemma
+
+    return normalize_lemma(context.get_current_parameters()["spanish_word"])
+
 class VocabularyEntry(Base):
     __tablename__ = "vocabulary_entries"
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     spanish_word = Column(String, nullable=False)
+    # normalize_lemma(spanish_word), set on insert; SQL lower() folds ASCII only ("Árbol")
+    lemma_key = Column(String, index=True, default=_lemma_key)
     part_of_speech = Column(String, nullable=False)
     japanese_translation = Column(String, nullable=False)
     example_sentence = Column(String, nullable=False)
@@ -34,3 +46,52 @@ class LearningProgress(Base):
     vocabulary_id = Column(Integer, ForeignKey("vocabulary_entries.id"))
     status = Column(String, CheckConstraint("status IN ('未学習','学習中','習得済み','要復習')"), nullable=False)
     last_reviewed = Column(TIMESTAMP, server_default=func.current_timestamp())
+
+class AnalysisLease(Base):
+    __tablename__ = "analysis_leases"
+    key = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(Float, nullable=False)
+    result = Column(Text)
+    completed_at = Column(Float)
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    image_hash = Column(String, nullable=False, index=True)
+    image_data = Column(LargeBinary, nullable=False)
+    status = Column(String, CheckConstraint("status IN ('queued','running','done','failed')"), nullable=False, default="queued", index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    next_attempt_at = Column(Float, nullable=False, default=0)
+    locked_by = Column(String)
+    locked_until = Column(Float)
+    error = Column(Text)
+    image_id = Column(Integer, ForeignKey("images.id"))
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    updated_at = Column(Float)
+
+class ModelUsage(Base):
+    __tablename__ = "model_usage"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    image_hash = Column(String, nullable=False, index=True)
+    image_id = Column(Integer, ForeignKey("images.id"), index=True)  # Linked once the image is saved
+    model_id = Column(String, nullable=False)
+    model_calls = Column(Integer, nullable=False, default=0)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0)
+    day = Column(String, nullable=False)  # UTC date, YYYY-MM-DD
+    created_at = Column(Float, nullable=False)
+
+# Per-user, per-day rollup of model_usage, read by the budget check
+class ModelUsageDaily(Base):
+    __tablename__ = "model_usage_daily"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(String, primary_key=True)
+    model_calls = Column(Integer, nullable=False, default=0)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0)
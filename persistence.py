@@ -0,0 +1,80 @@
+"""
+Saving users, images and vocabulary.
+
+Shared by the Streamlit app and the analysis workers; like ``analysis`` it does
+not import Streamlit.
+"""
+import hashlib
+import logging
+from typing import List
+from sqlalchemy.orm import Session
+from models import SpanishVocabulary
+from models_db import User, Image, VocabularyEntry
+from timeline_cache import bump_user_version
+from usage import link_usage_to_image
+from word_knowledge import word_knowledge
+from fuzzy_search import vocabulary_index
+
+logger = logging.getLogger(__name__)
+
+def get_or_create_user(db: Session, username: str = "test_user") -> User:
+    """Get or create a test user for development."""
+    user = db.query(User).filter(User.username == username).first()
+    if not user:
+        user = User(username=username)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    return user
+
+def save_image(db: Session, user_id: int, image_data: bytes) -> Image:
+    """Save uploaded image to database."""
+    try:
+        image = Image(
+            user_id=user_id,
+            image_data=image_data,
+            content_hash=hashlib.sha256(image_data).hexdigest()
+        )
+        db.add(image)
+        db.flush()
+        link_usage_to_image(db, user_id, image.content_hash, image.id)
+        bump_user_version(db, user_id)
+        db.commit()
+        db.refresh(image)
+        return image
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to save image for user %s", user_id)
+        raise
+
+def save_vocabulary(db: Session, user_id: int, image_id: int, vocab_items: List[SpanishVocabulary]):
+    """Save vocabulary entries to database."""
+    try:
+        for item in vocab_items:
+            vocab_entry = VocabularyEntry(
+                user_id=user_id,
+                image_id=image_id,
+                spanish_word=item.word,
+                part_of_speech=item.part_of_speech,
+                japanese_translation=item.translation,
+                example_sentence=item.example_sentence
+            )
+            db.add(vocab_entry)
+        bump_user_version(db, user_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Failed to save vocabulary for image %s", image_id)
+        raise
+    # The vocabulary is committed; stale caches must not turn that into a failure
+    try:
+        word_knowledge.remember(vocab_items)
+        vocabulary_index.refresh(db, only_if_loaded=True)
+    except Exception:
+        logger.exception("Failed to update the vocabulary caches for image %s", image_id)
+
+def persist_analysis(db: Session, user_id: int, image_data: bytes, vocab_items: List[SpanishVocabulary]) -> int:
+    """Save an analyzed image and its vocabulary, returning the image id."""
+    image = save_image(db, user_id, image_data)
+    save_vocabulary(db, user_id, image.id, vocab_items)
+    return image.id
@@ -0,0 +1,232 @@
+"""
+Background prefetch of the next timeline page and of detail images.
+
+After a timeline page is rendered, a background thread loads what the user is
+likely to request next: the next page (metadata and vocabulary, into the
+timeline page cache), the thumbnails of the current and next page, and the full
+images of the expanded entries, whose "詳細を表示" button is the only way into
+the detail view. Images go into the byte-bounded image cache, so memory stays
+capped however much is prefetched.
+
+Prefetching is best effort: tasks are deduplicated, dropped when the queue is
+full, and never block or fail a rerun. Set ``PHOTOWORD_PREFETCH=off`` to
+disable it.
+"""
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from image_cache import ByteLRUCache, image_cache
+from image_server import load_image
+from timeline_cache import TimelineCache, timeline_cache
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING_TASKS = 32
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class PrefetchTask:
+    """What to load after a page was rendered; ``skip`` is None when there is no next page."""
+    user_id: int
+    version: int
+    skip: Optional[int]
+    limit: int
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    search_term: Optional[str] = None
+    thumbnail_hashes: Tuple[str, ...] = ()
+    image_hashes: Tuple[str, ...] = ()
+
+
+class Prefetcher:
+    """Single background thread that runs prefetch tasks from a bounded queue."""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        page_cache: TimelineCache = timeline_cache,
+        cache: ByteLRUCache = image_cache,
+        max_pending: int = MAX_PENDING_TASKS
+    ):
+        self.session_factory = session_factory
+        self.page_cache = page_cache
+        self.cache = cache
+        self.scheduled = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self._queue: "queue.Queue[PrefetchTask]" = queue.Queue(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the prefetch thread."""
+        self._thread = threading.Thread(target=self._run, name="photoword-prefetch", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Finish the current task and exit; queued tasks are discarded."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def schedule(self, task: PrefetchTask) -> bool:
+        """
+        Queue a task unless the same one is already pending.
+
+        Returns:
+            bool: False if the task was a duplicate or the queue was full
+        """
+        # Tasks carry the data version, so a task scheduled after a write is distinct from an earlier one
+        with self._lock:
+            if task in self._pending:
+                return False
+            try:
+                self._queue.put_nowait(task)
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._pending.add(task)
+            self.scheduled += 1
+            return True
+
+    def run_task(self, task: PrefetchTask):
+        """Load the task's page and images into the caches."""
+        db = self.session_factory()
+        try:
+            entries = []
+            if task.skip is not None:
+                entries = self.page_cache.warm(
+                    db,
+                    task.user_id,
+                    skip=task.skip,
+                    limit=task.limit,
+                    start_date=task.start_date,
+                    end_date=task.end_date,
+                    search_term=task.search_term,
+                    version=task.version
+                )
+            next_thumbnails = [entry.image_hash for entry in entries if entry.image_hash]
+            for address in [*task.thumbnail_hashes, *next_thumbnails]:
+                self._warm_image(db, address, thumbnail=True)
+            for address in task.image_hashes:
+                self._warm_image(db, address, thumbnail=False)
+        finally:
+            db.close()
+
+    def _warm_image(self, db: Session, address: str, thumbnail: bool):
+        # Checked with ``in`` so that prefetching does not count towards the hit rate
+        key = (address, thumbnail)
+        if key not in self.cache:
+            data = load_image(db, address, thumbnail)
+            if data is not None:
+                self.cache.put(key, data)
+
+    def run_once(self, timeout: Optional[float] = None) -> bool:
+        """
+        Run the next queued task.
+
+        Returns:
+            bool: True if a task was run
+        """
+        try:
+            task = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        try:
+            self.run_task(task)
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            logger.exception("Prefetch for user %d failed", task.user_id)
+        finally:
+            with self._lock:
+                self._pending.discard(task)
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.run_once(timeout=0.5)
+
+    def stats(self) -> dict:
+        """Hit rates of the caches the prefetcher fills, and task counters."""
+        page_lookups = self.page_cache.hits + self.page_cache.misses
+        return {
+            "page_hits": self.page_cache.hits,
+            "page_misses": self.page_cache.misses,
+            "page_hit_rate": self.page_cache.hits / page_lookups if page_lookups else 0.0,
+            "images": self.cache.stats(),
+            "scheduled": self.scheduled,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+def get_prefetcher() -> Optional[Prefetcher]:
+    """Return the process-wide prefetcher, starting it on first use; None if disabled."""
+    global _prefetcher
+    if os.environ.get("PHOTOWORD_PREFETCH") == "off":
+        return None
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                from db import SessionLocal
+
+                prefetcher = Prefetcher(SessionLocal)
+                prefetcher.start()
+                _prefetcher = prefetcher
+    return _prefetcher
+
+
+def prefetch_after_render(
+    user_id: int,
+    version: int,
+    next_skip: Optional[int],
+    limit: int,
+    filters: dict,
+    visible_hashes: List[str],
+    expanded_hashes: List[str]
+) -> bool:
+    """
+    Schedule prefetching for what the user may open next.
+
+    Args:
+        user_id: User whose timeline was rendered
+        version: The user's data version the page was rendered with
+        next_skip: Offset of the next page, or None if there is no next page
+        limit: Page size
+        filters: ``start_date``, ``end_date`` and ``search_term`` of the rendered page
+        visible_hashes: Image addresses of the rendered entries (thumbnails)
+        expanded_hashes: Image addresses of the expanded entries (full images)
+
+    Returns:
+        bool: True if a task was queued
+    """
+    prefetcher = get_prefetcher()
+    if prefetcher is None:
+        return False
+    return prefetcher.schedule(PrefetchTask(
+        user_id=user_id,
+        version=version,
+        skip=next_skip,
+        limit=limit,
+        thumbnail_hashes=tuple(visible_hashes),
+        image_hashes=tuple(expanded_hashes),
+        **filters
+    ))
+
+
+def prefetch_stats() -> Optional[dict]:
+    """Statistics of the process-wide prefetcher, or None if it has not started."""
+    return _prefetcher.stats() if _prefetcher is not None else None
@@ -0,0 +1,211 @@
+"""
+Opt-in profiling of Streamlit reruns and image analysis.
+
+Profiling is off unless enabled:
+
+- ``PHOTOWORD_PROFILE=1`` profiles every rerun and every ``analyze_image_core`` call
+- ``?profile=<token>`` in the app URL profiles that session's reruns when the
+  token matches ``PHOTOWORD_PROFILE_TOKEN``
+
+Each profiled call writes to ``PHOTOWORD_PROFILE_DIR`` (default ``profiles``):
+
+- ``<name>.folded``: collapsed stacks from a sampling profiler, ready for
+  ``flamegraph.pl`` or speedscope (``PHOTOWORD_PROFILER=sample``, the default)
+- ``<name>.prof``: cProfile statistics for snakeviz or ``pstats``
+  (``PHOTOWORD_PROFILER=cprofile``)
+- ``<name>.sql.json``: number and duration of SQL statements, grouped by statement
+
+When profiling is disabled ``profile()`` costs one environment lookup.
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+PROFILE_DIR = os.environ.get("PHOTOWORD_PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = 0.005
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_listeners_lock = threading.Lock()
+_listening_engines = set()
+_sequence = 0
+_sequence_lock = threading.Lock()
+
+
+def profiling_requested(token: Optional[str] = None) -> bool:
+    """
+    Return True if profiling is enabled globally or by a valid admin token.
+
+    Args:
+        token: Value of the ``profile`` query parameter, if any
+    """
+    if os.environ.get("PHOTOWORD_PROFILE") == "1":
+        return True
+    expected = os.environ.get("PHOTOWORD_PROFILE_TOKEN")
+    if not (expected and token):
+        return False
+    # Constant-time comparison; encoded because compare_digest rejects non-ASCII str
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+
+class SqlRecorder:
+    """Statement counts and timings collected for one profiled call."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.by_statement: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        entry = self.by_statement[" ".join(statement.split())]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def to_dict(self) -> dict:
+        statements = sorted(self.by_statement.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "statements": self.count,
+            "seconds": self.seconds,
+            "by_statement": [
+                {"statement": statement, "count": count, "seconds": seconds}
+                for statement, (count, seconds) in statements
+            ]
+        }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, "sql", None) is not None:
+        conn.info.setdefault("profiling_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    recorder = getattr(_local, "sql", None)
+    starts = conn.info.get("profiling_start")
+    if recorder is not None and starts:
+        recorder.record(statement, time.perf_counter() - starts.pop())
+
+
+def _listen_to(engine):
+    """Attach the SQL listeners to ``engine`` the first time profiling runs."""
+    from sqlalchemy import event
+
+    with _listeners_lock:
+        if engine in _listening_engines:
+            return
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        _listening_engines.add(engine)
+
+
+class StackSampler:
+    """Sample the call stack of one thread and count identical stacks."""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def write_folded(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _output_base(name: str) -> str:
+    global _sequence
+    with _sequence_lock:
+        _sequence += 1
+        sequence = _sequence
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(PROFILE_DIR, f"{stamp}-{name}-{os.getpid()}-{sequence}")
+
+
+@contextmanager
+def profile(name: str, enabled: Optional[bool] = None):
+    """
+    Profile the enclosed block if profiling is enabled.
+
+    Nested profiled blocks in the same thread are folded into the outer one.
+
+    Args:
+        name: Label used in the output file names
+        enabled: Force profiling on or off; defaults to ``profiling_requested()``
+
+    Yields:
+        str | None: Base path of the output files, or None when not profiling
+    """
+    if enabled is None:
+        enabled = profiling_requested()
+    if not enabled or getattr(_local, "sql", None) is not None:
+        yield None
+        return
+
+    from db import get_engine
+
+    _listen_to(get_engine())
+    base = _output_base(name)
+    mode = os.environ.get("PHOTOWORD_PROFILER", "sample")
+    profiler = cProfile.Profile() if mode == "cprofile" else None
+    sampler = None if profiler else StackSampler(threading.get_ident())
+    recorder = SqlRecorder()
+
+    _local.sql = recorder
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    else:
+        sampler.start()
+    try:
+        yield base
+    finally:
+        if profiler:
+            profiler.disable()
+        else:
+            sampler.stop()
+        wall = time.perf_counter() - start
+        _local.sql = None
+
+        if profiler:
+            profiler.dump_stats(f"{base}.prof")
+        else:
+            sampler.write_folded(f"{base}.folded")
+        with open(f"{base}.sql.json", "w", encoding="utf-8") as f:
+            json.dump({"name": name, "wall_seconds": wall, "sql": recorder.to_dict()}, f, ensure_ascii=False, indent=2)
+        logger.info(
+            "Profiled %s in %.3fs: %d SQL statements (%.3fs) -> %s",
+            name, wall, recorder.count, recorder.seconds, base
+        )
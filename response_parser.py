@@ -0,0 +1,147 @@
+"""
+Tolerant parsing of vocabulary JSON returned by the model.
+
+The model is asked for ``{"vocabulary": [{...}, ...]}`` but the response can be
+cut off when it hits ``max_tokens`` or contain small syntax errors. The helpers
+here recover every complete vocabulary object instead of discarding the whole
+response.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+REQUIRED_KEYS = ("word", "part_of_speech", "translation", "example_sentence")
+
+_decoder = json.JSONDecoder()
+_VOCABULARY_KEY = re.compile(r'"vocabulary"\s*:\s*\[')
+
+
+@dataclass
+class SalvageResult:
+    """Vocabulary items recovered from a (possibly truncated) response."""
+    items: List[dict] = field(default_factory=list)
+    found_json: bool = False
+    complete: bool = False
+
+
+def _is_vocabulary_item(value) -> bool:
+    return (
+        isinstance(value, dict)
+        and all(isinstance(value.get(key), str) and value[key].strip() for key in REQUIRED_KEYS)
+    )
+
+
+def salvage_vocabulary(text: str) -> SalvageResult:
+    """
+    Recover all complete vocabulary objects from a model response.
+
+    Objects are decoded one at a time from the ``vocabulary`` array, so a
+    truncated tail or a single malformed object only loses that object.
+
+    Args:
+        text: Raw response text from the model
+
+    Returns:
+        SalvageResult: Recovered items, whether any JSON was present and whether
+        the vocabulary array was closed properly
+    """
+    result = SalvageResult(found_json="{" in text)
+    match = _VOCABULARY_KEY.search(text)
+    # Without the array header, fall back to scanning every object in the text
+    pos = match.end() if match else 0
+    length = len(text)
+
+    while pos < length:
+        char = text[pos]
+        if char in " \t\r\n,":
+            pos += 1
+            continue
+        if char == "]" and match:
+            result.complete = True
+            break
+        if char != "{":
+            next_pos = text.find("{", pos)
+            if next_pos == -1:
+                break
+            pos = next_pos
+            continue
+        try:
+            value, end = _decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            # Malformed or truncated object: resume at the next candidate object
+            next_pos = text.find("{", pos + 1)
+            if next_pos == -1:
+                break
+            pos = next_pos
+            continue
+        if _is_vocabulary_item(value):
+            result.items.append({key: value[key] for key in REQUIRED_KEYS})
+        elif isinstance(value, dict) and isinstance(value.get("vocabulary"), list):
+            result.items.extend(
+                {key: item[key] for key in REQUIRED_KEYS}
+                for item in value["vocabulary"]
+                if _is_vocabulary_item(item)
+            )
+            result.complete = True
+        pos = end
+
+    return result
+
+
+def merge_vocabulary_items(existing: List[dict], new_items: List[dict]) -> List[dict]:
+    """
+    Append items whose word has not been seen yet.
+
+    Args:
+        existing: Items already collected
+        new_items: Items from a continuation response
+
+    Returns:
+        list[dict]: Combined list without duplicate words
+    """
+    seen = {item["word"].strip().lower() for item in existing}
+    merged = list(existing)
+    for item in new_items:
+        key = item["word"].strip().lower()
+        if key not in seen:
+            seen.add(key)
+            merged.append(item)
+    return merged
+
+
+_WORDS_KEY = re.compile(r'"words"\s*:\s*\[')
+_SCENE_VALUE = re.compile(r'"scene"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+def salvage_lemmas(text: str) -> Tuple[str, List[str]]:
+    """
+    Recover the scene description and lemma list from a first-phase response.
+
+    The expected shape is ``{"scene": "...", "words": ["mesa", ...]}``. Only
+    complete string literals are kept when the list is truncated.
+
+    Args:
+        text: Raw response text from the model
+
+    Returns:
+        (scene, lemmas): The scene description (may be empty) and the lemmas in order
+
+    Raises:
+        ValueError: If the response contains no word list
+    """
+    match = _WORDS_KEY.search(text)
+    if not match:
+        raise ValueError("No word list found in response")
+    scene_match = _SCENE_VALUE.search(text)
+    scene = json.loads(f'"{scene_match.group(1)}"') if scene_match else ""
+
+    lemmas = []
+    end = text.find("]", match.end())
+    body = text[match.end():end if end != -1 else len(text)]
+    for literal in _STRING.finditer(body):
+        lemma = json.loads(f'"{literal.group(1)}"').strip()
+        if lemma and lemma not in lemmas:
+            lemmas.append(lemma)
+    return scene, lemmas
@@ -0,0 +1,206 @@
+"""
+Single-flight coalescing of concurrent identical calls.
+
+When several Streamlit sessions analyze the same image at the same time, only
+the first caller invokes the model; the others wait for and share its result.
+``SingleFlight`` coalesces calls within one process, ``LeaseSingleFlight`` adds a
+lease table so that several worker processes sharing one database coalesce too.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from models_db import AnalysisLease
+
+
+class SingleFlight:
+    """Process-wide coalescing of concurrent calls that share a key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run ``fn`` unless a call with the same key is already in flight.
+
+        Args:
+            key: Identity of the call (e.g. the image hash)
+            fn: Function performing the actual work
+
+        Returns:
+            The result of ``fn``, either from this call or from the call in flight
+
+        Raises:
+            Exception: Whatever ``fn`` raised, re-raised in every waiting caller
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        """Return the number of keys currently being computed."""
+        with self._lock:
+            return len(self._calls)
+
+
+class LeaseSingleFlight:
+    """
+    Cross-process single-flight backed by the ``analysis_leases`` table.
+
+    The process that inserts the lease row performs the call and stores the
+    serialized result in the row; other processes poll the row until the result
+    appears or the lease expires, in which case one of them takes over.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable,
+        serialize: Callable[[Any], str],
+        deserialize: Callable[[str], Any],
+        lease_seconds: float = 120.0,
+        result_ttl: float = 60.0,
+        poll_interval: float = 0.25
+    ):
+        self.session_factory = session_factory
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._local = SingleFlight()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run ``fn`` once across all processes sharing the database.
+
+        Args:
+            key: Identity of the call (e.g. the image hash)
+            fn: Function performing the actual work
+
+        Returns:
+            The result of ``fn``, computed here or by another process
+        """
+        # Only one thread per process takes part in the lease protocol
+        return self._local.do(key, lambda: self._do_leased(key, fn))
+
+    def _do_leased(self, key: str, fn: Callable[[], Any]) -> Any:
+        while True:
+            acquired, stored = self._try_acquire(key)
+            if stored is not None:
+                return self.deserialize(stored)
+            if acquired:
+                break
+            stored = self._wait(key)
+            if stored is not None:
+                return self.deserialize(stored)
+
+        try:
+            result = fn()
+        except BaseException:
+            self._release(key)
+            raise
+        self._store(key, self.serialize(result))
+        return result
+
+    def _try_acquire(self, key: str):
+        """Return ``(acquired, stored_result)`` for the given key."""
+        now = time.time()
+        db = self.session_factory()
+        try:
+            db.execute(
+                delete(AnalysisLease).where(
+                    AnalysisLease.completed_at.isnot(None),
+                    AnalysisLease.completed_at < now - self.result_ttl
+                )
+            )
+            lease = db.execute(
+                select(AnalysisLease).where(AnalysisLease.key == key)
+            ).scalar_one_or_none()
+            if lease is None:
+                db.add(AnalysisLease(key=key, owner=self.owner, expires_at=now + self.lease_seconds))
+                try:
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    return False, None
+                return True, None
+            if lease.result is not None:
+                stored = lease.result
+                db.commit()
+                return False, stored
+            if lease.expires_at < now:
+                # The previous owner died or stalled; take the lease over atomically
+                taken = db.execute(
+                    update(AnalysisLease)
+                    .where(AnalysisLease.key == key, AnalysisLease.expires_at == lease.expires_at)
+                    .values(owner=self.owner, expires_at=now + self.lease_seconds)
+                )
+                db.commit()
+                return taken.rowcount == 1, None
+            db.commit()
+            return False, None
+        finally:
+            db.close()
+
+    def _wait(self, key: str) -> Optional[str]:
+        """Poll until the lease holder stores a result or gives up the lease."""
+        while True:
+            time.sleep(self.poll_interval)
+            db = self.session_factory()
+            try:
+                lease = db.execute(
+                    select(AnalysisLease).where(AnalysisLease.key == key)
+                ).scalar_one_or_none()
+            finally:
+                db.close()
+            if lease is not None and lease.result is not None:
+                return lease.result
+            if lease is None or lease.expires_at < time.time():
+                return None
+
+    def _store(self, key: str, result: str):
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(AnalysisLease)
+                .where(AnalysisLease.key == key, AnalysisLease.owner == self.owner)
+                .values(result=result, completed_at=time.time())
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _release(self, key: str):
+        db = self.session_factory()
+        try:
+            db.execute(
+                delete(AnalysisLease).where(AnalysisLease.key == key, AnalysisLease.owner == self.owner)
+            )
+            db.commit()
+        finally:
+            db.close()
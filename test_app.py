@@ -0,0 +1,167 @@
+import os
+import threading
+from datetime import datetime, timedelta
+import pytest
+from streamlit.testing.v1 import AppTest
+import main
+from jobs import claim_next_job, fail_job
+from models_db import AnalysisJob
+
+with open(os.path.join(os.path.dirname(__file__), "test_image", "test1_restaurant.jpg"), "rb") as f:
+    TEST_JPEG = f.read()
+
+def upload_app():
+    """The upload part of main(); AppTest cannot drive st.file_uploader, so the file comes from the session state."""
+    import io
+    import streamlit as st
+    import main
+
+    class UploadedFile(io.BytesIO):
+        @property
+        def size(self):
+            return len(self.getbuffer())
+
+    db = main.SessionLocal()
+    try:
+        if st.session_state.pending_job_ids:
+            main.record_finished_jobs(main.get_job_statuses(db, st.session_state.pending_job_ids))
+        main.submit_upload(db, st.session_state.user_id, UploadedFile(st.session_state.upload), None)
+    finally:
+        db.close()
+
+@pytest.fixture
+def upload_test(session_factory, test_user, monkeypatch):
+    monkeypatch.setattr(main, "SessionLocal", session_factory)
+    monkeypatch.delenv("PHOTOWORD_DAILY_BUDGET_USD", raising=False)
+    at = AppTest.from_function(upload_app)
+    at.session_state.processed_image_hash = None
+    at.session_state.pending_job_ids = []
+    at.session_state.failed_images = {}
+    at.session_state.user_id = test_user.id
+    at.session_state.upload = TEST_JPEG
+    return at
+
+def test_failed_job_is_not_resubmitted_on_rerun(upload_test, test_db):
+    at = upload_test
+    at.run()
+    assert test_db.query(AnalysisJob).count() == 1
+    job = claim_next_job(test_db, "worker-1")
+    assert fail_job(test_db, job, "No vocabulary extracted from image", retry=False)
+
+    # The rerun triggered by the failure and any later ones keep the same file in the uploader
+    for _ in range(2):
+        at.run()
+        assert not at.exception
+        assert test_db.query(AnalysisJob).count() == 1
+        assert "No vocabulary extracted from image" in at.error[0].value
+        assert at.session_state.pending_job_ids == []
+
+    at.button(key="retry_btn").click().run()
+    assert [job.status for job in test_db.query(AnalysisJob).order_by(AnalysisJob.id)] == ["failed", "queued"]
+    assert at.session_state.failed_images == {}
+
+@pytest.fixture
+def opened_sessions(session_factory, monkeypatch):
+    """Sessions the app opens through db.SessionLocal, with the name of the opening thread."""
+    import db
+
+    sessions = []
+
+    def open_session():
+        session = session_factory()
+        sessions.append((threading.current_thread().name, session))
+        return session
+
+    monkeypatch.setattr(db, "SessionLocal", open_session)
+    return sessions
+
+@pytest.fixture
+def timeline_app(opened_sessions, test_db, test_user, add_image, monkeypatch):
+    """main.py with twelve timeline entries, run without workers, prefetching or image server."""
+    import fuzzy_search
+    import image_server
+    from fuzzy_search import TrigramIndex
+    from timeline_cache import timeline_cache
+
+    monkeypatch.setattr(fuzzy_search, "vocabulary_index", TrigramIndex())
+    monkeypatch.setenv("PHOTOWORD_WORKER_MODE", "external")
+    monkeypatch.setenv("PHOTOWORD_PREFETCH", "off")
+    monkeypatch.delenv("PHOTOWORD_IMAGE_BASE_URL", raising=False)
+    loads = []
+    load_image_cached = image_server.load_image_cached
+
+    def recording_load(db, address, thumbnail, **kwargs):
+        loads.append((address, thumbnail))
+        return load_image_cached(db, address, thumbnail, **kwargs)
+
+    monkeypatch.setattr(image_server, "load_image_cached", recording_load)
+    image_ids = [
+        add_image(
+            test_db, test_user.id, (f"palabra{i}", "単語"), image_data=TEST_JPEG,
+            content_hash=f"{i:064x}", created_at=datetime(2026, 1, 1) + timedelta(minutes=i)
+        )
+        for i in range(12)
+    ]
+    timeline_cache.clear()
+    at = AppTest.from_file(os.path.join(os.path.dirname(__file__), "main.py"), default_timeout=30)
+    at.run()
+    assert not at.exception
+    yield at, image_ids, loads
+    timeline_cache.clear()
+
+def rendered_entry_ids(at):
+    return [int(button.key.rsplit("_", 1)[1]) for button in at.button if button.key.startswith("toggle_btn_")]
+
+def test_expanding_past_the_cap_collapses_the_oldest_entry(timeline_app):
+    at, image_ids, loads = timeline_app
+    # Newest first; only the first page is rendered
+    first_page = rendered_entry_ids(at)
+    assert first_page == image_ids[::-1][:5]
+    for entry_id in first_page[:main.MAX_EXPANDED_ENTRIES + 1]:
+        at.button(key=f"toggle_btn_{entry_id}").click().run()
+    assert at.session_state.expanded_entry_ids == first_page[1:main.MAX_EXPANDED_ENTRIES + 1]
+
+    at.button(key=f"toggle_btn_{first_page[2]}").click().run()
+    assert at.session_state.expanded_entry_ids == [first_page[1], first_page[3]]
+
+def test_collapsed_entries_do_not_load_images(timeline_app):
+    at, image_ids, loads = timeline_app
+    assert loads == []
+    newest = image_ids[-1]
+    at.button(key=f"toggle_btn_{newest}").click().run()
+    assert loads == [(f"{11:064x}", True)]
+
+    loads.clear()
+    at.button(key=f"detail_btn_{newest}").click().run()
+    # The detail view replaces the thumbnail with the full image
+    assert loads == [(f"{11:064x}", False)]
+
+def test_scroll_window_shifts_and_clamps(timeline_app):
+    at, image_ids, loads = timeline_app
+    newest_first = image_ids[::-1]
+    at.radio(key="view_mode").set_value("スクロール").run()
+    assert rendered_entry_ids(at) == newest_first[:5]
+    assert not any(button.key == "scroll_back_btn" for button in at.button)
+
+    at.button(key="scroll_more_btn").click().run()
+    assert rendered_entry_ids(at) == newest_first[:10]
+    at.button(key="scroll_more_btn").click().run()
+    # Only SCROLL_WINDOW_PAGES pages stay rendered, and there is nothing left to load
+    assert rendered_entry_ids(at) == newest_first[5:]
+    assert not any(button.key == "scroll_more_btn" for button in at.button)
+
+    at.button(key="scroll_back_btn").click().run()
+    assert at.session_state.scroll_loaded == 10
+    assert rendered_entry_ids(at) == newest_first[:10]
+    assert not any(button.key == "scroll_back_btn" for button in at.button)
+    assert not loads
+
+def test_reruns_close_their_sessions(timeline_app, opened_sessions):
+    at, image_ids, loads = timeline_app
+    at.button(key=f"toggle_btn_{image_ids[-1]}").click().run()
+    at.text_input(key="search_term").input("palabra1").run()
+    assert not at.exception
+    reruns = [session for thread, session in opened_sessions if thread != "photoword-fuzzy-index"]
+    assert len(reruns) >= 3
+    # A closed session has released its connection and holds no transaction
+    assert not any(session.in_transaction() for session in reruns)
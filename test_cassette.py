@@ -0,0 +1,59 @@
+import pytest
+import analysis
+from cassette import CassetteMissError, RecordingClient, ReplayClient, load_cassette
+from fake_model import FakeModelClient
+
+IMAGE = b"\xff\xd8cassette-test"
+
+@pytest.fixture(autouse=True)
+def single_phase(monkeypatch):
+    monkeypatch.delenv("PHOTOWORD_ANALYSIS_MODE", raising=False)
+
+def record(path, monkeypatch, image_data=IMAGE):
+    client = RecordingClient(FakeModelClient(), str(path))
+    monkeypatch.setattr(analysis, "_model_client", client)
+    return analysis.analyze_image_detailed(image_data), client
+
+def test_record_then_replay(tmp_path, monkeypatch):
+    path = tmp_path / "cassettes" / "restaurant.jsonl"
+    recorded, recorder = record(path, monkeypatch)
+    assert recorder.recorded == 1
+    [entry] = load_cassette(str(path))
+    assert entry["model_id"] == analysis.MODEL_ID
+    assert entry["latency"] >= 0
+    assert entry["response"]["usage"]["output_tokens"] > 0
+
+    sleeps = []
+    replay = ReplayClient.from_file(str(path), latency="recorded", sleep=sleeps.append)
+    monkeypatch.setattr(analysis, "_model_client", replay)
+    replayed = analysis.analyze_image_detailed(IMAGE)
+    assert replayed.vocabulary == recorded.vocabulary
+    assert (replayed.input_tokens, replayed.output_tokens) == (recorded.input_tokens, recorded.output_tokens)
+    assert sleeps == replay.latencies == [entry["latency"]]
+
+def test_replay_miss_and_loose_matching(tmp_path, monkeypatch):
+    path = tmp_path / "restaurant.jsonl"
+    recorded, _ = record(path, monkeypatch)
+
+    monkeypatch.setattr(analysis, "_model_client", ReplayClient.from_file(str(path)))
+    with pytest.raises(CassetteMissError):
+        analysis.analyze_image_detailed(b"\xff\xd8another image")
+
+    loose = ReplayClient.from_file(str(path), match="loose")
+    monkeypatch.setattr(analysis, "_model_client", loose)
+    assert analysis.analyze_image_detailed(b"\xff\xd8another image").vocabulary == recorded.vocabulary
+    assert loose.calls == 1 and loose.misses == 0
+
+def test_create_model_client_from_environment(tmp_path, monkeypatch):
+    path = tmp_path / "env.jsonl"
+    monkeypatch.setenv("PHOTOWORD_MODEL_BACKEND", "fake")
+    monkeypatch.setenv("PHOTOWORD_CASSETTE", str(path))
+    monkeypatch.setenv("PHOTOWORD_CASSETTE_MODE", "record")
+    assert isinstance(analysis.create_model_client(), RecordingClient)
+
+    path.write_text("")
+    monkeypatch.setenv("PHOTOWORD_CASSETTE_MODE", "replay")
+    # Replay never creates the backend client, so no credentials are needed
+    monkeypatch.delenv("PHOTOWORD_MODEL_BACKEND")
+    client = analysis.create_model_client()
+    assert isinstance(client, ReplayClient) and client.latency == "zero"
@@ -0,0 +1,94 @@
+import os
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, event
+from db import Base
+from image_server import guess_content_type
+from models_db import User, Image, ModelUsage
+from compaction import run_compaction, incremental_vacuum, recompress_image
+from timeline_cache import get_user_version
+
+with open(os.path.join(os.path.dirname(__file__), "test_image", "test1_restaurant.jpg"), "rb") as f:
+    TEST_JPEG = f.read()
+
+@pytest.fixture
+def engine(tmp_path):
+    """Overrides the shared engine: compaction needs an incrementally vacuumed database."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'compaction.db'}")
+
+    @event.listens_for(engine, "connect")
+    def set_auto_vacuum(dbapi_connection, connection_record):
+        # Must be set before the first table is created
+        dbapi_connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+def ago(**kwargs):
+    return datetime.utcnow() - timedelta(**kwargs)
+
+def test_recompress_image_to_webp():
+    archived = recompress_image(TEST_JPEG, "WEBP", 60)
+    assert guess_content_type(archived) == "image/webp"
+    assert len(archived) < len(TEST_JPEG)
+
+def test_run_compaction(engine, session_factory, add_image):
+    db = session_factory()
+    user = User(username="alice")
+    db.add(user)
+    db.commit()
+    old = add_image(db, user.id, ("mesa", "テーブル"), image_data=TEST_JPEG, content_hash="hash-0", created_at=ago(days=60))
+    recent = add_image(db, user.id, ("mesa", "テーブル"), image_data=TEST_JPEG, content_hash="hash-1", created_at=ago(days=1))
+    orphan = add_image(db, user.id, image_data=os.urandom(200_000), content_hash="hash-2", created_at=ago(hours=2))
+    in_progress = add_image(db, user.id, image_data=b"saving", content_hash="hash-3", created_at=ago(minutes=1))
+    db.add(ModelUsage(user_id=user.id, image_hash="h", image_id=orphan, model_id="m", day="2026-01-01", created_at=0))
+    db.commit()
+    version = get_user_version(db, user.id)
+
+    report = run_compaction(session_factory, engine, archive_after_days=30, image_format="webp", quality=60)
+
+    db.expire_all()
+    # One bump for the deleted orphan, one for the re-encoded image; visible to the app's cache
+    assert get_user_version(db, user.id) == version + 2
+    archived = db.get(Image, old)
+    assert archived.archived_at is not None
+    assert guess_content_type(archived.image_data) == "image/webp"
+    assert archived.content_hash == "hash-0"
+    assert db.get(Image, recent).image_data == TEST_JPEG
+    assert db.get(Image, orphan) is None
+    assert db.get(Image, in_progress) is not None
+    assert db.query(ModelUsage).one().image_id is None
+
+    assert report.images_recompressed == 1
+    assert report.recompressed_bytes_saved == len(TEST_JPEG) - len(archived.image_data)
+    assert report.orphans_deleted == 1
+    assert report.orphan_bytes_deleted == 200_000
+    assert report.bytes_reclaimed == report.recompressed_bytes_saved + 200_000
+    assert report.vacuum_slices > 0
+    assert report.file_bytes_reclaimed > 200_000
+
+    # A second pass has nothing left to do
+    again = run_compaction(session_factory, engine, archive_after_days=30, image_format="webp")
+    assert again.bytes_reclaimed == 0
+    db.close()
+
+def test_incremental_vacuum_is_bounded(engine, session_factory, add_image):
+    db = session_factory()
+    user = User(username="bob")
+    db.add(user)
+    db.commit()
+    image_id = add_image(db, user.id, image_data=os.urandom(1_000_000), content_hash="hash-0", created_at=ago(days=1))
+    db.query(Image).filter(Image.id == image_id).delete()
+    db.commit()
+    db.close()
+
+    report = incremental_vacuum(engine, pages_per_slice=10, max_slices=3, pause=0)
+    assert report.vacuum_slices == 3
+    assert report.file_bytes_reclaimed == 30 * 4096
+
+def test_incremental_vacuum_requires_incremental_mode(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plain.db'}")
+    Base.metadata.create_all(bind=engine)
+    assert incremental_vacuum(engine).vacuum_slices == 0
+    engine.dispose()
@@ -0,0 +1,124 @@
+import pytest
+import fuzzy_search
+import persistence
+from fuzzy_search import TrigramIndex, normalize_text, trigrams
+from models import SpanishVocabulary
+from models_db import User, Image, VocabularyEntry
+from timeline import get_timeline_entries
+from timeline_cache import TimelineCache, get_user_version
+
+@pytest.fixture(autouse=True)
+def fresh_index(monkeypatch):
+    # The shared index tracks one database; give each test a fresh one
+    monkeypatch.setattr(fuzzy_search, "vocabulary_index", TrigramIndex())
+
+@pytest.fixture
+def users(test_db):
+    users = [User(username="alice"), User(username="bob")]
+    test_db.add_all(users)
+    test_db.commit()
+    return users
+
+
+def test_normalize_text_strips_latin_accents_only():
+    assert normalize_text("  Niño  Árbol ") == "nino arbol"
+    assert normalize_text("ガラス") == "ガラス"
+    assert trigrams("sol") == ["  s", " so", "sol", "ol "]
+
+def test_search_ranks_by_similarity_and_is_per_user():
+    index = TrigramIndex()
+    index.add_rows([
+        (1, 1, 10, "ventana", "窓"),
+        (2, 1, 11, "ventanilla", "小窓"),
+        (3, 1, 12, "mesa", "テーブル"),
+        (4, 1, 13, "niño", "子供"),
+        (5, 2, 20, "ventana", "窓"),
+    ])
+    assert len(index) == 5
+    assert index.search(1, "bentana") == [10]
+    assert index.search(1, "ventanill") == [11, 10]
+    assert index.search(1, "nino") == [13]
+    assert index.search(1, "テーブ") == [12]
+    assert index.search(2, "ventana") == [20]
+    assert index.search(1, "zzz") == []
+    assert index.search(3, "ventana") == []
+
+def test_refresh_indexes_new_rows_incrementally(test_db, users, add_image):
+    index = TrigramIndex()
+    add_image(test_db, users[0].id, ("ventana", "窓"))
+    index.refresh(test_db, only_if_loaded=True)
+    assert not index.loaded and len(index) == 0
+
+    index.refresh(test_db)
+    second = add_image(test_db, users[0].id, ("lámpara", "ランプ"))
+    index.refresh(test_db)
+    assert len(index) == 2
+    assert index.search(users[0].id, "lampara") == [second]
+
+def test_refresh_picks_up_rows_committed_out_of_id_order(test_db, users, add_image):
+    """A row committed after a row with a higher id (PostgreSQL sequences) is not skipped."""
+    index = TrigramIndex()
+    image = add_image(test_db, users[0].id, ("ventana", "窓"))
+    late = VocabularyEntry(
+        id=10, user_id=users[0].id, image_id=image, spanish_word="lámpara",
+        part_of_speech="名詞", japanese_translation="ランプ", example_sentence="Ejemplo."
+    )
+    test_db.add(VocabularyEntry(
+        id=11, user_id=users[0].id, image_id=image, spanish_word="mesa",
+        part_of_speech="名詞", japanese_translation="テーブル", example_sentence="Ejemplo."
+    ))
+    test_db.commit()
+    index.refresh(test_db)
+    assert index.search(users[0].id, "lampara") == []
+
+    test_db.add(late)
+    test_db.commit()
+    index.refresh(test_db)
+    assert index.search(users[0].id, "lampara") == [image]
+    assert len(index) == 3
+
+def test_timeline_falls_back_to_fuzzy_matches(test_db, users, add_image):
+    alice, bob = users
+    window = add_image(test_db, alice.id, ("ventana", "窓"), ("mesa", "テーブル"))
+    child = add_image(test_db, alice.id, ("niño", "子供"))
+    add_image(test_db, bob.id, ("ventana", "窓"))
+
+    exact = get_timeline_entries(test_db, alice.id, search_term="ventana")
+    assert [entry.id for entry in exact] == [window]
+
+    # The first fallback starts loading the index in the background and finds nothing yet
+    assert get_timeline_entries(test_db, alice.id, search_term="bentana") == []
+    assert fuzzy_search.vocabulary_index.wait_until_loaded(timeout=5)
+
+    fuzzy = get_timeline_entries(test_db, alice.id, search_term="bentana")
+    assert [entry.id for entry in fuzzy] == [window]
+    assert [entry.id for entry in get_timeline_entries(test_db, alice.id, search_term="nino")] == [child]
+    assert get_timeline_entries(test_db, alice.id, search_term="bentana", skip=1) == []
+    assert get_timeline_entries(test_db, alice.id, search_term="bentana", fuzzy_fallback=False) == []
+
+def test_searches_during_warm_up_are_not_cached(test_db, users, add_image):
+    """A page that lacks fuzzy matches because the index was loading is queried again once it loaded."""
+    alice = users[0]
+    window = add_image(test_db, alice.id, ("ventana", "窓"))
+    cache = TimelineCache()
+    version = get_user_version(test_db, alice.id)
+    assert cache.get_entries(test_db, alice.id, search_term="bentana", version=version) == []
+    assert fuzzy_search.vocabulary_index.wait_until_loaded(timeout=5)
+
+    entries = cache.get_entries(test_db, alice.id, search_term="bentana", version=version)
+    assert [entry.id for entry in entries] == [window]
+    assert cache.get_entries(test_db, alice.id, search_term="bentana", version=version) is entries
+    assert cache.misses == 2 and cache.hits == 1
+
+def test_index_refresh_errors_do_not_fail_a_committed_save(test_db, users, monkeypatch):
+    class BrokenIndex:
+        def refresh(self, db, only_if_loaded=False):
+            raise RuntimeError("index unavailable")
+
+    monkeypatch.setattr(persistence, "vocabulary_index", BrokenIndex())
+    image = Image(user_id=users[0].id, image_data=b"image")
+    test_db.add(image)
+    test_db.commit()
+    vocab = [SpanishVocabulary(word="ventana", part_of_speech="名詞", translation="窓", example_sentence="Ejemplo.")]
+    persistence.save_vocabulary(test_db, users[0].id, image.id, vocab)
+    assert [row.spanish_word for row in test_db.query(VocabularyEntry)] == ["ventana"]
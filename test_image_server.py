@@ -0,0 +1,117 @@
+import hashlib
+import tempfile
+import os
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from tornado.testing import AsyncHTTPTestCase
+from db import Base
+from models_db import User, Image
+from image_server import make_app, parse_range, IMMUTABLE_CACHE_CONTROL
+from image_cache import image_address, image_cache
+
+with open("test_image/test1_restaurant.jpg", "rb") as f:
+    IMAGE_DATA = f.read()
+IMAGE_HASH = hashlib.sha256(IMAGE_DATA).hexdigest()
+
+class ImageServerTest(AsyncHTTPTestCase):
+    """Tests for the content-addressed image endpoint."""
+
+    def get_app(self):
+        image_cache.clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.tmpdir.name, 'images.db')}")
+        Base.metadata.create_all(bind=self.engine)
+        self.session_factory = sessionmaker(bind=self.engine, autoflush=False, autocommit=False)
+        db = self.session_factory()
+        user = User(username="test_user")
+        db.add(user)
+        db.commit()
+        db.add(Image(user_id=user.id, image_data=IMAGE_DATA, content_hash=IMAGE_HASH))
+        db.commit()
+        db.close()
+        return make_app(self.session_factory)
+
+    def tearDown(self):
+        super().tearDown()
+        self.engine.dispose()
+        self.tmpdir.cleanup()
+
+    def test_image_is_served_with_immutable_headers(self):
+        response = self.fetch(f"/images/{IMAGE_HASH}")
+        assert response.code == 200
+        assert response.body == IMAGE_DATA
+        assert response.headers["Content-Type"] == "image/jpeg"
+        assert response.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+        assert response.headers["ETag"] == f'"{IMAGE_HASH}"'
+        assert response.headers["Accept-Ranges"] == "bytes"
+
+    def test_matching_etag_returns_not_modified(self):
+        response = self.fetch(f"/images/{IMAGE_HASH}", headers={"If-None-Match": f'"{IMAGE_HASH}"'})
+        assert response.code == 304
+        assert response.body == b""
+
+    def test_range_request(self):
+        response = self.fetch(f"/images/{IMAGE_HASH}", headers={"Range": "bytes=10-19"})
+        assert response.code == 206
+        assert response.body == IMAGE_DATA[10:20]
+        assert response.headers["Content-Range"] == f"bytes 10-19/{len(IMAGE_DATA)}"
+
+        response = self.fetch(f"/images/{IMAGE_HASH}", headers={"Range": f"bytes={len(IMAGE_DATA)}-"})
+        assert response.code == 416
+
+    def test_thumbnail_is_generated_once_and_stored(self):
+        response = self.fetch(f"/thumbnails/{IMAGE_HASH}")
+        assert response.code == 200
+        assert response.headers["ETag"] == f'"{IMAGE_HASH}-thumb"'
+        assert 0 < len(response.body) < len(IMAGE_DATA)
+        db = self.session_factory()
+        try:
+            assert db.query(Image.thumbnail_data).scalar() == response.body
+        finally:
+            db.close()
+
+    def test_unknown_hash(self):
+        response = self.fetch(f"/images/{'0' * 64}")
+        assert response.code == 404
+        assert self.fetch("/images/not-a-hash").code == 404
+
+    def test_not_modified_requires_the_image_to_exist(self):
+        unknown = "0" * 64
+        response = self.fetch(f"/images/{unknown}", headers={"If-None-Match": f'"{unknown}"'})
+        assert response.code == 404
+        response = self.fetch(f"/images/{IMAGE_HASH}", headers={"If-None-Match": "*"})
+        assert response.code == 304
+
+    def test_archived_image_gets_a_new_address(self):
+        """Bytes re-encoded by compaction are served under a new URL and ETag; the old URL redirects."""
+        self.fetch(f"/images/{IMAGE_HASH}")
+        db = self.session_factory()
+        try:
+            db.query(Image).update({Image.image_data: b"RIFF\x00\x00\x00\x00WEBParchived", Image.archived_at: 1700000000.5})
+            db.commit()
+        finally:
+            db.close()
+        address = image_address(IMAGE_HASH, 1700000000.5)
+        assert address == f"{IMAGE_HASH}.1700000000"
+
+        # A cached copy under the old address is still the original
+        assert self.fetch(f"/images/{IMAGE_HASH}").body == IMAGE_DATA
+        image_cache.clear()
+        response = self.fetch(f"/images/{IMAGE_HASH}", follow_redirects=False)
+        assert response.code == 302
+        assert response.headers["Location"] == f"/images/{address}"
+        assert "Cache-Control" not in response.headers and "ETag" not in response.headers
+
+        response = self.fetch(f"/images/{address}")
+        assert response.code == 200
+        assert response.body.endswith(b"archived")
+        assert response.headers["Content-Type"] == "image/webp"
+        assert response.headers["ETag"] == f'"{address}"'
+
+def test_parse_range():
+    """Open-ended and suffix ranges are resolved against the body length."""
+    assert parse_range("bytes=0-99", 1000) == (0, 100)
+    assert parse_range("bytes=900-", 1000) == (900, 1000)
+    assert parse_range("bytes=-100", 1000) == (900, 1000)
+    assert parse_range("bytes=0-5000", 1000) == (0, 1000)
+    assert parse_range("bytes=1000-", 1000) is None
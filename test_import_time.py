@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Measured at ~0.5s for the core modules and ~1s for main.py; the budgets leave
+# headroom for slower CI machines but catch eager boto3/client/engine setup.
+CORE_IMPORT_BUDGET = 1.5
+MAIN_IMPORT_BUDGET = 3.0
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {modules}
+elapsed = time.perf_counter() - start
+import analysis, db
+print(json.dumps({{
+    "elapsed": elapsed,
+    "loaded": [name for name in ("boto3", "streamlit", "tornado") if name in sys.modules],
+    "engine_created": db._engine is not None,
+    "client_created": analysis._model_client is not None,
+}}))
+"""
+
+def import_in_subprocess(modules, tmp_path):
+    """Import ``modules`` in a fresh interpreter without AWS credentials."""
+    env = {key: value for key, value in os.environ.items() if not key.startswith("AWS_")}
+    env["PYTHONPATH"] = APP_DIR
+    # Compile bytecode up front so the measurement does not include compilation
+    subprocess.run([sys.executable, "-c", PROBE.format(modules=modules)], cwd=tmp_path, env=env, capture_output=True)
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE.format(modules=modules)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def test_core_modules_import_cheaply(tmp_path):
+    result = import_in_subprocess("analysis, persistence, timeline, jobs", tmp_path)
+    assert result["loaded"] == []
+    assert not result["engine_created"]
+    assert not result["client_created"]
+    assert result["elapsed"] < CORE_IMPORT_BUDGET, f"core import took {result['elapsed']:.2f}s"
+
+def test_main_imports_without_credentials_or_side_effects(tmp_path):
+    result = import_in_subprocess("main", tmp_path)
+    assert "boto3" not in result["loaded"]
+    assert not result["engine_created"]
+    assert not result["client_created"]
+    assert not (tmp_path / "photoword.db").exists()
+    assert result["elapsed"] < MAIN_IMPORT_BUDGET, f"main import took {result['elapsed']:.2f}s"
@@ -0,0 +1,155 @@
+import time
+from models import SpanishVocabulary
+from models_db import Image, VocabularyEntry, AnalysisJob
+import jobs
+from jobs import (
+    JobWorkerPool, LeaseHeartbeat, enqueue_analysis, claim_next_job, complete_job, fail_job,
+    get_active_job_ids, process_job
+)
+from usage import BudgetExceededError
+
+VOCAB = [
+    SpanishVocabulary(
+        word="mesa",
+        part_of_speech="名詞",
+        translation="テーブル",
+        example_sentence="Hay una mesa junto a la ventana."
+    )
+]
+
+def persist(db, user_id, image_data, vocab_list):
+    """Minimal persistence used in place of persistence.persist_analysis."""
+    image = Image(user_id=user_id, image_data=image_data)
+    db.add(image)
+    db.flush()
+    for item in vocab_list:
+        db.add(VocabularyEntry(
+            user_id=user_id,
+            image_id=image.id,
+            spanish_word=item.word,
+            part_of_speech=item.part_of_speech,
+            japanese_translation=item.translation,
+            example_sentence=item.example_sentence
+        ))
+    db.commit()
+    return image.id
+
+def test_enqueue_reuses_active_job(test_db, test_user):
+    """Re-submitting the same image while it is queued does not duplicate work."""
+    first = enqueue_analysis(test_db, test_user.id, b"image")
+    second = enqueue_analysis(test_db, test_user.id, b"image")
+    other = enqueue_analysis(test_db, test_user.id, b"other image")
+    assert first.id == second.id
+    assert other.id != first.id
+    assert get_active_job_ids(test_db, test_user.id) == [first.id, other.id]
+
+def test_claim_is_exclusive(test_db, test_user):
+    """A claimed job is not handed to a second worker."""
+    job = enqueue_analysis(test_db, test_user.id, b"image")
+    claimed = claim_next_job(test_db, "worker-1")
+    assert claimed.id == job.id
+    assert claimed.status == "running"
+    assert claimed.attempts == 1
+    assert claim_next_job(test_db, "worker-2") is None
+
+def test_expired_lease_is_reclaimed(test_db, test_user):
+    """Jobs of a crashed worker are picked up again after the lease expires."""
+    enqueue_analysis(test_db, test_user.id, b"image")
+    claimed = claim_next_job(test_db, "worker-1")
+    claimed.locked_until = time.time() - 1
+    test_db.commit()
+    reclaimed = claim_next_job(test_db, "worker-2")
+    assert reclaimed.id == claimed.id
+    assert reclaimed.locked_by == "worker-2"
+    assert reclaimed.attempts == 2
+
+def test_late_completion_after_lease_expired_is_dropped(session_factory, test_db, test_user):
+    """A worker whose lease expired and was reclaimed cannot complete or fail the job."""
+    job = enqueue_analysis(test_db, test_user.id, b"image")
+    stale = claim_next_job(test_db, "worker-1")
+    other_db = session_factory()
+
+    def stalled_analyze(image_data, user_id):
+        # The worker stalls past its lease and another worker takes over
+        other_db.query(AnalysisJob).filter(AnalysisJob.id == job.id).update({AnalysisJob.locked_until: time.time() - 1})
+        other_db.commit()
+        assert claim_next_job(other_db, "worker-2").id == job.id
+        return VOCAB
+
+    saved = []
+    process_job(test_db, stale, stalled_analyze, lambda *args: saved.append(args) or 1)
+    assert saved == []
+
+    assert not complete_job(test_db, stale, image_id=1, worker_id="worker-1")
+    assert not fail_job(test_db, stale, "late", worker_id="worker-1")
+    test_db.expire_all()
+    job = test_db.get(AnalysisJob, job.id)
+    assert (job.status, job.locked_by, job.image_id, job.error) == ("running", "worker-2", None, None)
+    other_db.close()
+
+def test_heartbeat_extends_the_lease(test_db, test_user):
+    """The lease of a running job is renewed while it is processed."""
+    job = enqueue_analysis(test_db, test_user.id, b"image")
+    claimed = claim_next_job(test_db, "worker-1")
+    first_deadline = claimed.locked_until
+    test_db.commit()
+    with LeaseHeartbeat(test_db.get_bind(), job.id, "worker-1", interval=0.05) as heartbeat:
+        time.sleep(0.2)
+    test_db.expire_all()
+    assert test_db.get(AnalysisJob, job.id).locked_until > first_deadline
+    assert not heartbeat.lost
+
+def test_failures_are_retried_then_failed(test_db, test_user, monkeypatch):
+    """Failed attempts are rescheduled until max_attempts is reached."""
+    monkeypatch.setattr(jobs, "RETRY_BASE_DELAY", 0)
+    job = enqueue_analysis(test_db, test_user.id, b"image", max_attempts=2)
+
+    def failing_analyze(image_data, user_id):
+        raise TimeoutError("timeout")
+
+    process_job(test_db, claim_next_job(test_db, "worker"), failing_analyze, persist)
+    test_db.refresh(job)
+    assert job.status == "queued"
+    assert job.error == "timeout"
+    # The retry still needs the image
+    assert job.image_data == b"image"
+
+    process_job(test_db, claim_next_job(test_db, "worker"), failing_analyze, persist)
+    test_db.refresh(job)
+    assert job.status == "failed"
+    assert job.attempts == 2
+    assert job.image_data == b""
+    assert claim_next_job(test_db, "worker") is None
+
+def test_budget_exceeded_is_not_retried(test_db, test_user):
+    """A job over the user's budget fails immediately instead of backing off."""
+    job = enqueue_analysis(test_db, test_user.id, b"image", max_attempts=3)
+
+    def over_budget(image_data, user_id):
+        raise BudgetExceededError(user_id, 1.0, 0.5)
+
+    process_job(test_db, claim_next_job(test_db, "worker"), over_budget, persist)
+    test_db.refresh(job)
+    assert job.status == "failed"
+    assert job.attempts == 1
+
+def test_worker_pool_processes_jobs(session_factory, test_db, test_user):
+    """Worker threads analyze and persist queued jobs."""
+    job = enqueue_analysis(test_db, test_user.id, b"image")
+    pool = JobWorkerPool(session_factory, lambda image_data, user_id: VOCAB, persist, concurrency=2, poll_interval=0.05)
+    pool.start()
+    try:
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            test_db.expire_all()
+            if test_db.get(AnalysisJob, job.id).status == "done":
+                break
+            time.sleep(0.05)
+    finally:
+        pool.stop(timeout=5)
+
+    job = test_db.get(AnalysisJob, job.id)
+    assert job.status == "done"
+    assert job.image_data == b""
+    vocab = test_db.query(VocabularyEntry).filter(VocabularyEntry.image_id == job.image_id).all()
+    assert [v.spanish_word for v in vocab] == ["mesa"]
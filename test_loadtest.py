@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+LOADTEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "loadtest.py")
+ACTIONS = ["initial_load", "upload", "search", "clear_search", "paginate"]
+
+def test_single_session_load_test_reports_no_errors(tmp_path):
+    """One session against the fake model backend completes every action without errors."""
+    env = {key: value for key, value in os.environ.items() if key not in ("DATABASE_URL", "PHOTOWORD_CASSETTE")}
+    workdir = tmp_path / "new" / "workdir"
+    completed = subprocess.run(
+        [sys.executable, LOADTEST, "--sessions", "1", "--iterations", "1", "--latency", "0",
+         "--timeout", "60", "--workdir", str(workdir)],
+        capture_output=True, text=True, env=env, timeout=300
+    )
+    assert completed.returncode == 0, completed.stderr
+    assert (workdir / "photoword.db").exists()
+
+    lines = completed.stdout.splitlines()
+    rows = {line.split()[0]: line.split() for line in lines if line.split() and line.split()[0] in ACTIONS}
+    assert sorted(rows) == sorted(ACTIONS), completed.stdout
+    for action, columns in rows.items():
+        assert columns[1] != "0" and columns[-1] == "0.0%", f"{action}: {' '.join(columns)}"
+    assert any(line.startswith("db: ") and line.endswith(" 0 'database is locked' errors") for line in lines)
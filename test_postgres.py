@@ -0,0 +1,114 @@
+import os
+import threading
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+import fuzzy_search
+from db import engine_options, normalize_database_url
+from fuzzy_search import TrigramIndex
+from jobs import claim_next_job, enqueue_analysis
+from models import SpanishVocabulary
+from models_db import AnalysisJob, User
+from persistence import persist_analysis
+from timeline import get_image_data, get_timeline_entries
+
+TEST_POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
+requires_postgres = pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL is not set")
+
+def test_normalize_database_url():
+    assert normalize_database_url("postgres://u:p@db/photoword") == "postgresql+psycopg://u:p@db/photoword"
+    assert normalize_database_url("postgresql://db/photoword") == "postgresql+psycopg://db/photoword"
+    assert normalize_database_url("postgresql+psycopg2://db/photoword") == "postgresql+psycopg2://db/photoword"
+    assert normalize_database_url("sqlite:///photoword.db") == "sqlite:///photoword.db"
+
+def test_engine_options(monkeypatch):
+    assert engine_options("sqlite:///photoword.db") == {"echo": True}
+    monkeypatch.setenv("PHOTOWORD_DB_POOL_SIZE", "8")
+    options = engine_options("postgresql+psycopg://db/photoword")
+    assert options["pool_size"] == 8
+    assert options["max_overflow"] == 10
+    assert options["pool_pre_ping"]
+
+@pytest.fixture
+def pg_engine(monkeypatch):
+    """Migrate the test database to head and back down to an empty schema afterwards."""
+    pytest.importorskip("psycopg")
+    from alembic import command
+    from alembic.config import Config
+
+    url = normalize_database_url(TEST_POSTGRES_URL)
+    monkeypatch.setenv("DATABASE_URL", url)
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    command.downgrade(config, "base")
+    command.upgrade(config, "head")
+    engine = create_engine(url, **{**engine_options(url), "echo": False})
+    monkeypatch.setattr(fuzzy_search, "vocabulary_index", TrigramIndex())
+    yield engine
+    engine.dispose()
+    command.downgrade(config, "base")
+
+@pytest.fixture
+def pg_session_factory(pg_engine):
+    return sessionmaker(bind=pg_engine, autoflush=False, autocommit=False)
+
+@requires_postgres
+def test_migrations_create_postgres_indexes(pg_engine):
+    indexes = {index["name"] for index in inspect(pg_engine).get_indexes("vocabulary_entries")}
+    assert "ix_vocabulary_entries_spanish_word_trgm" in indexes
+    assert "ix_vocabulary_entries_lemma_key" in indexes
+    with pg_engine.connect() as conn:
+        storage = conn.execute(text(
+            "SELECT attstorage FROM pg_attribute WHERE attrelid = 'images'::regclass AND attname = 'image_data'"
+        )).scalar()
+    assert storage == "e"
+
+@requires_postgres
+def test_persist_and_search_on_postgres(pg_session_factory):
+    db = pg_session_factory()
+    user = User(username="alice")
+    db.add(user)
+    db.commit()
+    image_data = bytes(range(256)) * 100
+    vocab = [SpanishVocabulary(word="Ventana", part_of_speech="名詞", translation="窓", example_sentence="La ventana está abierta.")]
+    image_id = persist_analysis(db, user.id, image_data, vocab)
+
+    assert get_image_data(db, image_id) == image_data
+    assert [entry.id for entry in get_timeline_entries(db, user.id, search_term="VENT")] == [image_id]
+    fuzzy_search.vocabulary_index.refresh(db)
+    assert [entry.id for entry in get_timeline_entries(db, user.id, search_term="bentana")] == [image_id]
+    db.close()
+
+@requires_postgres
+def test_concurrent_claims_on_postgres(pg_session_factory):
+    db = pg_session_factory()
+    user = User(username="bob")
+    db.add(user)
+    db.commit()
+    for i in range(20):
+        enqueue_analysis(db, user.id, f"image {i}".encode())
+    db.close()
+
+    claimed, lock = [], threading.Lock()
+
+    def worker(worker_id):
+        session = pg_session_factory()
+        try:
+            while (job := claim_next_job(session, worker_id)) is not None:
+                with lock:
+                    claimed.append(job.id)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=worker, args=(f"worker-{n}",)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db = pg_session_factory()
+    assert sorted(claimed) == sorted(job_id for (job_id,) in db.query(AnalysisJob.id))
+    assert len(set(claimed)) == 20
+    db.close()
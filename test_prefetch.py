@@ -0,0 +1,84 @@
+import hashlib
+from pathlib import Path
+import pytest
+from sqlalchemy import event
+from models_db import User, Image, VocabularyEntry
+from image_cache import ByteLRUCache
+from image_server import load_image_cached
+from prefetch import Prefetcher, PrefetchTask
+from timeline_cache import TimelineCache, bump_user_version, get_user_version
+
+@pytest.fixture
+def image_data():
+    return (Path(__file__).parent / "test_image" / "test1_restaurant.jpg").read_bytes()
+
+@pytest.fixture
+def user_with_images(session_factory, image_data):
+    """A user with six images; each image gets distinct bytes and so a distinct hash."""
+    db = session_factory()
+    user = User(username="prefetch_user")
+    db.add(user)
+    db.commit()
+    hashes = []
+    for i in range(6):
+        data = image_data + f"prefetch:{i}".encode()
+        hashes.append(hashlib.sha256(data).hexdigest())
+        image = Image(user_id=user.id, image_data=data, content_hash=hashes[-1])
+        db.add(image)
+        db.flush()
+        db.add(VocabularyEntry(
+            user_id=user.id, image_id=image.id, spanish_word=f"palabra{i}",
+            part_of_speech="名詞", japanese_translation="単語", example_sentence="Ejemplo."
+        ))
+    bump_user_version(db, user.id)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id, hashes
+
+def test_byte_lru_cache_is_bounded_by_size():
+    cache = ByteLRUCache(max_bytes=10)
+    assert cache.put("a", b"12345")
+    assert cache.put("b", b"1234")
+    assert cache.get("a") == b"12345"
+    assert cache.put("c", b"123")
+    # "b" was the least recently used entry
+    assert "b" not in cache and "a" in cache and "c" in cache
+    assert cache.size == 8 and cache.evictions == 1
+    assert not cache.put("big", b"x" * 11)
+    assert cache.get("b") is None
+    assert cache.stats()["hit_rate"] == pytest.approx(0.5)
+
+def test_prefetch_warms_next_page_and_images(engine, session_factory, user_with_images, image_data):
+    user_id, hashes = user_with_images
+    page_cache, image_cache = TimelineCache(), ByteLRUCache(max_bytes=10 * 1024 * 1024)
+    prefetcher = Prefetcher(session_factory, page_cache=page_cache, cache=image_cache)
+    db = session_factory()
+    version = get_user_version(db, user_id)
+    first_page = page_cache.get_entries(db, user_id, skip=0, limit=3, version=version)
+    visible = [entry.image_hash for entry in first_page]
+
+    task = PrefetchTask(user_id, version, skip=3, limit=3, thumbnail_hashes=tuple(visible), image_hashes=(visible[0],))
+    assert prefetcher.schedule(task)
+    assert not prefetcher.schedule(task)
+    assert prefetcher.run_once(timeout=0)
+    assert prefetcher.completed == 1 and not prefetcher.failed
+    assert (page_cache.hits, page_cache.misses, image_cache.hits, image_cache.misses) == (0, 1, 0, 0)
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    second_page = page_cache.get_entries(db, user_id, skip=3, limit=3, version=version)
+    assert {entry.image_hash for entry in second_page} | set(visible) == set(hashes)
+    for content_hash in hashes:
+        assert load_image_cached(db, content_hash, thumbnail=True, cache=image_cache) is not None
+    assert load_image_cached(db, visible[0], thumbnail=False, cache=image_cache).startswith(image_data)
+    assert statements == []
+    stats = prefetcher.stats()
+    assert stats["page_hits"] == 1 and stats["images"]["hit_rate"] == 1.0
+    db.close()
+
+def test_full_queue_drops_tasks(session_factory):
+    prefetcher = Prefetcher(session_factory, page_cache=TimelineCache(), cache=ByteLRUCache(), max_pending=1)
+    assert prefetcher.schedule(PrefetchTask(1, 0, skip=5, limit=5))
+    assert not prefetcher.schedule(PrefetchTask(1, 0, skip=10, limit=5))
+    assert prefetcher.dropped == 1
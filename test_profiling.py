@@ -0,0 +1,66 @@
+import json
+import os
+import time
+import pytest
+from sqlalchemy import create_engine, text
+import db
+import profiling
+from profiling import profile, profiling_requested
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+    monkeypatch.setattr(db, "_engine", engine)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    monkeypatch.delenv("PHOTOWORD_PROFILE", raising=False)
+    monkeypatch.delenv("PHOTOWORD_PROFILE_TOKEN", raising=False)
+    yield tmp_path / "profiles"
+    engine.dispose()
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+def test_profiling_requested(monkeypatch, profile_dir):
+    assert not profiling_requested()
+    assert not profiling_requested("secret")
+    monkeypatch.setenv("PHOTOWORD_PROFILE_TOKEN", "secret")
+    assert not profiling_requested("wrong")
+    assert not profiling_requested("sécret")
+    assert profiling_requested("secret")
+    monkeypatch.setenv("PHOTOWORD_PROFILE", "1")
+    assert profiling_requested()
+
+def test_disabled_profile_writes_nothing(profile_dir):
+    with profile("rerun") as base:
+        assert base is None
+    assert not profile_dir.exists()
+
+def test_sampling_profile_writes_folded_stacks_and_sql(profile_dir):
+    with profile("rerun", enabled=True) as base:
+        with db.get_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 1"))
+        busy(0.05)
+
+    with open(f"{base}.folded") as f:
+        lines = f.read().splitlines()
+    assert lines
+    assert any("busy (test_profiling.py" in line for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+    with open(f"{base}.sql.json") as f:
+        stats = json.load(f)
+    assert stats["name"] == "rerun"
+    assert stats["sql"]["statements"] == 2
+    assert stats["sql"]["by_statement"][0] == {"statement": "SELECT 1", "count": 2, "seconds": pytest.approx(stats["sql"]["seconds"])}
+
+def test_cprofile_mode_and_nesting(profile_dir, monkeypatch):
+    monkeypatch.setenv("PHOTOWORD_PROFILER", "cprofile")
+    with profile("outer", enabled=True) as outer:
+        with profile("inner", enabled=True) as inner:
+            assert inner is None
+        busy(0.01)
+    assert os.path.exists(f"{outer}.prof")
+    assert len(os.listdir(profile_dir)) == 2
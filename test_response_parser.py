@@ -0,0 +1,175 @@
+import io
+import json
+import pytest
+import analysis
+from analysis import MAX_CONTINUATIONS, request_vocabulary
+from models import AnalysisResult
+from response_parser import salvage_vocabulary, salvage_lemmas, merge_vocabulary_items
+
+ITEMS = [
+    {
+        "word": "mesa",
+        "part_of_speech": "名詞",
+        "translation": "テーブル",
+        "example_sentence": "Hay una mesa junto a la ventana."
+    },
+    {
+        "word": "silla",
+        "part_of_speech": "名詞",
+        "translation": "椅子",
+        "example_sentence": "La silla es muy cómoda."
+    },
+    {
+        "word": "ventana",
+        "part_of_speech": "名詞",
+        "translation": "窓",
+        "example_sentence": "La ventana está abierta."
+    }
+]
+
+def test_complete_response():
+    """A well-formed response is parsed completely."""
+    text = "以下が単語リストです。\n" + json.dumps({"vocabulary": ITEMS}, ensure_ascii=False, indent=2)
+    result = salvage_vocabulary(text)
+    assert result.found_json
+    assert result.complete
+    assert result.items == ITEMS
+
+def test_truncated_response_keeps_complete_items():
+    """Items before the truncation point are recovered."""
+    text = json.dumps({"vocabulary": ITEMS}, ensure_ascii=False, indent=2)
+    truncated = text[:text.index('"ventana"') + 20]
+    result = salvage_vocabulary(truncated)
+    assert result.found_json
+    assert not result.complete
+    assert [item["word"] for item in result.items] == ["mesa", "silla"]
+
+def test_malformed_item_is_skipped():
+    """A single malformed or incomplete object does not discard the others."""
+    text = (
+        '{"vocabulary": [\n'
+        + json.dumps(ITEMS[0], ensure_ascii=False) + ",\n"
+        + '{"word": "rota", "part_of_speech": "形容詞" "translation": "壊れた"},\n'
+        + '{"word": "suelo", "part_of_speech": "名詞", "translation": "床"},\n'
+        + json.dumps(ITEMS[1], ensure_ascii=False) + ",\n"
+        + "]}"
+    )
+    result = salvage_vocabulary(text)
+    assert [item["word"] for item in result.items] == ["mesa", "silla"]
+    assert result.complete
+
+def test_no_json():
+    """Plain text without JSON is reported as such."""
+    result = salvage_vocabulary("申し訳ありませんが、画像を解析できませんでした。")
+    assert not result.found_json
+    assert result.items == []
+
+def test_merge_skips_duplicate_words():
+    """Continuation items already collected are not added twice."""
+    merged = merge_vocabulary_items(ITEMS[:2], [dict(ITEMS[1], word="Silla"), ITEMS[2]])
+    assert [item["word"] for item in merged] == ["mesa", "silla", "ventana"]
+
+def test_salvage_lemmas():
+    """Scene and lemmas are read from a first-phase response."""
+    scene, lemmas = salvage_lemmas('```json\n{"scene": "レストランの店内", "words": ["mesa", "silla", "mesa"]}\n```')
+    assert scene == "レストランの店内"
+    assert lemmas == ["mesa", "silla"]
+
+def test_salvage_lemmas_truncated():
+    """Only complete lemmas are kept from a truncated list."""
+    scene, lemmas = salvage_lemmas('{"scene": "窓際", "words": ["ventana", "cortina", "lámp')
+    assert lemmas == ["ventana", "cortina"]
+
+def test_salvage_lemmas_without_list():
+    with pytest.raises(ValueError):
+        salvage_lemmas("画像を解析できませんでした。")
+
+class ScriptedClient:
+    """Bedrock client stand-in returning (text, stop_reason) pairs in order and recording the requests."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.requests.append(json.loads(body))
+        text, stop_reason = self.responses.pop(0)
+        response_body = {
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": stop_reason,
+            "usage": {"input_tokens": 100, "output_tokens": 10}
+        }
+        return {"body": io.BytesIO(json.dumps(response_body).encode("utf-8"))}
+
+def vocabulary_json(items):
+    return json.dumps({"vocabulary": items}, ensure_ascii=False, indent=2)
+
+def truncated_after(items, word):
+    """A response cut off in the middle of the item for ``word``."""
+    text = vocabulary_json(items)
+    return text[:text.index(f'"{word}"') + 5]
+
+MESSAGES = [{"role": "user", "content": "画像の単語を挙げてください"}]
+
+def test_truncated_response_is_continued_and_merged(monkeypatch):
+    """A response stopped at max_tokens is continued with only the missing words."""
+    client = ScriptedClient([
+        (truncated_after(ITEMS, "ventana"), "max_tokens"),
+        # The remainder repeats one word, which is merged away
+        (vocabulary_json(ITEMS[1:]), "end_turn"),
+    ])
+    monkeypatch.setattr(analysis, "_model_client", client)
+    result = AnalysisResult()
+
+    items = request_vocabulary(MESSAGES, result)
+
+    assert items == ITEMS
+    assert (result.model_calls, result.continuation_calls, result.calls_saved) == (2, 1, 1)
+    assert (result.input_tokens, result.output_tokens) == (200, 20)
+    continuation = client.requests[1]["messages"]
+    assert continuation[0] == MESSAGES[0]
+    assert json.loads(continuation[1]["content"]) == {"vocabulary": ITEMS[:2]}
+    assert "mesa, silla" in continuation[2]["content"]
+
+def test_truncation_before_the_first_item_saves_no_call(monkeypatch):
+    """Nothing salvaged means the continuation is not counted as a saved re-analysis."""
+    client = ScriptedClient([
+        (truncated_after(ITEMS, "mesa"), "max_tokens"),
+        (vocabulary_json(ITEMS), "end_turn"),
+    ])
+    monkeypatch.setattr(analysis, "_model_client", client)
+    result = AnalysisResult()
+
+    assert request_vocabulary(MESSAGES, result) == ITEMS
+    assert (result.continuation_calls, result.calls_saved) == (1, 0)
+    assert "なし" in client.requests[1]["messages"][2]["content"]
+
+def test_continuations_are_capped(monkeypatch):
+    """A model that keeps hitting max_tokens gets at most MAX_CONTINUATIONS continuations."""
+    words = [dict(ITEMS[0], word=f"palabra{i}") for i in range(MAX_CONTINUATIONS + 3)]
+    client = ScriptedClient([
+        (vocabulary_json(words[i:i + 1]), "max_tokens") for i in range(len(words))
+    ])
+    monkeypatch.setattr(analysis, "_model_client", client)
+    result = AnalysisResult()
+
+    items = request_vocabulary(MESSAGES, result)
+
+    assert items == words[:MAX_CONTINUATIONS + 1]
+    assert result.continuation_calls == MAX_CONTINUATIONS
+    assert result.model_calls == MAX_CONTINUATIONS + 1
+    assert len(client.responses) == 2
+
+def test_continuation_without_new_words_stops(monkeypatch):
+    """A continuation that adds nothing ends the loop even if it was truncated again."""
+    client = ScriptedClient([
+        (vocabulary_json(ITEMS[:2]), "max_tokens"),
+        (vocabulary_json(ITEMS[:1]), "max_tokens"),
+        (vocabulary_json(ITEMS[2:]), "end_turn"),
+    ])
+    monkeypatch.setattr(analysis, "_model_client", client)
+    result = AnalysisResult()
+
+    assert request_vocabulary(MESSAGES, result) == ITEMS[:2]
+    assert (result.model_calls, result.continuation_calls) == (2, 1)
+    assert len(client.responses) == 1
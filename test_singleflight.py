@@ -0,0 +1,93 @@
+import threading
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from db import Base
+from singleflight import SingleFlight, LeaseSingleFlight
+
+@pytest.fixture
+def lease_session_factory(tmp_path):
+    """Session factory bound to a fresh SQLite database with the lease table."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'lease.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    engine.dispose()
+
+def run_concurrently(flights, key, fn, callers=8):
+    """Call ``flight.do`` from several threads, spreading them over the given flights."""
+    results = []
+    errors = []
+    barrier = threading.Barrier(callers)
+
+    def worker(flight):
+        barrier.wait()
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(flights[i % len(flights)],)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+def test_concurrent_callers_share_one_call():
+    """Only the first caller runs the function; the others get its result."""
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.2)
+        return ["mesa", "silla"]
+
+    results, errors = run_concurrently([SingleFlight()], "image-hash", slow_call)
+    assert not errors
+    assert len(calls) == 1
+    assert results == [["mesa", "silla"]] * 8
+
+def test_errors_propagate_and_are_not_cached():
+    """A failing call raises in every waiter and the next call runs again."""
+    flight = SingleFlight()
+
+    def failing_call():
+        time.sleep(0.1)
+        raise TimeoutError("timeout")
+
+    results, errors = run_concurrently([flight], "image-hash", failing_call, callers=4)
+    assert not results
+    assert len(errors) == 4
+    assert all(isinstance(e, TimeoutError) for e in errors)
+    assert flight.in_flight() == 0
+    assert flight.do("image-hash", lambda: "ok") == "ok"
+
+def test_lease_coalesces_across_processes(lease_session_factory):
+    """Two lease flights (standing in for two processes) share one call."""
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.3)
+        return ["ventana"]
+
+    flights = [
+        LeaseSingleFlight(lease_session_factory, ",".join, lambda s: s.split(","), poll_interval=0.05)
+        for _ in range(2)
+    ]
+    results, errors = run_concurrently(flights, "image-hash", slow_call, callers=6)
+    assert not errors
+    assert len(calls) == 1
+    assert results == [["ventana"]] * 6
+
+def test_lease_is_released_on_failure(lease_session_factory):
+    """A failed leader releases the lease so the next caller can retry."""
+    flight = LeaseSingleFlight(lease_session_factory, str, str, poll_interval=0.05)
+
+    def failing_call():
+        raise ValueError("bad json")
+
+    with pytest.raises(ValueError):
+        flight.do("image-hash", failing_call)
+    assert flight.do("image-hash", lambda: "retried") == "retried"
@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import event
+from timeline_cache import TimelineCache, get_user_version
+
+@pytest.fixture
+def query_counter(engine):
+    """Count SQL statements executed against the test engine."""
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_repeated_reads_hit_cache(test_db, test_user, query_counter, add_image):
+    """Identical requests are served without touching the database."""
+    add_image(test_db, test_user.id, ("mesa", "訳"))
+    cache = TimelineCache()
+    version = get_user_version(test_db, test_user.id)
+    first = cache.get_entries(test_db, test_user.id, limit=5, version=version)
+    executed = len(query_counter)
+    second = cache.get_entries(test_db, test_user.id, limit=5, version=version)
+    assert second is first
+    assert len(query_counter) == executed
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+def test_writes_invalidate_cached_pages(session_factory, test_db, test_user, add_image):
+    """A write committed by another process (its own session) makes new data visible."""
+    add_image(test_db, test_user.id, ("mesa", "訳"))
+    cache = TimelineCache()
+    assert len(cache.get_entries(test_db, test_user.id)) == 1
+    version = get_user_version(test_db, test_user.id)
+    other_process = session_factory()
+    add_image(other_process, test_user.id, ("silla", "訳"))
+    other_process.close()
+    test_db.commit()
+    assert get_user_version(test_db, test_user.id) == version + 1
+    entries = cache.get_entries(test_db, test_user.id)
+    assert sorted(e.vocabulary_entries[0].spanish_word for e in entries) == ["mesa", "silla"]
+
+def test_filters_are_part_of_the_key(test_db, test_user, add_image):
+    """Different filters and pages are cached separately."""
+    add_image(test_db, test_user.id, ("mesa", "訳"))
+    add_image(test_db, test_user.id, ("silla", "訳"))
+    cache = TimelineCache()
+    assert len(cache.get_entries(test_db, test_user.id, search_term="mesa")) == 1
+    assert len(cache.get_entries(test_db, test_user.id, search_term="silla")) == 1
+    assert len(cache.get_entries(test_db, test_user.id, skip=1, limit=1)) == 1
+    assert cache.misses == 3
+
+def test_cached_entries_are_detached(session_factory, test_user, add_image):
+    """Cached entries remain usable after their session is closed."""
+    db = session_factory()
+    add_image(db, test_user.id, ("ventana", "訳"))
+    entries = TimelineCache().get_entries(db, test_user.id)
+    db.close()
+    vocab = entries[0].vocabulary_entries[0]
+    assert vocab.spanish_word == "ventana"
+    assert entries[0].image_data is None
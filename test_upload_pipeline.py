@@ -0,0 +1,68 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import pytest
+from upload_pipeline import (
+    ENCODE_CHUNK_SIZE,
+    Base64Image,
+    UploadTooLargeError,
+    build_request_body,
+    check_upload_size,
+    encode_base64_into,
+    hash_stream,
+)
+
+@pytest.mark.parametrize("length", [0, 1, 2, 3, 4, ENCODE_CHUNK_SIZE - 1, ENCODE_CHUNK_SIZE, ENCODE_CHUNK_SIZE * 2 + 5])
+def test_encode_base64_into_matches_stdlib(length):
+    data = os.urandom(length)
+    encoded = encode_base64_into(data)
+    assert isinstance(encoded, bytearray)
+    assert bytes(encoded) == base64.b64encode(data)
+
+def test_hash_stream_matches_sha256_and_keeps_position():
+    data = os.urandom(3 * 1024 + 17)
+    stream = io.BytesIO(data)
+    stream.seek(10)
+    assert hash_stream(stream, chunk_size=1024) == hashlib.sha256(data).hexdigest()
+    assert stream.tell() == 10
+
+def test_check_upload_size():
+    check_upload_size(100, limit=100)
+    with pytest.raises(UploadTooLargeError) as exc_info:
+        check_upload_size(101, limit=100)
+    assert exc_info.value.size == 101
+    assert exc_info.value.limit == 100
+    assert isinstance(exc_info.value, ValueError)
+
+def test_build_request_body_splices_images():
+    first, second = os.urandom(1000), os.urandom(10)
+    payload = {
+        "max_tokens": 100,
+        "messages": [
+            {"role": "user", "content": [
+                {"type": "image", "source": {"type": "base64", "data": Base64Image(first)}},
+                {"type": "text", "text": "¿Qué hay en la foto? 写真"},
+            ]},
+            {"role": "assistant", "content": "{}"},
+            {"role": "user", "content": [
+                {"type": "image", "source": {"type": "base64", "data": Base64Image(second)}},
+            ]},
+        ],
+    }
+    body = build_request_body(payload)
+
+    assert isinstance(body, bytearray)
+    decoded = json.loads(body)
+    assert decoded["messages"][0]["content"][0]["source"]["data"] == base64.b64encode(first).decode()
+    assert decoded["messages"][0]["content"][1]["text"] == "¿Qué hay en la foto? 写真"
+    assert decoded["messages"][2]["content"][0]["source"]["data"] == base64.b64encode(second).decode()
+
+def test_build_request_body_rejects_unknown_objects():
+    with pytest.raises(TypeError):
+        build_request_body({"data": object()})
+
+def test_build_request_body_rejects_placeholder_text():
+    with pytest.raises(ValueError):
+        build_request_body({"text": "@@photoword-image@@"})
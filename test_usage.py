@@ -0,0 +1,132 @@
+import hashlib
+import pytest
+import analysis
+from fake_model import FakeModelClient
+from models import AnalysisResult
+from models_db import User, ModelUsage, ModelUsageDaily
+from persistence import persist_analysis
+from singleflight import SingleFlight
+from test_response_parser import ScriptedClient
+from usage import (
+    BudgetExceededError,
+    check_budget,
+    estimate_cost,
+    get_usage_rollups,
+    record_usage,
+    usage_day,
+)
+
+DAY1 = 1760832000.0  # 2025-10-19 00:00 UTC
+DAY2 = DAY1 + 86400
+
+@pytest.fixture
+def users(test_db):
+    users = [User(username="alice"), User(username="bob", daily_budget_usd=1.0)]
+    test_db.add_all(users)
+    test_db.commit()
+    return users
+
+def usage(calls, input_tokens, output_tokens):
+    return AnalysisResult(model_calls=calls, input_tokens=input_tokens, output_tokens=output_tokens)
+
+def test_record_usage_rolls_up_per_user_and_day(test_db, users):
+    alice, bob = users
+    record_usage(test_db, alice.id, "h1", "model", usage(1, 1000, 100), now=DAY1)
+    record_usage(test_db, alice.id, "h2", "model", usage(2, 2000, 200), now=DAY1 + 60)
+    record_usage(test_db, alice.id, "h3", "model", usage(1, 500, 50), now=DAY2)
+    record_usage(test_db, bob.id, "h1", "model", usage(1, 4000, 0), now=DAY1)
+
+    assert test_db.query(ModelUsage).count() == 4
+    rollups = {(r.user_id, r.day): r for r in get_usage_rollups(test_db)}
+    day1 = rollups[(alice.id, usage_day(DAY1))]
+    assert (day1.model_calls, day1.input_tokens, day1.output_tokens) == (3, 3000, 300)
+    assert day1.cost_usd == pytest.approx(estimate_cost(3000, 300))
+    assert rollups[(alice.id, usage_day(DAY2))].model_calls == 1
+    assert [r.day for r in get_usage_rollups(test_db, user_id=alice.id)] == [usage_day(DAY2), usage_day(DAY1)]
+    assert len(get_usage_rollups(test_db, since=usage_day(DAY2))) == 1
+
+def test_check_budget(test_db, users, monkeypatch):
+    alice, bob = users
+    monkeypatch.delenv("PHOTOWORD_DAILY_BUDGET_USD", raising=False)
+    day = usage_day(DAY1)
+    record_usage(test_db, alice.id, "h", "model", usage(1, 4_000_000, 0), now=DAY1)  # $1.00
+    check_budget(test_db, alice.id, day)  # no budget configured
+
+    monkeypatch.setenv("PHOTOWORD_DAILY_BUDGET_USD", "0.5")
+    with pytest.raises(BudgetExceededError) as exc_info:
+        check_budget(test_db, alice.id, day)
+    assert exc_info.value.spent == pytest.approx(1.0)
+    check_budget(test_db, alice.id, usage_day(DAY2))
+
+    # A per-user budget overrides the default
+    record_usage(test_db, bob.id, "h", "model", usage(1, 2_000_000, 0), now=DAY1)  # $0.50
+    check_budget(test_db, bob.id, day)
+    record_usage(test_db, bob.id, "h", "model", usage(1, 2_000_000, 0), now=DAY1)
+    with pytest.raises(BudgetExceededError):
+        check_budget(test_db, bob.id, day)
+
+def test_analysis_records_usage_and_links_image(session_factory, test_db, users, monkeypatch):
+    alice = users[0]
+    monkeypatch.setattr(analysis, "SessionLocal", session_factory)
+    monkeypatch.setattr(analysis, "_model_client", FakeModelClient())
+    monkeypatch.delenv("PHOTOWORD_ANALYSIS_MODE", raising=False)
+    image_data = b"\xff\xd8usage-test"
+
+    vocab = analysis.analyze_image_core(image_data, alice.id)
+    image_id = persist_analysis(test_db, alice.id, image_data, vocab)
+
+    row = test_db.query(ModelUsage).one()
+    assert row.user_id == alice.id
+    assert row.image_id == image_id
+    assert row.model_calls == 1
+    assert row.input_tokens > 0 and row.output_tokens > 0
+    daily = test_db.query(ModelUsageDaily).one()
+    assert daily.cost_usd == pytest.approx(row.cost_usd)
+
+def test_failed_analysis_still_records_usage(session_factory, test_db, users, monkeypatch):
+    """Calls made before the analysis failed are billed, so failing images count towards the budget."""
+    alice = users[0]
+    monkeypatch.setattr(analysis, "SessionLocal", session_factory)
+    monkeypatch.setattr(analysis, "_model_client", ScriptedClient([("画像を解析できませんでした。", "end_turn")]))
+    monkeypatch.delenv("PHOTOWORD_ANALYSIS_MODE", raising=False)
+
+    with pytest.raises(ValueError):
+        analysis.analyze_image_core(b"\xff\xd8unparsable", alice.id)
+
+    daily = test_db.query(ModelUsageDaily).one()
+    assert (daily.user_id, daily.model_calls, daily.input_tokens, daily.output_tokens) == (alice.id, 1, 100, 10)
+
+def test_analysis_refuses_over_budget(session_factory, test_db, users, monkeypatch):
+    bob = users[1]
+    client = FakeModelClient()
+    monkeypatch.setattr(analysis, "SessionLocal", session_factory)
+    monkeypatch.setattr(analysis, "_model_client", client)
+    record_usage(test_db, bob.id, "h", "model", usage(1, 4_000_000, 0))
+
+    with pytest.raises(BudgetExceededError):
+        analysis.analyze_image_core(b"image", bob.id)
+    assert client.calls == 0
+
+def test_shared_analysis_checks_each_callers_budget(session_factory, test_db, users, monkeypatch):
+    alice, bob = users
+    client = FakeModelClient()
+    flight = SingleFlight()
+    monkeypatch.setattr(analysis, "SessionLocal", session_factory)
+    monkeypatch.setattr(analysis, "_model_client", client)
+    monkeypatch.setattr(analysis, "_analysis_flight", flight)
+    monkeypatch.delenv("PHOTOWORD_DAILY_BUDGET_USD", raising=False)
+    monkeypatch.delenv("PHOTOWORD_ANALYSIS_MODE", raising=False)
+    record_usage(test_db, bob.id, "h", "model", usage(1, 4_000_000, 0))
+    image_data = b"\xff\xd8shared-budget"
+    key = hashlib.sha256(image_data).hexdigest()
+
+    # Bob is over budget and never joins the flight
+    with pytest.raises(BudgetExceededError):
+        analysis.analyze_image_shared(image_data, bob.id)
+    assert client.calls == 0
+
+    # Alice is within budget; the call she runs is billed to her
+    assert analysis.analyze_image_shared(image_data, alice.id)
+    assert client.calls == 1
+    test_db.expire_all()
+    assert [row.user_id for row in test_db.query(ModelUsage).filter(ModelUsage.image_hash == key)] == [alice.id]
@@ -0,0 +1,97 @@
+import json
+import pytest
+import analysis
+from fake_model import FakeModelClient
+from models import SpanishVocabulary
+from models_db import User, VocabularyEntry
+from word_knowledge import WordKnowledgeCache, normalize_lemma
+
+@pytest.fixture
+def known_words(test_db):
+    """Vocabulary saved by two different users."""
+    users = [User(username="alice"), User(username="bob")]
+    test_db.add_all(users)
+    test_db.commit()
+    rows = [
+        (users[0].id, "Mesa", "テーブル", "Hay una mesa."),
+        (users[1].id, "mesa", "机", "La mesa es grande."),
+        (users[1].id, "año", "年", "Este año viajo."),
+        (users[1].id, "LÁMPARA", "ランプ", "La lámpara está encendida."),
+    ]
+    for user_id, word, translation, sentence in rows:
+        test_db.add(VocabularyEntry(
+            user_id=user_id,
+            spanish_word=word,
+            part_of_speech="名詞",
+            japanese_translation=translation,
+            example_sentence=sentence
+        ))
+    test_db.commit()
+
+def test_normalize_lemma_keeps_accents():
+    assert normalize_lemma("  La  Mesa ") == "la mesa"
+    assert normalize_lemma("año") != normalize_lemma("ano")
+
+def test_partition_uses_shared_vocabulary(test_db, known_words):
+    """Words saved by any user are known; the newest entry wins."""
+    cache = WordKnowledgeCache()
+    known, unknown = cache.partition(test_db, ["MESA", "silla", "año", "ano"])
+    assert [(v.word, v.translation) for v in known] == [("mesa", "机"), ("año", "年")]
+    assert unknown == ["silla", "ano"]
+
+def test_lookups_are_served_from_memory(test_db, known_words):
+    cache = WordKnowledgeCache()
+    cache.lookup(test_db, ["mesa"])
+    assert cache.misses == 1
+    cache.lookup(test_db, ["mesa"])
+    assert cache.hits == 1
+
+def test_remember_adds_new_words(test_db):
+    cache = WordKnowledgeCache(max_words=1)
+    cache.remember([
+        SpanishVocabulary(word="silla", part_of_speech="名詞", translation="椅子", example_sentence="La silla."),
+        SpanishVocabulary(word="ventana", part_of_speech="名詞", translation="窓", example_sentence="La ventana."),
+    ])
+    known, unknown = cache.partition(test_db, ["silla", "ventana"])
+    assert [v.word for v in known] == ["ventana"]
+    assert unknown == ["silla"]
+
+def test_partition_folds_non_ascii_case(test_db, known_words):
+    """Accented capitals match although SQLite's lower() folds ASCII only."""
+    test_db.add(VocabularyEntry(
+        spanish_word="Ñandú", part_of_speech="名詞", japanese_translation="レア", example_sentence="El ñandú corre."
+    ))
+    test_db.commit()
+    known, unknown = WordKnowledgeCache().partition(test_db, ["lámpara", "ñandú", "Árbol"])
+    assert [v.word for v in known] == ["LÁMPARA", "Ñandú"]
+    assert unknown == ["Árbol"]
+
+class RecordingFakeClient(FakeModelClient):
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.requests.append(json.loads(body))
+        return super().invoke_model(modelId, body, **kwargs)
+
+def test_two_phase_analysis_generates_details_for_unknown_words_only(session_factory, known_words, monkeypatch):
+    """Known lemmas come from the vocabulary table; only the rest go to the detail call."""
+    monkeypatch.setattr(analysis, "SessionLocal", session_factory)
+    monkeypatch.setattr(analysis, "word_knowledge", WordKnowledgeCache())
+    monkeypatch.delenv("PHOTOWORD_ANALYSIS_MODE", raising=False)
+    monkeypatch.setattr(analysis, "_model_client", RecordingFakeClient())
+    single = analysis.analyze_image_detailed(b"\xff\xd8image")
+
+    monkeypatch.setenv("PHOTOWORD_ANALYSIS_MODE", "two_phase")
+    client = RecordingFakeClient()
+    monkeypatch.setattr(analysis, "_model_client", client)
+    result = analysis.analyze_image_detailed(b"\xff\xd8image")
+
+    lemma_request, detail_request = [request["messages"] for request in client.requests]
+    assert any(part.get("type") == "image" for part in lemma_request[0]["content"])
+    assert "単語: silla, ventana, comer, luminoso\n" in detail_request[0]["content"]
+    assert [(v.word, v.translation) for v in result.vocabulary[:2]] == [("mesa", "机"), ("LÁMPARA", "ランプ")]
+    assert [v.word for v in result.vocabulary[2:]] == ["silla", "ventana", "comer", "luminoso"]
+    assert (result.model_calls, result.cached_words) == (2, 2)
+    assert result.output_tokens < single.output_tokens
@@ -1,22 +1,35 @@
+from dataclasses import dataclass
 from typing import List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
 from sqlalchemy import desc, or_
 from models_db import User, Image, VocabularyEntry
+from image_cache import image_address
 from datetime import datetime
 
+@dataclass(frozen=True)
+class VocabularyItem:
+    """Detached, read-only copy of a vocabulary entry for display."""
+    id: int
+    spanish_word: str
+    part_of_speech: str
+    japanese_translation: str
+    example_sentence: str
+
 class TimelineEntry:
-    """Data class representing a timeline entry."""
+    """Data class representing a timeline entry; ``image_hash`` is the image's address (see ``image_address``)."""
     def __init__(
         self,
         id: int,
-        image_data: bytes,
+        image_data: Optional[bytes],
         created_at: datetime,
-        vocabulary_entries: List[VocabularyEntry]
+        vocabulary_entries: List[VocabularyItem],
+        image_hash: Optional[str] = None
     ):
         self.id = id
         self.image_data = image_data
         self.created_at = created_at
         self.vocabulary_entries = vocabulary_entries
+        self.image_hash = image_hash
 
 def get_timeline_entries(
     db: Session,
@@ -25,7 +38,9 @@ def get_timeline_entries(
     limit: int = 10,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    search_term: Optional[str] = None
+    search_term: Optional[str] = None,
+    include_image_data: bool = True,
+    fuzzy_fallback: bool = True
 ) -> List[TimelineEntry]:
     """
     Retrieve timeline entries for a user with pagination, date filtering, and search functionality.
@@ -38,14 +53,29 @@ def get_timeline_entries(
         start_date: Optional start date filter
         end_date: Optional end date filter
         search_term: Optional search term to filter vocabulary by Spanish or Japanese text
+        include_image_data: Whether to load the image bytes. When False, ``image_data``
+            is None and the bytes can be fetched on demand with ``get_image_data``
+        fuzzy_fallback: When nothing contains the search term, return entries with
+            similar vocabulary (typos, missing accents), best match first; there are none
+            while the fuzzy index is still loading
     
     Returns:
-        List of TimelineEntry objects filtered by the given criteria
+        List of TimelineEntry objects filtered by the given criteria. The entries hold
+        plain data and stay valid after the session is closed.
     """
     # Base query for images
-    query = db.query(Image).filter(Image.user_id == user_id)
+    base_query = db.query(Image).filter(Image.user_id == user_id)
+    if not include_image_data:
+        base_query = base_query.options(defer(Image.image_data))
+    
+    # Apply date filters if provided
+    if start_date:
+        base_query = base_query.filter(Image.created_at >= start_date)
+    if end_date:
+        base_query = base_query.filter(Image.created_at <= end_date)
     
     # Apply search filter if provided
+    query = base_query
     if search_term:
         # Join with VocabularyEntry to search in vocabulary
         query = query.join(VocabularyEntry, VocabularyEntry.image_id == Image.id)
@@ -56,30 +86,67 @@ def get_timeline_entries(
             )
         ).distinct()
     
-    # Apply date filters if provided
-    if start_date:
-        query = query.filter(Image.created_at >= start_date)
-    if end_date:
-        query = query.filter(Image.created_at <= end_date)
-    
     # Order by creation date (newest first) and apply pagination
     images = query.order_by(desc(Image.created_at)).offset(skip).limit(limit).all()
     
+    # Fall back to similar words only when the search has no exact matches at all
+    if search_term and fuzzy_fallback and not images and (skip == 0 or query.first() is None):
+        from fuzzy_search import fuzzy_image_ids
+
+        ranked_ids = fuzzy_image_ids(db, user_id, search_term)
+        if ranked_ids:
+            rank = {image_id: position for position, image_id in enumerate(ranked_ids)}
+            matches = base_query.filter(Image.id.in_(ranked_ids)).all()
+            images = sorted(matches, key=lambda image: rank[image.id])[skip:skip + limit]
+    
+    # Load the vocabulary for all images on the page in a single query
+    vocab_by_image = {image.id: [] for image in images}
+    if images:
+        vocab_rows = (
+            db.query(
+                VocabularyEntry.id,
+                VocabularyEntry.image_id,
+                VocabularyEntry.spanish_word,
+                VocabularyEntry.part_of_speech,
+                VocabularyEntry.japanese_translation,
+                VocabularyEntry.example_sentence
+            )
+            .filter(VocabularyEntry.image_id.in_(list(vocab_by_image)))
+            .order_by(VocabularyEntry.id)
+            .all()
+        )
+        for row in vocab_rows:
+            vocab_by_image[row.image_id].append(VocabularyItem(
+                id=row.id,
+                spanish_word=row.spanish_word,
+                part_of_speech=row.part_of_speech,
+                japanese_translation=row.japanese_translation,
+                example_sentence=row.example_sentence
+            ))
+    
     # Create timeline entries with associated vocabulary
     timeline_entries = []
     for image in images:
-        vocab_entries = (
-            db.query(VocabularyEntry)
-            .filter(VocabularyEntry.image_id == image.id)
-            .all()
-        )
-        
         entry = TimelineEntry(
             id=image.id,
-            image_data=image.image_data,
+            image_data=image.image_data if include_image_data else None,
             created_at=image.created_at,
-            vocabulary_entries=vocab_entries
+            vocabulary_entries=vocab_by_image[image.id],
+            image_hash=image_address(image.content_hash, image.archived_at)
         )
         timeline_entries.append(entry)
     
     return timeline_entries
+
+def get_image_data(db: Session, image_id: int) -> Optional[bytes]:
+    """
+    Load the bytes of a single image on demand.
+
+    Args:
+        db: Database session
+        image_id: ID of the image
+
+    Returns:
+        The image bytes, or None if the image does not exist
+    """
+    return db.query(Image.image_data).filter(Image.id == image_id).scalar()
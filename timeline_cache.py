@@ -0,0 +1,135 @@
+"""
+Process-wide cache of timeline pages with write-driven invalidation.
+
+Streamlit reruns the whole script on every widget interaction, which used to
+re-run the timeline queries each time. Pages are cached per
+(user, filters, page) and tagged with the user's data version, stored in
+``users.data_version``. Every write that changes a timeline bumps the version
+in its own transaction, so pages cached by any process (the app, the analysis
+workers, the compaction job) go stale together with the write, and a rerun
+needs a single primary-key read instead of the timeline queries.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import List, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from models_db import User
+from timeline import TimelineEntry, get_timeline_entries
+
+
+def get_user_version(db: Session, user_id: int) -> int:
+    """Return the current data version of a user (0 for unknown users)."""
+    version = db.query(User.data_version).filter(User.id == user_id).scalar()
+    return version or 0
+
+
+def bump_user_version(db: Session, user_id: int):
+    """
+    Invalidate all cached timeline pages of a user, in every process.
+
+    Call this inside the transaction of any write that changes what the user's
+    timeline shows; the new version becomes visible when the caller commits.
+
+    Args:
+        db: Database session of the write
+        user_id: User whose data changed
+    """
+    db.execute(update(User).where(User.id == user_id).values(data_version=User.data_version + 1))
+
+
+def _fuzzy_index_loaded() -> bool:
+    # Imported here so that numpy stays off the import path of non-search callers
+    from fuzzy_search import vocabulary_index
+
+    return vocabulary_index.loaded
+
+
+class TimelineCache:
+    """Bounded LRU of timeline pages keyed by user, version, filters and page."""
+
+    def __init__(self, max_pages: int = 64):
+        self.max_pages = max_pages
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pages: "OrderedDict[tuple, List[TimelineEntry]]" = OrderedDict()
+
+    def get_entries(
+        self,
+        db: Session,
+        user_id: int,
+        skip: int = 0,
+        limit: int = 10,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        search_term: Optional[str] = None,
+        version: Optional[int] = None
+    ) -> List[TimelineEntry]:
+        """
+        Return a timeline page, querying the database only on a cache miss.
+
+        Takes the same arguments as ``get_timeline_entries``, plus the user's
+        data version; pass the version read once at the start of a rerun to
+        avoid reading it for every page. Cached entries carry metadata and
+        vocabulary only; image bytes are loaded on demand.
+        """
+        return self._get(db, user_id, skip, limit, start_date, end_date, search_term, version, count=True)
+
+    def warm(
+        self,
+        db: Session,
+        user_id: int,
+        skip: int = 0,
+        limit: int = 10,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        search_term: Optional[str] = None,
+        version: Optional[int] = None
+    ) -> List[TimelineEntry]:
+        """Like ``get_entries``, but not counted in the hit rate (for prefetching)."""
+        return self._get(db, user_id, skip, limit, start_date, end_date, search_term, version, count=False)
+
+    def _get(self, db, user_id, skip, limit, start_date, end_date, search_term, version, count: bool) -> List[TimelineEntry]:
+        if version is None:
+            version = get_user_version(db, user_id)
+        key = (user_id, version, start_date, end_date, search_term, skip, limit)
+        with self._lock:
+            entries = self._pages.get(key)
+            if entries is not None:
+                self._pages.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return entries
+            if count:
+                self.misses += 1
+
+        # A search run before the fuzzy index has loaded lacks the typo-tolerant matches
+        # and must not be served after it loads; checked before the query to avoid a race
+        complete = not search_term or _fuzzy_index_loaded()
+        entries = get_timeline_entries(
+            db,
+            user_id,
+            skip=skip,
+            limit=limit,
+            start_date=start_date,
+            end_date=end_date,
+            search_term=search_term,
+            include_image_data=False
+        )
+        if complete:
+            with self._lock:
+                self._pages[key] = entries
+                self._pages.move_to_end(key)
+                while len(self._pages) > self.max_pages:
+                    self._pages.popitem(last=False)
+        return entries
+
+    def clear(self):
+        """Drop all cached pages."""
+        with self._lock:
+            self._pages.clear()
+
+
+timeline_cache = TimelineCache()
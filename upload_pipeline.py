@@ -0,0 +1,147 @@
+"""
+Memory-aware handling of uploaded photos.
+
+A naive upload path holds the upload, a base64 ``str`` copy (~33% larger), the
+JSON request body built around it and its UTF-8 encoding at the same time. The
+helpers here enforce an upload size limit, hash uploads in fixed-size chunks,
+base64-encode into a single preallocated buffer and splice that buffer into the
+request body without building intermediate strings.
+"""
+import binascii
+import hashlib
+import json
+import os
+from typing import BinaryIO, List, Union
+
+MAX_UPLOAD_BYTES = int(float(os.environ.get("PHOTOWORD_MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+HASH_CHUNK_SIZE = 1024 * 1024
+# Multiple of 3 so that every chunk encodes to whole base64 quanta without padding
+ENCODE_CHUNK_SIZE = 3 * 256 * 1024
+
+_PLACEHOLDER = "@@photoword-image@@"
+_PLACEHOLDER_BYTES = _PLACEHOLDER.encode("ascii")
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit."""
+
+    def __init__(self, size: int, limit: int = MAX_UPLOAD_BYTES):
+        super().__init__(f"Upload of {size} bytes exceeds the limit of {limit} bytes")
+        self.size = size
+        self.limit = limit
+
+
+def check_upload_size(size: int, limit: int = MAX_UPLOAD_BYTES):
+    """
+    Reject uploads larger than ``limit`` bytes before their data is touched.
+
+    Raises:
+        UploadTooLargeError: If the upload is too large
+    """
+    if size > limit:
+        raise UploadTooLargeError(size, limit)
+
+
+def hash_stream(fileobj: BinaryIO, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """
+    Compute the sha256 of a file-like object in fixed-size chunks.
+
+    The stream is read into one reusable buffer, so hashing needs
+    ``chunk_size`` bytes of extra memory regardless of the upload size. The
+    stream position is restored afterwards.
+
+    Args:
+        fileobj: Binary file-like object supporting ``readinto``
+        chunk_size: Size of the read buffer
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    position = fileobj.tell()
+    fileobj.seek(0)
+    try:
+        while True:
+            read = fileobj.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+    finally:
+        fileobj.seek(position)
+    return digest.hexdigest()
+
+
+def encode_base64_into(data: BytesLike) -> bytearray:
+    """
+    Base64-encode ``data`` into a single preallocated buffer.
+
+    Args:
+        data: Binary data
+
+    Returns:
+        bytearray: The base64 encoding (ASCII, no newlines)
+    """
+    source = memoryview(data).cast("B")
+    length = len(source)
+    output = bytearray(4 * ((length + 2) // 3))
+    target = memoryview(output)
+    written = 0
+    for start in range(0, length, ENCODE_CHUNK_SIZE):
+        encoded = binascii.b2a_base64(source[start:start + ENCODE_CHUNK_SIZE], newline=False)
+        target[written:written + len(encoded)] = encoded
+        written += len(encoded)
+    return output
+
+
+class Base64Image:
+    """Base64 image data that ``build_request_body`` splices into the JSON body."""
+    __slots__ = ("buffer",)
+
+    def __init__(self, image_data: BytesLike):
+        self.buffer = encode_base64_into(image_data)
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+
+def build_request_body(payload: dict) -> bytearray:
+    """
+    Serialize a request payload, splicing ``Base64Image`` values in as raw bytes.
+
+    Only the small JSON skeleton is built as a string; the image data is copied
+    once, from its base64 buffer into the final body buffer.
+
+    Args:
+        payload: JSON-serializable request payload that may contain Base64Image values
+
+    Returns:
+        bytearray: UTF-8 encoded JSON body
+    """
+    images: List[bytearray] = []
+
+    def splice(value):
+        if isinstance(value, Base64Image):
+            images.append(value.buffer)
+            return _PLACEHOLDER
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    skeleton = json.dumps(payload, default=splice).encode("utf-8")
+    parts = skeleton.split(_PLACEHOLDER_BYTES)
+    if len(parts) != len(images) + 1:
+        raise ValueError("Request payload contains the image placeholder text")
+
+    body = bytearray(sum(map(len, parts)) + sum(map(len, images)))
+    view = memoryview(body)
+    offset = 0
+    for index, part in enumerate(parts):
+        view[offset:offset + len(part)] = part
+        offset += len(part)
+        if index < len(images):
+            image = images[index]
+            view[offset:offset + len(image)] = image
+            offset += len(image)
+    return body
@@ -0,0 +1,174 @@
+"""
+Token and cost accounting for model calls, with per-user daily budgets.
+
+Every analysis that calls the model records its ``usage`` token counts in
+``model_usage`` and adds them to the per-user, per-day rollup in
+``model_usage_daily``. The budget check reads a single rollup row, so it is
+cheap enough to run on every upload and again right before the model call.
+
+Budgets are in USD per user per UTC day: ``users.daily_budget_usd`` when set,
+otherwise ``PHOTOWORD_DAILY_BUDGET_USD``; without either there is no limit.
+"""
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Optional
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import AnalysisResult
+from models_db import ModelUsage, ModelUsageDaily, User
+
+# Claude 3 Haiku on Bedrock, USD per 1,000 tokens
+INPUT_PRICE_PER_1K = float(os.environ.get("PHOTOWORD_INPUT_PRICE_PER_1K", "0.00025"))
+OUTPUT_PRICE_PER_1K = float(os.environ.get("PHOTOWORD_OUTPUT_PRICE_PER_1K", "0.00125"))
+
+
+class BudgetExceededError(Exception):
+    """Raised when a user has used up their daily model budget."""
+
+    def __init__(self, user_id: int, spent: float, budget: float):
+        super().__init__(f"Daily budget of ${budget:.4f} exceeded for user {user_id} (spent ${spent:.4f})")
+        self.user_id = user_id
+        self.spent = spent
+        self.budget = budget
+
+
+@dataclass(frozen=True)
+class UsageRollup:
+    """Model usage of one user on one day."""
+    user_id: int
+    day: str
+    model_calls: int
+    input_tokens: int
+    output_tokens: int
+    cost_usd: float
+
+
+def usage_day(timestamp: Optional[float] = None) -> str:
+    """UTC date used as the rollup and budget period."""
+    moment = datetime.fromtimestamp(time.time() if timestamp is None else timestamp, tz=timezone.utc)
+    return moment.strftime("%Y-%m-%d")
+
+
+def estimate_cost(input_tokens: int, output_tokens: int) -> float:
+    """Cost in USD of the given token counts."""
+    return input_tokens / 1000 * INPUT_PRICE_PER_1K + output_tokens / 1000 * OUTPUT_PRICE_PER_1K
+
+
+def default_daily_budget() -> Optional[float]:
+    value = os.environ.get("PHOTOWORD_DAILY_BUDGET_USD")
+    return float(value) if value else None
+
+
+def check_budget(db: Session, user_id: int, day: Optional[str] = None):
+    """
+    Make sure the user may still call the model today.
+
+    Args:
+        db: Database session
+        user_id: User about to trigger a model call
+        day: Budget period, defaults to today (UTC)
+
+    Raises:
+        BudgetExceededError: If the user's spending reached their daily budget
+    """
+    budget = db.query(User.daily_budget_usd).filter(User.id == user_id).scalar()
+    if budget is None:
+        budget = default_daily_budget()
+        if budget is None:
+            return
+    spent = db.query(ModelUsageDaily.cost_usd).filter(
+        ModelUsageDaily.user_id == user_id,
+        ModelUsageDaily.day == (day or usage_day())
+    ).scalar() or 0.0
+    if spent >= budget:
+        raise BudgetExceededError(user_id, spent, budget)
+
+
+def record_usage(db: Session, user_id: int, image_hash: str, model_id: str, result: AnalysisResult, now: Optional[float] = None) -> ModelUsage:
+    """
+    Record the token usage of one analysis and add it to the daily rollup.
+
+    Args:
+        db: Database session
+        user_id: User the model calls are billed to
+        image_hash: sha256 of the analyzed image, used to link the image later
+        model_id: Model that served the calls
+        result: Analysis result carrying the call and token counts
+        now: Timestamp of the analysis, defaults to the current time
+
+    Returns:
+        ModelUsage: The recorded usage row
+    """
+    now = time.time() if now is None else now
+    day = usage_day(now)
+    cost = estimate_cost(result.input_tokens, result.output_tokens)
+    usage = ModelUsage(
+        user_id=user_id,
+        image_hash=image_hash,
+        model_id=model_id,
+        model_calls=result.model_calls,
+        input_tokens=result.input_tokens,
+        output_tokens=result.output_tokens,
+        cost_usd=cost,
+        day=day,
+        created_at=now
+    )
+    increments = {
+        "model_calls": ModelUsageDaily.model_calls + result.model_calls,
+        "input_tokens": ModelUsageDaily.input_tokens + result.input_tokens,
+        "output_tokens": ModelUsageDaily.output_tokens + result.output_tokens,
+        "cost_usd": ModelUsageDaily.cost_usd + cost,
+    }
+    rollup = update(ModelUsageDaily).where(ModelUsageDaily.user_id == user_id, ModelUsageDaily.day == day).values(**increments)
+    for attempt in range(2):
+        if db.execute(rollup).rowcount == 0:
+            db.add(ModelUsageDaily(
+                user_id=user_id,
+                day=day,
+                model_calls=result.model_calls,
+                input_tokens=result.input_tokens,
+                output_tokens=result.output_tokens,
+                cost_usd=cost
+            ))
+        db.add(usage)
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            # Another worker created today's rollup row first; add to it instead
+            db.rollback()
+            if attempt:
+                raise
+    return usage
+
+
+def link_usage_to_image(db: Session, user_id: int, image_hash: str, image_id: int):
+    """Attach unlinked usage rows of an image to its saved ``Image`` (not committed)."""
+    db.execute(
+        update(ModelUsage)
+        .where(ModelUsage.user_id == user_id, ModelUsage.image_hash == image_hash, ModelUsage.image_id.is_(None))
+        .values(image_id=image_id)
+    )
+
+
+def get_usage_rollups(db: Session, user_id: Optional[int] = None, since: Optional[str] = None) -> List[UsageRollup]:
+    """
+    Return daily usage per user, newest day first.
+
+    Args:
+        db: Database session
+        user_id: Restrict to one user
+        since: Earliest day to include (YYYY-MM-DD)
+    """
+    query = db.query(ModelUsageDaily)
+    if user_id is not None:
+        query = query.filter(ModelUsageDaily.user_id == user_id)
+    if since is not None:
+        query = query.filter(ModelUsageDaily.day >= since)
+    return [
+        UsageRollup(row.user_id, row.day, row.model_calls, row.input_tokens, row.output_tokens, row.cost_usd)
+        for row in query.order_by(ModelUsageDaily.day.desc(), ModelUsageDaily.user_id).all()
+    ]
@@ -0,0 +1,117 @@
+"""
+Shared word-knowledge cache for the two-phase analysis.
+
+Most photos contain words that some user already has in their vocabulary. The
+translation, part of speech and example sentence of such words are reused from
+past ``VocabularyEntry`` rows instead of being generated by the model again.
+"""
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+from sqlalchemy.orm import Session
+from models import SpanishVocabulary
+from models_db import VocabularyEntry
+
+
+def normalize_lemma(word: str) -> str:
+    """
+    Normalize a Spanish word for lookup.
+
+    Case and surrounding whitespace are ignored, accents are kept because they
+    distinguish words (e.g. "año" and "ano").
+    """
+    return " ".join(unicodedata.normalize("NFC", word).lower().split())
+
+
+class WordKnowledgeCache:
+    """Bounded in-process LRU in front of the vocabulary table."""
+
+    def __init__(self, max_words: int = 50000):
+        self.max_words = max_words
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._words: "OrderedDict[str, SpanishVocabulary]" = OrderedDict()
+
+    def lookup(self, db: Session, lemmas: Iterable[str]) -> Dict[str, SpanishVocabulary]:
+        """
+        Return known details for the given lemmas.
+
+        Args:
+            db: Database session used for lemmas not in memory yet
+            lemmas: Spanish lemmas to look up
+
+        Returns:
+            dict: Normalized lemma -> known vocabulary details; unknown lemmas are absent
+        """
+        wanted = {normalize_lemma(lemma) for lemma in lemmas if lemma.strip()}
+        found: Dict[str, SpanishVocabulary] = {}
+        with self._lock:
+            for lemma in wanted:
+                vocab = self._words.get(lemma)
+                if vocab is not None:
+                    self._words.move_to_end(lemma)
+                    found[lemma] = vocab
+        missing = wanted - found.keys()
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(missing)
+        if not missing:
+            return found
+
+        # Newest entry first, so the most recent wording of a word wins
+        rows = (
+            db.query(VocabularyEntry)
+            .filter(VocabularyEntry.lemma_key.in_(missing))
+            .order_by(VocabularyEntry.id.desc())
+            .all()
+        )
+        loaded: Dict[str, SpanishVocabulary] = {}
+        for row in rows:
+            lemma = normalize_lemma(row.spanish_word)
+            if lemma in missing and lemma not in loaded:
+                loaded[lemma] = SpanishVocabulary(
+                    word=row.spanish_word,
+                    part_of_speech=row.part_of_speech,
+                    translation=row.japanese_translation,
+                    example_sentence=row.example_sentence
+                )
+        self.remember(loaded.values())
+        found.update(loaded)
+        return found
+
+    def remember(self, vocab_items: Iterable[SpanishVocabulary]):
+        """Add freshly saved vocabulary to the cache."""
+        with self._lock:
+            for vocab in vocab_items:
+                lemma = normalize_lemma(vocab.word)
+                self._words[lemma] = vocab
+                self._words.move_to_end(lemma)
+            while len(self._words) > self.max_words:
+                self._words.popitem(last=False)
+
+    def partition(self, db: Session, lemmas: List[str]):
+        """
+        Split lemmas into known vocabulary and lemmas that still need details.
+
+        Args:
+            db: Database session
+            lemmas: Lemmas listed by the first analysis phase
+
+        Returns:
+            (known, unknown): Known vocabulary in lemma order, and unknown lemmas
+        """
+        found = self.lookup(db, lemmas)
+        known: List[SpanishVocabulary] = []
+        unknown: List[str] = []
+        for lemma in lemmas:
+            vocab = found.get(normalize_lemma(lemma))
+            if vocab is not None:
+                known.append(vocab)
+            else:
+                unknown.append(lemma)
+        return known, unknown
+
+
+word_knowledge = WordKnowledgeCache()